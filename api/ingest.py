@@ -0,0 +1,315 @@
+# Standard library imports
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+# Third-party imports
+from django.db import transaction
+from django.db.models import OuterRef, QuerySet, Subquery
+from django.utils import timezone
+from pydantic import ValidationError
+
+# Local application imports
+from flights import metrics, scheduling, status_cache
+from flights.inflight import IN_FLIGHT_STATUSES, fail_unpublished, in_flight_cutoff
+from flights.legs import replace_legs
+from flights.models import Flight, EnrichmentTask, FlightLeg
+from flights.refresh import max_price_age
+from flights.tasks import enqueue_enrichments
+from api.validation_models import FlightData
+from api.utils import make_aware
+
+# Columns rewritten when an incoming flight collides with an existing flight_id
+FLIGHT_UPDATE_FIELDS = [
+    "travel_class",
+    "origin",
+    "destination",
+    "departure_time",
+    "arrival_time",
+    "flight_numbers",
+    "last_seen",
+    "fingerprint",
+    "enriched",
+    "enriched_at",
+    "retail_price",
+]
+
+# Columns that define an itinerary, with the legs: a re-post that only moves last_seen is unchanged
+FINGERPRINT_FIELDS = ("travel_class", "origin", "destination", "departure_time", "arrival_time", "flight_numbers")
+
+LEG_TIMES = {"departure_time", "arrival_time"}
+
+
+def canonical_leg(leg: Any) -> Dict[str, Any]:
+    """A leg as the fingerprint hashes it: its fields, with times in ``isoformat()`` as given."""
+    return {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in leg.model_dump().items()}
+
+
+def itinerary_fingerprint(values: Dict[str, Any], flight_data: FlightData) -> str:
+    """Hash of the itinerary-defining column values and legs, with flight datetimes compared in UTC."""
+    canonical = json.dumps(
+        [*(values[field] for field in FINGERPRINT_FIELDS), [canonical_leg(leg) for leg in flight_data.legs]],
+        sort_keys=True,
+        separators=(",", ":"),
+        default=lambda value: value.astimezone(dt_timezone.utc).isoformat(),
+    )
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+def flight_defaults(flight_data: FlightData) -> Dict[str, Any]:
+    """Map a validated payload onto Flight column values; the legs are ``leg_rows``."""
+    values = {
+        "travel_class": flight_data.travel_class,
+        "origin": flight_data.origin,
+        "destination": flight_data.destination,
+        "departure_time": make_aware(flight_data.departure_time),
+        "arrival_time": make_aware(flight_data.arrival_time),
+        "flight_numbers": flight_data.flight_numbers,
+        "last_seen": make_aware(flight_data.last_seen),
+        "enriched": False,
+        "enriched_at": None,
+        "retail_price": None,
+    }
+    values["fingerprint"] = itinerary_fingerprint(values, flight_data)
+    return values
+
+
+def leg_rows(flight_data: FlightData) -> List[FlightLeg]:
+    """Unsaved FlightLeg rows for a payload's legs, in order; ``replace_legs`` sets the flight."""
+    return [
+        FlightLeg(
+            position=position,
+            departure_time=make_aware(leg.departure_time),
+            arrival_time=make_aware(leg.arrival_time),
+            **leg.model_dump(exclude=LEG_TIMES),
+        )
+        for position, leg in enumerate(flight_data.legs)
+    ]
+
+
+def save_flight(flight_data: FlightData, defaults: Dict[str, Any]) -> Flight:
+    """Insert or rewrite one flight and its legs, together."""
+    with transaction.atomic():
+        flight, _ = Flight.objects.update_or_create(flight_id=flight_data.id, defaults=defaults)
+        replace_legs({flight.pk: leg_rows(flight_data)})
+    return flight
+
+
+def existing_flights(flight_ids: Iterable[str]) -> QuerySet:
+    """Stored flights by id with what a re-post is checked against, including their newest task."""
+    newest = EnrichmentTask.objects.filter(flight=OuterRef("pk")).order_by("-pk")
+    return (
+        Flight.objects.filter(flight_id__in=list(flight_ids))
+        .only("pk", "flight_id", "fingerprint", "departure_time", "enriched", "enriched_at", "retail_price")
+        .annotate(
+            newest_task_id=Subquery(newest.values("task_id")[:1]),
+            newest_task_status=Subquery(newest.values("status")[:1]),
+            newest_task_created_at=Subquery(newest.values("created_at")[:1]),
+        )
+    )
+
+
+def task_idempotency_key(flight_data: FlightData, fingerprint: str, header: Optional[str]) -> Optional[str]:
+    """
+    Key shared by duplicate POSTs of one flight: the ``Idempotency-Key``
+    header, or else the flight id and fingerprint. A forced re-post without
+    a header gets no key, so it is never folded into the task in flight.
+    """
+    if header:
+        return header
+    if flight_data.force:
+        return None
+    return request_fingerprint(flight_data, fingerprint)
+
+
+def request_fingerprint(flight_data: FlightData, fingerprint: str) -> str:
+    """What an idempotency key stands for: the flight id and its itinerary fingerprint."""
+    return f"{flight_data.id}:{fingerprint}"
+
+
+def reuse_result(
+    current: Optional[Flight], flight_data: FlightData, fingerprint: str, now: datetime
+) -> Optional[Dict[str, Any]]:
+    """
+    The result to answer a re-post with instead of enriching again, or None.
+
+    A flight whose itinerary is unchanged is answered with its task in
+    flight (unless it is older than ``FLIGHTS_INFLIGHT_TIMEOUT``), or with
+    its price while that is younger than ``max_age`` (by default the
+    ``FLIGHTS_REFRESH_AFTER`` policy). ``force`` always enriches. A task
+    whose message could not be published is failed by ``fail_unpublished``
+    and so never answers a re-post.
+    """
+    if current is None or current.fingerprint != fingerprint or flight_data.force:
+        return None
+    if current.newest_task_status in IN_FLIGHT_STATUSES and current.newest_task_created_at >= in_flight_cutoff(now):
+        return {"task_id": current.newest_task_id, "status": current.newest_task_status, "unchanged": True}
+    max_age = flight_data.max_age if flight_data.max_age is not None else max_price_age(current.departure_time, now)
+    if current.enriched and current.enriched_at and now - current.enriched_at <= timedelta(seconds=max_age):
+        return {
+            "task_id": current.newest_task_id,
+            "status": "SUCCESS",
+            "retail_price": float(current.retail_price) if current.retail_price is not None else None,
+            "unchanged": True,
+        }
+    return None
+
+
+def validate_record(raw: Any) -> Tuple[Optional[FlightData], Optional[List[Dict[str, Any]]]]:
+    """Validate one raw record, returning either the model or its errors."""
+    try:
+        if isinstance(raw, (str, bytes)):
+            return FlightData.model_validate_json(raw), None
+        return FlightData.model_validate(raw), None
+    except ValidationError as e:
+        return None, e.errors(include_url=False, include_context=False, include_input=False)
+
+
+def enrichment_priority(flight_data: FlightData) -> Tuple[str, Optional[float]]:
+    """Priority class and deadline timestamp for enriching one payload."""
+    deadline = make_aware(flight_data.deadline) if flight_data.deadline else None
+    priority = scheduling.priority_class(
+        make_aware(flight_data.departure_time),
+        make_aware(flight_data.last_seen),
+        deadline,
+    )
+    return priority, deadline.timestamp() if deadline else None
+
+
+def ingest_flights(flights: List[FlightData]) -> List[Dict[str, Any]]:
+    """
+    Upsert a batch of flights and enqueue one enrichment task per item.
+
+    Changed and new flights are written with a single upsert keyed on
+    ``flight_id``, their legs with one delete and one insert, and all
+    EnrichmentTask rows with a single insert. Flights re-posted with an
+    unchanged itinerary only get ``last_seen`` moved and keep their price
+    and legs; they are answered from ``reuse_result`` when it has one and
+    re-enriched otherwise. When the same flight appears more than
+    once the last payload wins, but every item still gets a result.
+
+    Returns:
+        ``task_id``/``status`` results in the same order as ``flights``
+    """
+    if not flights:
+        return []
+
+    now = timezone.now()
+    rows, payloads = {}, {}
+    for flight_data in flights:
+        rows[flight_data.id] = Flight(flight_id=flight_data.id, **flight_defaults(flight_data))
+        payloads[flight_data.id] = flight_data
+    existing = {flight.flight_id: flight for flight in existing_flights(rows)}
+
+    changed, touched, reused = [], [], {}
+    for flight_id, row in rows.items():
+        current = existing.get(flight_id)
+        if current is None or current.fingerprint != row.fingerprint:
+            changed.append(row)
+            continue
+        current.last_seen = row.last_seen
+        touched.append(current)
+        result = reuse_result(current, payloads[flight_id], row.fingerprint, now)
+        if result is not None:
+            reused[flight_id] = result
+
+    with transaction.atomic():
+        saved = Flight.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=["flight_id"],
+            update_fields=FLIGHT_UPDATE_FIELDS,
+        )
+        pks = {flight.flight_id: flight.pk for flight in saved if flight.pk is not None}
+        pks.update((flight.flight_id, flight.pk) for flight in touched)
+        missing = [flight_id for flight_id in rows if flight_id not in pks]
+        if missing:
+            # Backends that cannot return ids from an upsert need one extra lookup
+            pks.update(Flight.objects.filter(flight_id__in=missing).values_list("flight_id", "pk"))
+        # Unchanged flights keep their price and legs; only last_seen moves
+        Flight.objects.bulk_update(touched, ["last_seen"])
+        replace_legs({pks[row.flight_id]: leg_rows(payloads[row.flight_id]) for row in changed})
+
+        enqueued = [flight_data for flight_data in flights if flight_data.id not in reused]
+        tasks = [
+            EnrichmentTask(task_id=str(uuid4()), flight_id=pks[flight_data.id], status="PENDING")
+            for flight_data in enqueued
+        ]
+        EnrichmentTask.objects.bulk_create(tasks)
+
+    task_ids = [task.task_id for task in tasks]
+    status_cache.set_statuses(task_ids, "PENDING")
+    try:
+        enqueue_enrichments([
+            (flight_data.id, task.task_id, *enrichment_priority(flight_data))
+            for flight_data, task in zip(enqueued, tasks)
+        ])
+    except Exception as e:
+        # Otherwise re-posts would be answered with tasks that never run
+        fail_unpublished(task_ids, e)
+        raise
+    if len(enqueued) < len(flights):
+        metrics.incr("ingest_skipped_unchanged", len(flights) - len(enqueued))
+
+    new_tasks = iter(tasks)
+    return [
+        reused[flight_data.id] if flight_data.id in reused else {"task_id": next(new_tasks).task_id, "status": "PENDING"}
+        for flight_data in flights
+    ]
+
+
+def ingest_records(records: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Validate and ingest raw records, reporting a result for every input.
+
+    Invalid records are reported with their validation errors and do not
+    prevent the valid ones from being stored and enqueued.
+    """
+    results: List[Dict[str, Any]] = []
+    valid: List[FlightData] = []
+    positions: List[int] = []
+    for index, raw in enumerate(records):
+        flight_data, errors = validate_record(raw)
+        if errors is not None:
+            results.append({"index": index, "status": "INVALID", "errors": errors})
+            continue
+        results.append({"index": index, "flight_id": flight_data.id})
+        valid.append(flight_data)
+        positions.append(index)
+
+    for position, result in zip(positions, ingest_flights(valid)):
+        results[position].update(result)
+    return results
+
+
+def ingest_chunk(chunk: List[Tuple[int, Any]]) -> List[Dict[str, Any]]:
+    """Ingest a chunk of (line number, raw line) pairs, reporting results by line."""
+    results = ingest_records([raw for _, raw in chunk])
+    return [
+        {"line": lineno, **{k: v for k, v in result.items() if k != "index"}}
+        for (lineno, _), result in zip(chunk, results)
+    ]
+
+
+def ingest_lines(lines: Iterable[Any], chunk_size: int) -> Iterator[Dict[str, Any]]:
+    """
+    Validate newline-delimited FlightData records and ingest them in chunks.
+
+    Only ``chunk_size`` lines are held in memory at a time, so the input can
+    be arbitrarily large. Blank lines are skipped but still counted.
+
+    Yields:
+        One result per non-blank line, in input order
+    """
+    chunk: List[Tuple[int, Any]] = []
+    for lineno, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        chunk.append((lineno, line))
+        if len(chunk) >= chunk_size:
+            yield from ingest_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield from ingest_chunk(chunk)
@@ -0,0 +1,205 @@
+"""
+Load-test harness comparing ``def`` and ``async def`` API handlers.
+
+Both variants do the same work through the same functions as api/main.py:
+``record_enrichment``, then ``publish_enrichment``; the status read goes
+through the status cache. Only the dispatch differs: on the threadpool, or
+on the event loop with each blocking step sent to the threadpool. Both run
+in-process against a scratch SQLite database, each after a warm-up pass,
+and the harness reports requests per second and latency percentiles per
+endpoint:
+
+    python -m api.loadtest --requests 2000 --concurrency 100 --broker-latency-ms 5
+
+With ``--url`` it drives an already running server instead (start it once on
+each revision to compare). Broker publishing is simulated with
+``--broker-latency-ms`` so the harness does not need Redis; pass ``-1`` to
+publish for real.
+"""
+
+# Standard library imports
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from unittest.mock import patch
+from uuid import uuid4
+
+# Third-party imports
+import httpx
+from anyio import to_thread
+from django.conf import settings
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+# Local application imports
+from api.main import publish_enrichment, record_enrichment
+from api.validation_models import FlightData
+from django.core.management import call_command
+from django.db import connections
+from flights import status_cache
+from flights.tasks import enrich_flight_task
+
+SAMPLE_FLIGHT = {
+    "travel_class": "Business",
+    "origin": "JFK",
+    "destination": "ATH",
+    "departure_time": "2025-06-13T12:55:00",
+    "arrival_time": "2025-06-14T12:10:00",
+    "flight_numbers": ["MS986", "MS747"],
+    "legs": [],
+    "last_seen": "2025-05-29T03:38:05Z",
+}
+
+
+def build_sync_app() -> FastAPI:
+    """The handlers as plain ``def`` endpoints, run on the threadpool."""
+    sync_app = FastAPI()
+
+    @sync_app.post("/enrich-flight")
+    def enrich_flight(flight_data: FlightData, idempotency_key: Optional[str] = Header(None, max_length=255)):
+        response, publish = record_enrichment(flight_data, idempotency_key)
+        if publish:
+            publish_enrichment(flight_data, response["task_id"])
+        return response
+
+    @sync_app.get("/task-status/{task_id}")
+    def get_task_status(task_id: str):
+        status = status_cache.load_status(task_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return status
+
+    return sync_app
+
+
+def build_async_app() -> FastAPI:
+    """The handlers as ``async def`` endpoints, each blocking step one threadpool call."""
+    async_app = FastAPI()
+
+    @async_app.post("/enrich-flight")
+    async def enrich_flight(flight_data: FlightData, idempotency_key: Optional[str] = Header(None, max_length=255)):
+        response, publish = await run_in_threadpool(record_enrichment, flight_data, idempotency_key)
+        if publish:
+            await run_in_threadpool(publish_enrichment, flight_data, response["task_id"])
+        return response
+
+    @async_app.get("/task-status/{task_id}")
+    async def get_task_status(task_id: str):
+        status = await run_in_threadpool(status_cache.load_status, task_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return status
+
+    return async_app
+
+
+def use_scratch_database() -> str:
+    """Point the default connection at a fresh SQLite file so dev data is untouched."""
+    path = os.path.join(tempfile.mkdtemp(), "loadtest.sqlite3")
+    connections["default"].close()
+    connections.settings["default"]["NAME"] = path
+    # Writers queue on the write lock up front instead of failing with
+    # "database is locked" when update_or_create upgrades a read transaction
+    connections.settings["default"]["OPTIONS"] = {"timeout": 60, "transaction_mode": "IMMEDIATE"}
+    call_command("migrate", verbosity=0)
+    with connections["default"].cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    connections["default"].close()
+    return path
+
+
+def fake_publisher(latency: float):
+    """Stand-in for apply_async that blocks like a broker round trip."""
+    def apply_async(args=None, task_id=None, **options):
+        time.sleep(latency)
+        return SimpleNamespace(id=task_id)
+    return apply_async
+
+
+async def run_endpoint(client: httpx.AsyncClient, requests: int, concurrency: int, make_request) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            response = await make_request(client, i)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ordered = sorted(latencies)
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": ordered[len(ordered) // 2],
+        "p99": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        "errors": errors,
+    }
+
+
+async def run_suite(client: httpx.AsyncClient, requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    task_ids: List[str] = []
+
+    async def post_flight(client, i):
+        response = await client.post("/enrich-flight", json={**SAMPLE_FLIGHT, "id": f"load-{uuid4().hex}"})
+        if response.status_code == 200:
+            task_ids.append(response.json()["task_id"])
+        return response
+
+    async def get_status(client, i):
+        return await client.get(f"/task-status/{task_ids[i % len(task_ids)]}")
+
+    results = {"POST /enrich-flight": await run_endpoint(client, requests, concurrency, post_flight)}
+    if task_ids:
+        results["GET /task-status"] = await run_endpoint(client, requests, concurrency, get_status)
+    return results
+
+
+def report(name: str, results: Dict[str, Dict[str, float]]) -> None:
+    print(f"\n{name}")
+    print(f"{'endpoint':<22} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for endpoint, stats in results.items():
+        print(f"{endpoint:<22} {stats['rps']:>9.1f} {stats['p50']:>9.2f} {stats['p99']:>9.2f} {stats['errors']:>7}")
+
+
+async def main(options) -> None:
+    if options.url:
+        async with httpx.AsyncClient(base_url=options.url, timeout=60) as client:
+            report(options.url, await run_suite(client, options.requests, options.concurrency))
+        return
+
+    # ASGITransport does not run the app's lifespan, which sizes the pool
+    to_thread.current_default_thread_limiter().total_tokens = settings.API_THREADPOOL_SIZE
+    for name, app in (("def handlers", build_sync_app()), ("async handlers", build_async_app())):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+            # Whichever variant ran first would otherwise also pay for warming up
+            await run_suite(client, options.concurrency * 2, options.concurrency)
+            report(name, await run_suite(client, options.requests, options.concurrency))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent clients")
+    parser.add_argument("--broker-latency-ms", type=float, default=5.0,
+                        help="Simulated publish latency; -1 publishes to the real broker")
+    parser.add_argument("--url", help="Benchmark a running server instead of in-process apps")
+    options = parser.parse_args()
+    if not options.url:
+        use_scratch_database()
+
+    if options.broker_latency_ms >= 0 and not options.url:
+        with patch.object(enrich_flight_task, "apply_async", fake_publisher(options.broker_latency_ms / 1000)):
+            asyncio.run(main(options))
+    else:
+        asyncio.run(main(options))
@@ -1,13 +1,21 @@
 # Standard library imports
+import json
 import os
 import sys
-from datetime import datetime
-from typing import List
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
 from uuid import uuid4
 
 # Third-party imports
 import django
-from fastapi import FastAPI, HTTPException
+from anyio import to_thread
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from fastapi import Body, FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -26,62 +34,342 @@ import django
 django.setup()
 
 # Local application imports
+from flights import legs, metrics, prices, scheduling, status_cache
+from flights.inflight import expire_stale, fail_unpublished, in_flight_tasks
 from flights.models import Flight, EnrichmentTask
 from flights.tasks import enrich_flight_task
-from api.validation_models import FlightData
-from api.utils import make_aware
+from api.validation_models import FlightData, TaskStatusBatch
+from api.ingest import (
+    enrichment_priority, existing_flights, flight_defaults, ingest_chunk, ingest_records,
+    request_fingerprint, reuse_result, save_flight, task_idempotency_key,
+)
+from api.notifications import hub
+from api.utils import DuplexStreamingResponse, aiter_lines, make_aware
 
-app = FastAPI()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sync endpoints and blocking calls share this pool; size it for the deployment
+    to_thread.current_default_thread_limiter().total_tokens = settings.API_THREADPOOL_SIZE
+    hub.start()
+    yield
+    await hub.stop()
 
 
-@app.post("/enrich-flight")
-def enrich_flight(flight_data: FlightData):
-    # Save or update Flight record in DB
-    flight, _ = Flight.objects.update_or_create(
-        flight_id=flight_data.id,
-        defaults={
-            "travel_class": flight_data.travel_class,
-            "origin": flight_data.origin,
-            "destination": flight_data.destination,
-            "departure_time": make_aware(flight_data.departure_time),
-            "arrival_time": flight_data.arrival_time,
-            "flight_numbers": flight_data.flight_numbers,
-            "legs": [
-                {
-                    **{k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in leg.model_dump().items()}
-                }
-                for leg in flight_data.legs
-                    ],
-            "last_seen": flight_data.last_seen,
-            "enriched": False,
-            "retail_price": None,
-        }
-    )
+app = FastAPI(lifespan=lifespan)
+
+
+
+def key_holder(key: str) -> Optional[EnrichmentTask]:
+    """The in-flight task holding ``key``, if any."""
+    return in_flight_tasks().filter(idempotency_key=key).only("task_id", "status", "request_fingerprint").first()
+
+
+def duplicate_result(task: EnrichmentTask) -> Dict[str, Any]:
+    """The answer to a request whose idempotency key ``task`` already holds."""
+    metrics.incr("ingest_deduplicated")
+    return {"task_id": task.task_id, "status": task.status, "duplicate": True}
+
+
+def check_same_request(task: EnrichmentTask, request: Optional[str]) -> None:
+    """
+    Reject an idempotency key reused for another flight or itinerary, rather
+    than answer with that request's task. Tasks claimed before the request
+    fingerprint was stored are not checked.
+    """
+    if request and task.request_fingerprint and task.request_fingerprint != request:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency key was already used for a different flight or itinerary",
+        )
+
+
+def claim_task(
+    task_id: str, flight: Flight, key: Optional[str], request: Optional[str] = None
+) -> Optional[EnrichmentTask]:
+    """
+    Insert a PENDING task holding ``key``, or return the in-flight task that
+    already holds it for the same ``request``. The partial unique constraint
+    on in-flight keys makes this atomic across API processes.
+    """
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                EnrichmentTask.objects.create(
+                    task_id=task_id, flight=flight, status='PENDING', idempotency_key=key, request_fingerprint=request,
+                )
+            return None
+        except IntegrityError:
+            existing = key_holder(key)
+            if existing is not None:
+                check_same_request(existing, request)
+                return existing
+            # The holder finished between the insert and the read, or is a lost
+            # task past the in-flight timeout; release it and claim the key again
+            expire_stale(idempotency_key=key)
+    raise HTTPException(status_code=409, detail="Idempotency key is contended, retry")
+
+
+def record_enrichment(flight_data: FlightData, idempotency_key: Optional[str]) -> Tuple[Dict[str, Any], bool]:
+    """
+    All of one ``POST /enrich-flight``'s database work: the fingerprint
+    check, the flight write and the task claim.
 
-    # Create a new EnrichmentTask record with a unique task_id
+    Returns:
+        The response, and whether it is a new task still to be published
+    """
+    defaults = flight_defaults(flight_data)
     task_id = str(uuid4())
-    EnrichmentTask.objects.create(
-        task_id=task_id,
-        flight=flight,
-        status='PENDING',
-    )
+    key = task_idempotency_key(flight_data, defaults["fingerprint"], idempotency_key)
+    request = request_fingerprint(flight_data, defaults["fingerprint"])
+    if idempotency_key:
+        # A client's key is checked before anything is written, so a key
+        # reused for another flight cannot overwrite this one
+        holder = key_holder(key)
+        if holder is not None:
+            check_same_request(holder, request)
+            return duplicate_result(holder), False
 
-    # Enqueue Celery task asynchronously with the task_id
-    celery_result = enrich_flight_task.apply_async(args=[flight.flight_id], task_id=task_id)
+    flight = existing_flights([flight_data.id]).first()
+    unchanged = flight is not None and flight.fingerprint == defaults["fingerprint"]
+    if unchanged:
+        # Same itinerary re-posted: move last_seen, keep the price
+        Flight.objects.filter(pk=flight.pk).update(last_seen=defaults["last_seen"])
+        result = reuse_result(flight, flight_data, defaults["fingerprint"], timezone.now())
+        if result is not None:
+            metrics.incr("ingest_skipped_unchanged")
+            return result, False
 
-    return {"task_id": celery_result.id, "status": "PENDING"}
+    # The flight write and the claim share one short transaction, so the
+    # SQLite write lock is taken and committed once per request, and a claim
+    # rejected by check_same_request rolls the flight write back
+    with transaction.atomic():
+        if not unchanged:
+            # Save or update the Flight record and its legs in DB
+            flight = save_flight(flight_data, defaults)
+        # Create a new EnrichmentTask record with a unique task_id, unless a
+        # duplicate of this request already has one in flight
+        existing = claim_task(task_id, flight, key, request)
+    if existing is not None:
+        return duplicate_result(existing), False
+    status_cache.set_status(task_id, 'PENDING')
+    return {"task_id": task_id, "status": "PENDING"}, True
 
 
-@app.get("/task-status/{task_id}")
-def get_task_status(task_id: str):
+def publish_enrichment(flight_data: FlightData, task_id: str) -> None:
+    """Publish the Celery job for a claimed task, failing the task if the broker cannot take it."""
     try:
-        task = EnrichmentTask.objects.get(task_id=task_id)
-        return {
-            "task_id": task.task_id,
-            "status": task.status,
-            "result": task.result,
-        }
-    except EnrichmentTask.DoesNotExist:
+        enrich_flight_task.apply_async(
+            args=[flight_data.id],
+            task_id=task_id,
+            **scheduling.publish_options(*enrichment_priority(flight_data)),
+        )
+    except Exception as e:
+        # Otherwise retries would be answered with a task that never runs
+        fail_unpublished([task_id], e)
+        raise
+
+
+@app.post("/enrich-flight")
+def enrich_flight(
+    flight_data: FlightData,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+):
+    # A plain def endpoint: every step blocks, so it runs on the threadpool
+    # (``API_THREADPOOL_SIZE``); api/loadtest.py measured no gain from async
+    response, publish = record_enrichment(flight_data, idempotency_key)
+    if publish:
+        publish_enrichment(flight_data, response["task_id"])
+    return response
+
+
+@app.post("/enrich-flights")
+def enrich_flights(records: List[Dict[str, Any]] = Body(...)):
+    if len(records) > settings.FLIGHTS_INGEST_MAX_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.FLIGHTS_INGEST_MAX_BATCH} flights",
+        )
+    # Each record is validated on its own so one bad item does not reject the batch
+    return {"results": ingest_records(records)}
+
+
+@app.post("/enrich-flights/stream")
+async def enrich_flights_stream(request: Request):
+    chunk_size = settings.FLIGHTS_INGEST_CHUNK_SIZE
+
+    async def results():
+        # Read, validate and flush one chunk at a time so memory stays flat
+        chunk = []
+        async for lineno, line in aiter_lines(request.stream()):
+            if not line.strip():
+                continue
+            chunk.append((lineno, line))
+            if len(chunk) >= chunk_size:
+                for result in await run_in_threadpool(ingest_chunk, chunk):
+                    yield json.dumps(result) + "\n"
+                chunk = []
+        if chunk:
+            for result in await run_in_threadpool(ingest_chunk, chunk):
+                yield json.dumps(result) + "\n"
+
+    return DuplexStreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@app.get("/task-status/{task_id}")
+async def get_task_status(task_id: str, wait: float = Query(0, ge=0)):
+    # Async only for the long-poll, which must not hold a threadpool worker while it waits
+    if wait:
+        # Long-poll: hold the request until the task finishes or the wait runs out
+        status = None
+        async for entry in hub.watch([task_id], timeout=min(wait, settings.FLIGHTS_STATUS_MAX_WAIT)):
+            if entry is not None:
+                status = entry
+    else:
+        # Served from the status cache; the database is only read on a miss
+        status = await run_in_threadpool(status_cache.load_status, task_id)
+    if status is None:
         raise HTTPException(status_code=404, detail="Task not found")
+    return status
+
+
+def status_columns(batch: TaskStatusBatch, task_ids: List[str]) -> Dict[str, List[Any]]:
+    """Resolve ``task_ids`` and lay the statuses out column by column."""
+    found = status_cache.load_statuses(task_ids)
+    columns = {"task_id": [], "status": [], "result": [], "missing": []}
+    for task_id in task_ids:
+        entry = found.get(task_id)
+        if entry is None:
+            columns["missing"].append(task_id)
+            continue
+        if batch.terminal_only and entry["status"] not in status_cache.TERMINAL_STATUSES:
+            continue
+        if batch.known.get(task_id) == entry["status"]:
+            continue
+        columns["task_id"].append(task_id)
+        columns["status"].append(entry["status"])
+        columns["result"].append(entry["result"])
+    return columns
+
+
+@app.post("/task-status/batch")
+async def get_task_statuses(batch: TaskStatusBatch):
+    task_ids = list(dict.fromkeys(batch.task_ids))
+    if len(task_ids) > settings.FLIGHTS_STATUS_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.FLIGHTS_STATUS_BATCH_MAX} task ids",
+        )
+    chunk_size = settings.FLIGHTS_STATUS_BATCH_CHUNK_SIZE
+    if len(task_ids) <= chunk_size:
+        return await run_in_threadpool(status_columns, batch, task_ids)
+
+    async def chunks():
+        # Large batches go out as one columnar object per chunk, so neither side
+        # holds the whole result and each chunk is a single query
+        for i in range(0, len(task_ids), chunk_size):
+            columns = await run_in_threadpool(status_columns, batch, task_ids[i:i + chunk_size])
+            yield json.dumps(columns) + "\n"
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
+@app.get("/task-events")
+async def task_events(task_id: List[str] = Query(...)):
+    task_ids = list(dict.fromkeys(task_id))
+    if len(task_ids) > settings.FLIGHTS_TASK_EVENTS_MAX_IDS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Cannot follow more than {settings.FLIGHTS_TASK_EVENTS_MAX_IDS} tasks",
+        )
+    found = await run_in_threadpool(status_cache.load_statuses, task_ids)
+    missing = [t for t in task_ids if t not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail={"message": "Task not found", "task_ids": missing})
+
+    async def events():
+        # One event per status change until every task has finished
+        async for entry in hub.watch(task_ids):
+            if entry is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: status\ndata: {json.dumps(entry)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/queues")
+def get_queues():
+    # Depth comes from the broker, wait times from counters shared by all workers
+    return scheduling.queue_stats()
+
+
+@app.get("/prices/{origin}/{destination}/daily")
+def get_daily_prices(origin: str, destination: str, days: int = Query(90, ge=1, le=3650), currency: str = "USD"):
+    if currency.upper() not in prices.CURRENCY_CODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported currency {currency}")
+    end = timezone.now()
+    rows = prices.min_price_per_day(origin, destination, end - timedelta(days=days), end, currency)
+    return {
+        "route": prices.route_key(origin, destination),
+        "currency": currency.upper(),
+        "day": [day.isoformat() for day, _ in rows],
+        "min_price": [cents / 100 for _, cents in rows],
+    }
+
+
+def leg_query_window(
+    departure_after: Optional[datetime], departure_before: Optional[datetime], limit: Optional[int]
+) -> Dict[str, Any]:
+    return {
+        "start": make_aware(departure_after) if departure_after else None,
+        "end": make_aware(departure_before) if departure_before else None,
+        "limit": min(limit or settings.FLIGHTS_LEG_QUERY_LIMIT, settings.FLIGHTS_LEG_QUERY_MAX_LIMIT),
+    }
+
+
+def leg_columns(rows: List[Dict[str, Any]], names: Tuple[str, ...]) -> Dict[str, List[Any]]:
+    # One list per column, like the other bulk reads
+    return {name.rsplit("__", 1)[-1]: [row[name] for row in rows] for name in names}
+
+
+@app.get("/legs")
+def get_legs(
+    origin: Optional[str] = None,
+    destination: Optional[str] = None,
+    flight_number: Optional[str] = None,
+    aircraft_type: Optional[str] = None,
+    departure_after: Optional[datetime] = None,
+    departure_before: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1),
+):
+    try:
+        rows = legs.find_legs(
+            origin, destination, flight_number, aircraft_type,
+            **leg_query_window(departure_after, departure_before, limit),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return leg_columns(rows, legs.LEG_COLUMNS)
+
+
+@app.get("/airports/{code}/flights")
+def get_airport_flights(
+    code: str,
+    departure_after: Optional[datetime] = None,
+    departure_before: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1),
+):
+    rows = legs.flights_through(code, **leg_query_window(departure_after, departure_before, limit))
+    return {"airport": code.strip().upper(), **leg_columns(rows, legs.FLIGHT_HEADER_COLUMNS)}
+
 
+@app.get("/metrics")
+def get_metrics():
+    # Counters are aggregated across workers in Redis
+    return metrics.snapshot()
@@ -0,0 +1,197 @@
+# Standard library imports
+import asyncio
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set
+
+# Third-party imports
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from fastapi.concurrency import run_in_threadpool
+
+# Local application imports
+from flights import status_cache
+from flights.status_cache import STATUS_CHANNEL, TERMINAL_STATUSES
+
+
+def load_statuses(task_ids: Iterable[str]) -> List[Dict[str, Any]]:
+    """Current status of each existing task, from the status cache or the database."""
+    return list(status_cache.load_statuses(task_ids).values())
+
+
+class StatusHub:
+    """
+    Wakes clients waiting on task status changes in this API process.
+
+    A single Redis pub/sub subscription receives every transition published
+    by ``flights.status_cache`` and hands it to the queues of the clients
+    waiting on that task, so each waiter costs one queue and one suspended
+    coroutine rather than a connection or a polling loop.
+
+    In case a message was missed, the hub re-reads every watched task in one
+    batched query every ``FLIGHTS_NOTIFY_RECHECK_INTERVAL`` seconds, and right
+    after the subscription reconnects, and dispatches the results like
+    messages. Without a subscription it re-reads every
+    ``FLIGHTS_NOTIFY_POLL_INTERVAL`` seconds instead. Either way the database
+    sees one query per tick however many clients are waiting.
+    """
+
+    def __init__(self):
+        self._waiters: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._listener: Optional[asyncio.Task] = None
+        self._rechecker: Optional[asyncio.Task] = None
+        self._recheck_now: Optional[asyncio.Event] = None
+        self.connected = False
+
+    def start(self) -> None:
+        if settings.FLIGHTS_REDIS_URL and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        for task in (self._listener, self._rechecker):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._listener = self._rechecker = None
+
+    @property
+    def waiters(self) -> int:
+        return sum(len(queues) for queues in self._waiters.values())
+
+    def recheck_interval(self) -> float:
+        if self.connected:
+            return settings.FLIGHTS_NOTIFY_RECHECK_INTERVAL
+        return settings.FLIGHTS_NOTIFY_POLL_INTERVAL
+
+    @contextmanager
+    def subscribe(self, task_ids: Iterable[str]) -> Iterator[asyncio.Queue]:
+        """Register a queue that receives the status entries published for ``task_ids``."""
+        task_ids = list(task_ids)
+        queue: asyncio.Queue = asyncio.Queue()
+        for task_id in task_ids:
+            self._waiters[task_id].add(queue)
+        self._ensure_rechecker()
+        try:
+            yield queue
+        finally:
+            for task_id in task_ids:
+                queues = self._waiters.get(task_id)
+                if queues is not None:
+                    queues.discard(queue)
+                    if not queues:
+                        del self._waiters[task_id]
+            if not self._waiters:
+                # Let the rechecker see there is nobody left and stop
+                self._request_recheck()
+
+    def dispatch(self, entry: Dict[str, Any]) -> None:
+        for queue in self._waiters.get(entry["task_id"], ()):
+            queue.put_nowait(entry)
+
+    def _request_recheck(self) -> None:
+        if self._recheck_now is not None:
+            self._recheck_now.set()
+
+    def _ensure_rechecker(self) -> None:
+        # Started by the first waiter on each event loop, and ends with the last one
+        loop = asyncio.get_running_loop()
+        if self._rechecker is None or self._rechecker.done() or self._rechecker.get_loop() is not loop:
+            self._recheck_now = asyncio.Event()
+            self._rechecker = loop.create_task(self._recheck(self._recheck_now))
+
+    async def _recheck(self, recheck_now: asyncio.Event) -> None:
+        while self._waiters:
+            try:
+                await asyncio.wait_for(recheck_now.wait(), self.recheck_interval())
+            except asyncio.TimeoutError:
+                pass
+            recheck_now.clear()
+            task_ids = list(self._waiters)
+            if not task_ids:
+                return
+            # One read for every waiter in this process
+            for entry in await run_in_threadpool(load_statuses, task_ids):
+                self.dispatch(entry)
+            # None tells each waiter the recheck is over, so quiet streams can send a keep-alive
+            for queue in {queue for queues in self._waiters.values() for queue in queues}:
+                queue.put_nowait(None)
+
+    async def _listen(self) -> None:
+        while True:
+            client = aioredis.Redis.from_url(
+                settings.FLIGHTS_REDIS_URL,
+                socket_connect_timeout=settings.FLIGHTS_REDIS_TIMEOUT,
+                health_check_interval=settings.FLIGHTS_NOTIFY_RECHECK_INTERVAL,
+            )
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(STATUS_CHANNEL)
+                    self.connected = True
+                    # Transitions published while we were not subscribed were lost
+                    self._request_recheck()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.dispatch(json.loads(message["data"]))
+            except (redis.RedisError, OSError):
+                pass
+            finally:
+                self.connected = False
+                await client.aclose()
+            self._request_recheck()
+            await asyncio.sleep(settings.FLIGHTS_REDIS_RETRY_AFTER)
+
+    async def watch(self, task_ids: Iterable[str], timeout: Optional[float] = None) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield the current status of each task, then every change, until all
+        of them reach SUCCESS or FAILURE or ``timeout`` seconds have passed.
+
+        Tasks that do not exist are skipped. ``None`` is yielded whenever a
+        hub recheck found nothing new, so streams can send a keep-alive.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        pending = set(task_ids)
+        last: Dict[str, str] = {}
+
+        # Subscribe before the first read so no transition can slip in between
+        with self.subscribe(pending) as queue:
+            entries = await run_in_threadpool(load_statuses, pending)
+            pending.intersection_update(entry["task_id"] for entry in entries)
+            recheck = False
+            # Nothing yielded since the last recheck ended
+            quiet = True
+            while True:
+                for entry in entries:
+                    if entry["task_id"] not in pending or last.get(entry["task_id"]) == entry["status"]:
+                        continue
+                    last[entry["task_id"]] = entry["status"]
+                    if entry["status"] in TERMINAL_STATUSES:
+                        pending.discard(entry["task_id"])
+                    quiet = False
+                    yield entry
+                if not pending:
+                    return
+                if recheck:
+                    if quiet:
+                        yield None
+                    quiet = True
+
+                wait = None
+                if deadline is not None:
+                    wait = deadline - loop.time()
+                    if wait <= 0:
+                        return
+                try:
+                    entry = await asyncio.wait_for(queue.get(), wait)
+                except asyncio.TimeoutError:
+                    return
+                # Entries come from messages and hub rechecks alike; None ends a recheck
+                entries, recheck = ([entry], False) if entry is not None else ([], True)
+
+
+hub = StatusHub()
@@ -1,12 +1,43 @@
+# Standard library imports
+import asyncio
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import patch
+
 # Third-party imports
 import pytest
+from celery import group
+from django.db import connections
+from django.test import override_settings
 from fastapi.testclient import TestClient
 
 # Local application imports
-from api.main import app
+from api.main import app, claim_task
+from api.ingest import flight_defaults
+from api.notifications import StatusHub, load_statuses
+from api.loadtest import use_scratch_database
+from api.validation_models import FlightData
+from flights.models import Flight, EnrichmentTask, FlightLeg, PriceObservation
+from flights.tasks import finish_task
 
 client = TestClient(app)
 
+
+@pytest.fixture(scope="module", autouse=True)
+def scratch_database():
+    """Run every test against a freshly migrated temporary database, never the committed dev one."""
+    committed = dict(connections.settings["default"])
+    path = use_scratch_database()
+    yield
+    connections.close_all()
+    connections.settings["default"].update(committed)
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
 # Sample flight data matching your schema (use ISO datetimes)
 sample_flight = {
     "id": "20250613-MS-MS986-MS747",
@@ -55,3 +86,414 @@ def test_enrich_flight():
 def test_task_status_not_found():
     response = client.get("/task-status/invalid-task-id")
     assert response.status_code == 404
+
+def test_enrich_flights_batch_reports_invalid_items_in_order():
+    second = {**sample_flight, "id": "20250613-MS-MS986-MS747-B"}
+    invalid = {k: v for k, v in sample_flight.items() if k != "origin"}
+    # Unchanged re-posts of a flight with a task in flight are not enqueued again
+    Flight.objects.filter(flight_id__in=[sample_flight["id"], second["id"]]).delete()
+    with patch("api.ingest.enqueue_enrichments") as enqueue:
+        response = client.post("/enrich-flights", json=[sample_flight, invalid, second])
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert results[0]["status"] == "PENDING"
+    assert results[1]["status"] == "INVALID"
+    assert results[1]["errors"][0]["loc"] == ["origin"]
+    assert results[2]["status"] == "PENDING"
+
+    items = enqueue.call_args.args[0]
+    assert [item[:2] for item in items] == [
+        (sample_flight["id"], results[0]["task_id"]),
+        (second["id"], results[2]["task_id"]),
+    ]
+    assert EnrichmentTask.objects.get(task_id=results[2]["task_id"]).flight.flight_id == second["id"]
+
+def test_enrich_flights_batch_upserts_existing_flight():
+    updated = {**sample_flight, "travel_class": "Economy"}
+    with patch("api.ingest.enqueue_enrichments"):
+        client.post("/enrich-flights", json=[sample_flight])
+        response = client.post("/enrich-flights", json=[updated, updated])
+    task_ids = [r["task_id"] for r in response.json()["results"]]
+    assert len(set(task_ids)) == 2
+    flight = Flight.objects.get(flight_id=sample_flight["id"])
+    assert flight.travel_class == "Economy"
+    assert flight.enriched is False
+
+def test_unchanged_repost_reuses_result_instead_of_enriching():
+    flight = {**sample_flight, "id": "20250613-MS-MS986-MS747-U"}
+    Flight.objects.filter(flight_id=flight["id"]).delete()
+    with patch("api.ingest.enqueue_enrichments") as enqueue:
+        task_id = client.post("/enrich-flights", json=[flight]).json()["results"][0]["task_id"]
+        # Still in flight: the same task answers, only last_seen moves
+        seen_again = {**flight, "last_seen": "2025-05-30T03:38:05Z"}
+        result, = client.post("/enrich-flights", json=[seen_again]).json()["results"]
+        assert enqueue.call_args.args[0] == []
+    assert result == {"index": 0, "flight_id": flight["id"], "task_id": task_id, "status": "PENDING", "unchanged": True}
+    stored = Flight.objects.get(flight_id=flight["id"])
+    assert stored.last_seen == datetime(2025, 5, 30, 3, 38, 5, tzinfo=timezone.utc)
+
+    # Priced since: the price is the answer, from either endpoint
+    finish_task(task_id, "SUCCESS", {"retail_price": 512.0})
+    Flight.objects.filter(pk=stored.pk).update(enriched=True, enriched_at=datetime.now(timezone.utc), retail_price=512)
+    expected = {"task_id": task_id, "status": "SUCCESS", "retail_price": 512.0, "unchanged": True}
+    assert client.post("/enrich-flight", json=seen_again).json() == expected
+
+    # An expired freshness window or force enriches again, keeping the old price meanwhile
+    with patch("api.ingest.enqueue_enrichments") as enqueue:
+        results = client.post("/enrich-flights", json=[{**seen_again, "max_age": 0}, {**seen_again, "force": True}]).json()["results"]
+    assert [r["status"] for r in results] == ["PENDING", "PENDING"]
+    assert len(enqueue.call_args.args[0]) == 2
+    assert Flight.objects.get(pk=stored.pk).retail_price == 512
+
+    # A changed itinerary is a new flight as far as its price goes
+    with patch("api.ingest.enqueue_enrichments"):
+        result, = client.post("/enrich-flights", json=[{**seen_again, "travel_class": "Economy"}]).json()["results"]
+    assert "unchanged" not in result
+    assert Flight.objects.get(pk=stored.pk).retail_price is None
+
+def test_unchanged_repost_after_failed_publish_is_enriched_again():
+    flight = {**sample_flight, "id": "20250613-MS-MS986-MS747-U2"}
+    Flight.objects.filter(flight_id=flight["id"]).delete()
+    with patch("api.ingest.enqueue_enrichments", side_effect=ConnectionError("broker down")), \
+            pytest.raises(ConnectionError):
+        client.post("/enrich-flights", json=[flight])
+    lost = EnrichmentTask.objects.get(flight__flight_id=flight["id"])
+    assert lost.status == "FAILURE"
+
+    # Its PENDING row never reached the broker, so it is not the in-flight answer
+    with patch("api.ingest.enqueue_enrichments") as enqueue:
+        result, = client.post("/enrich-flights", json=[flight]).json()["results"]
+    assert len(enqueue.call_args.args[0]) == 1
+    assert result["status"] == "PENDING" and result["task_id"] != lost.task_id
+    assert "unchanged" not in result
+    with patch("api.main.enrich_flight_task.apply_async"):
+        assert client.post("/enrich-flight", json=flight).json()["task_id"] == result["task_id"]
+
+def test_legs_are_rows_replaced_only_when_the_itinerary_changes():
+    flight = {**sample_flight, "id": "20250613-MS-MS986-MS747-L"}
+    Flight.objects.filter(flight_id=flight["id"]).delete()
+    rows = lambda: list(
+        FlightLeg.objects.filter(flight__flight_id=flight["id"]).order_by("position")
+        .values_list("pk", "flight_number", "departure_time", "aircraft_type")
+    )
+    with patch("api.ingest.enqueue_enrichments"):
+        client.post("/enrich-flights", json=[flight])
+        stored = rows()
+        assert [leg[1] for leg in stored] == ["MS986", "MS747"]
+        assert stored[0][2] == datetime(2025, 6, 13, 12, 55, tzinfo=timezone.utc)
+
+        client.post("/enrich-flights", json=[{**flight, "last_seen": "2025-05-30T03:38:05Z"}])
+        assert rows() == stored
+
+    legs = [{**flight["legs"][0], "aircraft_type": "Boeing 787"}, flight["legs"][1]]
+    with patch("api.main.enrich_flight_task.apply_async", side_effect=lambda **kw: SimpleNamespace(id=kw["task_id"])):
+        client.post("/enrich-flight", json={**flight, "legs": legs})
+    assert [leg[3] for leg in rows()] == ["Boeing 787", "Boeing 737"]
+
+def test_fingerprint_of_aware_leg_times_is_unchanged():
+    aware_legs = [
+        {**leg, "departure_time": leg["departure_time"] + "Z", "arrival_time": leg["arrival_time"] + "Z"}
+        for leg in sample_flight["legs"]
+    ]
+    flight_data = FlightData(**{**sample_flight, "legs": aware_legs})
+    # The digest fingerprints stored before legs moved to FlightLeg rows had:
+    # leg times hash in isoformat() ("+00:00"), not JSON mode ("Z")
+    assert flight_defaults(flight_data)["fingerprint"] == "4f6292f7844200fff6c7923d4988742c"
+
+def test_leg_and_airport_queries():
+    legs = [{**leg, "flight_number": f"ZQ{n}"} for n, leg in zip((986, 747), sample_flight["legs"])]
+    flight = {**sample_flight, "id": "20250613-ZQ-ZQ986-ZQ747", "flight_numbers": ["ZQ986", "ZQ747"], "legs": legs}
+    Flight.objects.filter(flight_id=flight["id"]).delete()
+    with patch("api.ingest.enqueue_enrichments"):
+        client.post("/enrich-flights", json=[flight])
+
+    body = client.get("/legs", params={"flight_number": "zq747"}).json()
+    assert body["flight_id"] == [flight["id"]]
+    assert body["origin"] == ["CAI"] and body["position"] == [1]
+    assert body["departure_time"] == ["2025-06-14T10:10:00+00:00"]
+    window = {"departure_after": "2025-06-13T00:00:00", "departure_before": "2025-06-14T00:00:00"}
+    body = client.get("/legs", params={"origin": "jfk", "destination": "cai", "limit": 1000, **window}).json()
+    assert flight["id"] in body["flight_id"]
+    assert client.get("/legs", params=window).status_code == 400
+
+    # Both legs touch CAI; the flight is listed once, as a header row
+    body = client.get("/airports/cai/flights", params={"limit": 1000}).json()
+    assert body["airport"] == "CAI"
+    assert body["flight_id"].count(flight["id"]) == 1
+    assert "legs" not in body and "flight_number" not in body
+
+def test_idempotency_key_returns_task_in_flight():
+    flight = {**sample_flight, "id": "20250613-MS-MS986-MS747-K1"}
+    Flight.objects.filter(flight_id=flight["id"]).delete()
+    headers = {"Idempotency-Key": "feed-batch-7:item-3"}
+    with patch("api.main.enrich_flight_task.apply_async", side_effect=lambda **kw: SimpleNamespace(id=kw["task_id"])) as publish:
+        task_id = client.post("/enrich-flight", json=flight, headers=headers).json()["task_id"]
+        response = client.post("/enrich-flight", json={**flight, "last_seen": "2025-05-30T03:38:05Z"}, headers=headers)
+    assert publish.call_count == 1
+    assert response.json() == {"task_id": task_id, "status": "PENDING", "duplicate": True}
+    assert EnrichmentTask.objects.filter(idempotency_key=headers["Idempotency-Key"]).count() == 1
+
+def test_idempotency_key_reused_for_another_request_is_rejected():
+    first = {**sample_flight, "id": "20250613-MS-MS986-MS747-K6"}
+    other = {**sample_flight, "id": "20250613-MS-MS986-MS747-K7"}
+    Flight.objects.filter(flight_id__in=[first["id"], other["id"]]).delete()
+    headers = {"Idempotency-Key": "feed-batch-7:item-6"}
+    with patch("api.main.enrich_flight_task.apply_async") as publish:
+        client.post("/enrich-flight", json=first, headers=headers)
+        # Another flight, or the same flight with another itinerary, under the same key
+        for payload in (other, {**first, "travel_class": "Economy"}):
+            response = client.post("/enrich-flight", json=payload, headers=headers)
+            assert response.status_code == 422
+    assert publish.call_count == 1
+    # Neither was written
+    assert not Flight.objects.filter(flight_id=other["id"]).exists()
+    assert Flight.objects.get(flight_id=first["id"]).travel_class == "Business"
+
+def test_claim_racing_a_different_request_rolls_back_the_flight_write():
+    first = {**sample_flight, "id": "20250613-MS-MS986-MS747-K8"}
+    other = {**sample_flight, "id": "20250613-MS-MS986-MS747-K9"}
+    Flight.objects.filter(flight_id__in=[first["id"], other["id"]]).delete()
+    headers = {"Idempotency-Key": "feed-batch-7:item-8"}
+    with patch("api.main.enrich_flight_task.apply_async"):
+        client.post("/enrich-flight", json=first, headers=headers)
+        # The holder appears only after the pre-write check, as when two requests race
+        with patch("api.main.key_holder", side_effect=[None, EnrichmentTask.objects.get(idempotency_key=headers["Idempotency-Key"])]):
+            response = client.post("/enrich-flight", json=other, headers=headers)
+    assert response.status_code == 422
+    assert not Flight.objects.filter(flight_id=other["id"]).exists()
+
+def test_claim_task_is_released_when_task_finishes():
+    flight_id = "20250613-MS-MS986-MS747-K3"
+    Flight.objects.filter(flight_id=flight_id).delete()
+    with patch("api.ingest.enqueue_enrichments"):
+        client.post("/enrich-flights", json=[{**sample_flight, "id": flight_id}])
+    flight = Flight.objects.get(flight_id=flight_id)
+    key = f"{flight_id}:{flight.fingerprint}"
+
+    # Two requests racing past the unchanged check: the second insert loses
+    assert claim_task("claim-1", flight, key) is None
+    assert claim_task("claim-2", flight, key).task_id == "claim-1"
+    finish_task("claim-1", "SUCCESS", {"retail_price": 1.0})
+    assert claim_task("claim-3", flight, key) is None
+
+def test_lost_task_releases_its_idempotency_key():
+    flight_id = "20250613-MS-MS986-MS747-K4"
+    Flight.objects.filter(flight_id=flight_id).delete()
+    with patch("api.ingest.enqueue_enrichments"):
+        client.post("/enrich-flights", json=[{**sample_flight, "id": flight_id}])
+    flight = Flight.objects.get(flight_id=flight_id)
+    key = f"{flight_id}:{flight.fingerprint}"
+    EnrichmentTask.objects.filter(flight=flight).delete()
+
+    assert claim_task("lost-1", flight, key) is None
+    with override_settings(FLIGHTS_INFLIGHT_TIMEOUT=60):
+        # Its worker died: an hour later the key goes to the next request
+        EnrichmentTask.objects.filter(task_id="lost-1").update(created_at=datetime.now(timezone.utc) - timedelta(hours=1))
+        assert claim_task("lost-2", flight, key) is None
+        assert EnrichmentTask.objects.get(task_id="lost-1").status == "FAILURE"
+        # And a re-post is enriched again instead of answered with the lost task
+        EnrichmentTask.objects.filter(task_id="lost-2").update(
+            status="STARTED", created_at=datetime.now(timezone.utc) - timedelta(hours=1),
+        )
+        with patch("api.main.enrich_flight_task.apply_async", side_effect=lambda **kw: SimpleNamespace(id=kw["task_id"])):
+            response = client.post("/enrich-flight", json={**sample_flight, "id": flight_id}).json()
+    assert response["status"] == "PENDING" and response["task_id"] != "lost-2"
+    assert "duplicate" not in response and "unchanged" not in response
+
+def test_failed_publish_releases_its_idempotency_key():
+    flight = {**sample_flight, "id": "20250613-MS-MS986-MS747-K5"}
+    Flight.objects.filter(flight_id=flight["id"]).delete()
+    headers = {"Idempotency-Key": "feed-batch-7:item-5"}
+    failing = TestClient(app, raise_server_exceptions=False)
+    with patch("api.main.enrich_flight_task.apply_async", side_effect=ConnectionError("broker down")):
+        assert failing.post("/enrich-flight", json=flight, headers=headers).status_code == 500
+    lost = EnrichmentTask.objects.get(idempotency_key=headers["Idempotency-Key"])
+    assert lost.status == "FAILURE"
+    assert client.get(f"/task-status/{lost.task_id}").json()["status"] == "FAILURE"
+
+    # The retry is enqueued as a new task instead of answered with the one never published
+    with patch("api.main.enrich_flight_task.apply_async", side_effect=lambda **kw: SimpleNamespace(id=kw["task_id"])) as publish:
+        response = client.post("/enrich-flight", json=flight, headers=headers).json()
+    assert publish.call_count == 1
+    assert response == {"task_id": publish.call_args.kwargs["task_id"], "status": "PENDING"}
+    assert response["task_id"] != lost.task_id
+
+def test_enrich_flights_stream_returns_result_per_line():
+    lines = [
+        json.dumps(sample_flight),
+        "",
+        "{not json",
+        json.dumps({**sample_flight, "id": "20250613-MS-MS986-MS747-S"}),
+    ]
+    with patch("api.ingest.enqueue_enrichments") as enqueue:
+        response = client.post("/enrich-flights/stream", content="\n".join(lines) + "\n")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["line"] for r in results] == [1, 3, 4]
+    assert [r["status"] for r in results] == ["PENDING", "INVALID", "PENDING"]
+    assert len(enqueue.call_args.args[0]) == 2
+
+def create_tasks(count):
+    flights = [{**sample_flight, "id": f"20250613-MS-MS986-MS747-W{i}"} for i in range(count)]
+    with patch("api.ingest.enqueue_enrichments"):
+        response = client.post("/enrich-flights", json=flights)
+    return [r["task_id"] for r in response.json()["results"]]
+
+def test_task_status_wait_returns_when_task_finishes():
+    task_id, = create_tasks(1)
+    timer = threading.Timer(0.3, finish_task, args=[task_id, "SUCCESS", {"retail_price": 42.0}])
+    with override_settings(FLIGHTS_NOTIFY_POLL_INTERVAL=0.05):
+        timer.start()
+        response = client.get(f"/task-status/{task_id}", params={"wait": 10})
+    assert response.json() == {"task_id": task_id, "status": "SUCCESS", "result": {"retail_price": 42.0}}
+
+def test_task_status_wait_times_out_with_current_status():
+    task_id, = create_tasks(1)
+    with override_settings(FLIGHTS_NOTIFY_POLL_INTERVAL=0.05):
+        response = client.get(f"/task-status/{task_id}", params={"wait": 0.2})
+    assert response.json()["status"] == "PENDING"
+    assert client.get("/task-status/invalid-task-id", params={"wait": 0.2}).status_code == 404
+
+def test_task_events_streams_changes_until_all_tasks_finish():
+    first, second = create_tasks(2)
+    finish_task(first, "SUCCESS", {"retail_price": 10.0})
+    timer = threading.Timer(0.3, finish_task, args=[second, "FAILURE", {"error": "boom"}])
+    with override_settings(FLIGHTS_NOTIFY_POLL_INTERVAL=0.05):
+        timer.start()
+        response = client.get("/task-events", params=[("task_id", first), ("task_id", second)])
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        json.loads(line[len("data: "):])
+        for line in response.text.splitlines() if line.startswith("data: ")
+    ]
+    statuses = {(e["task_id"], e["status"]) for e in events if e}
+    assert (first, "SUCCESS") in statuses
+    assert (second, "PENDING") in statuses
+    assert (second, "FAILURE") in statuses
+    assert response.text.rstrip().endswith("event: done\ndata: {}")
+
+def test_task_events_rejects_unknown_tasks():
+    response = client.get("/task-events", params={"task_id": "invalid-task-id"})
+    assert response.status_code == 404
+
+def test_status_hub_wakes_waiter_on_published_change():
+    task_id, = create_tasks(1)
+    hub = StatusHub()
+    hub.connected = True  # published messages arrive; no rechecks within the test
+
+    async def run():
+        seen = []
+        async for entry in hub.watch([task_id], timeout=5):
+            seen.append(entry["status"])
+            if entry["status"] == "PENDING":
+                hub.dispatch({"task_id": task_id, "status": "SUCCESS", "result": {"retail_price": 1.0}})
+        return seen
+
+    assert asyncio.run(run()) == ["PENDING", "SUCCESS"]
+    assert hub.waiters == 0
+
+def test_status_hub_rechecks_every_waiter_in_one_read():
+    task_ids = create_tasks(5)
+    hub = StatusHub()
+    reads = []
+
+    def load(ids):
+        ids = list(ids)
+        reads.append(len(ids))
+        return load_statuses(ids)
+
+    async def follow(task_id):
+        return [entry["status"] async for entry in hub.watch([task_id], timeout=5) if entry]
+
+    async def run():
+        waiters = asyncio.gather(*(follow(task_id) for task_id in task_ids))
+        await asyncio.sleep(0.25)
+        await asyncio.to_thread(lambda: [finish_task(task_id, "SUCCESS", {"retail_price": 1.0}) for task_id in task_ids])
+        return await waiters
+
+    with override_settings(FLIGHTS_NOTIFY_POLL_INTERVAL=0.05), \
+            patch("api.notifications.load_statuses", side_effect=load):
+        assert asyncio.run(run()) == [["PENDING", "SUCCESS"]] * 5
+    # Each waiter reads its task once; after that the hub reads all five per tick,
+    # rather than every waiter polling on its own
+    assert reads[:5] == [1] * 5
+    assert max(reads[5:]) == 5
+    assert len(reads[5:]) <= 10
+    assert hub.waiters == 0
+
+def test_task_status_batch_returns_columns_and_filters():
+    done, running = create_tasks(2)
+    finish_task(done, "SUCCESS", {"retail_price": 5.0})
+    ids = [done, running, "invalid-task-id"]
+
+    response = client.post("/task-status/batch", json={"task_ids": ids})
+    assert response.json() == {
+        "task_id": [done, running],
+        "status": ["SUCCESS", "PENDING"],
+        "result": [{"retail_price": 5.0}, None],
+        "missing": ["invalid-task-id"],
+    }
+
+    terminal = client.post("/task-status/batch", json={"task_ids": ids, "terminal_only": True}).json()
+    assert terminal["task_id"] == [done]
+
+    changed = client.post(
+        "/task-status/batch",
+        json={"task_ids": ids, "known": {done: "PENDING", running: "PENDING"}},
+    ).json()
+    assert changed["task_id"] == [done]
+
+def test_task_status_batch_streams_large_batches_in_chunks():
+    ids = create_tasks(5)
+    with override_settings(FLIGHTS_STATUS_BATCH_CHUNK_SIZE=2):
+        response = client.post("/task-status/batch", json={"task_ids": ids})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    chunks = [json.loads(line) for line in response.text.splitlines()]
+    assert [len(chunk["task_id"]) for chunk in chunks] == [2, 2, 1]
+    assert [t for chunk in chunks for t in chunk["task_id"]] == ids
+
+def test_enrichment_is_routed_by_departure_and_deadline():
+    soon = datetime.now(timezone.utc) + timedelta(hours=12)
+    later = datetime.now(timezone.utc) + timedelta(days=200)
+    flights = [
+        {**sample_flight, "id": "priority-soon", "departure_time": soon.isoformat(),
+         "last_seen": datetime.now(timezone.utc).isoformat()},
+        {**sample_flight, "id": "priority-later", "departure_time": later.isoformat(),
+         "last_seen": datetime.now(timezone.utc).isoformat()},
+        {**sample_flight, "id": "priority-deadline", "departure_time": later.isoformat(),
+         "last_seen": datetime.now(timezone.utc).isoformat(),
+         "deadline": (datetime.now(timezone.utc) + timedelta(minutes=2)).isoformat()},
+    ]
+    with patch.object(group, "apply_async", autospec=True) as publish:
+        client.post("/enrich-flights", json=flights)
+    signatures = publish.call_args.args[0].tasks
+    assert [sig.options["queue"] for sig in signatures] == ["enrich.urgent", "enrich.low", "enrich.urgent"]
+    assert signatures[2].options["headers"]["deadline_at"] is not None
+
+def test_queues_reports_every_priority_class():
+    response = client.get("/queues")
+    assert response.status_code == 200
+    assert list(response.json()) == ["urgent", "high", "normal", "low"]
+    assert response.json()["urgent"]["queue"] == "enrich.urgent"
+
+def test_daily_prices_are_columnar():
+    now = datetime.now(timezone.utc)
+    PriceObservation.objects.filter(route="TST-ATH").delete()
+    PriceObservation.objects.bulk_create([
+        PriceObservation(route="TST-ATH", departure_date=now.date(), observed_at=now - timedelta(days=3), price_cents=51000),
+        PriceObservation(route="TST-ATH", departure_date=now.date(), observed_at=now - timedelta(days=3), price_cents=49999),
+        PriceObservation(route="TST-ATH", departure_date=now.date(), observed_at=now - timedelta(hours=1), price_cents=52000),
+        PriceObservation(route="TST-ATH", departure_date=now.date(), observed_at=now - timedelta(days=100), price_cents=100),
+    ])
+    try:
+        response = client.get("/prices/tst/ath/daily", params={"days": 90})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["route"] == "TST-ATH"
+        assert body["min_price"] == [499.99, 520.0]
+        assert len(body["day"]) == 2
+        assert client.get("/prices/tst/ath/daily", params={"currency": "XYZ"}).status_code == 400
+    finally:
+        PriceObservation.objects.filter(route="TST-ATH").delete()
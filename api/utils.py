@@ -1,6 +1,39 @@
 from datetime import datetime,timezone
+from typing import AsyncIterator, Tuple
+
+from starlette.responses import StreamingResponse
 
 def make_aware(dt: datetime):
     if dt.tzinfo is None:
         return dt.replace(tzinfo=timezone.utc)
-    return dt
\ No newline at end of file
+    return dt
+
+
+async def aiter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Split a byte stream into numbered lines without buffering the whole body."""
+    buffer = b""
+    lineno = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            lineno += 1
+            yield lineno, line
+    if buffer:
+        yield lineno + 1, buffer
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    Streaming response whose body iterator may still be reading the request.
+
+    The stock StreamingResponse listens for disconnects by calling receive()
+    on ASGI servers older than spec 2.4, which would swallow request body
+    messages. Here the body iterator owns receive() and sees the disconnect
+    itself through request.stream().
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
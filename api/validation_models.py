@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import List
+from typing import Dict, List, Optional
 
 
 # Pydantic models for input validation
@@ -27,4 +27,17 @@ class FlightData(BaseModel):
     flight_numbers: List[str]
     legs: List[FlightLeg]
     last_seen: datetime
+    # When the caller needs the price by; only ever raises the task's priority
+    deadline: Optional[datetime] = None
+    # Enrich even when the itinerary is unchanged and its price fresh or already being fetched
+    force: bool = False
+    # Seconds an unchanged flight's price counts as fresh; defaults to FLIGHTS_REFRESH_AFTER
+    max_age: Optional[int] = None
 
+
+
+class TaskStatusBatch(BaseModel):
+    task_ids: List[str]
+    # Last status the caller saw per task; tasks still in that status are left out
+    known: Dict[str, str] = {}
+    terminal_only: bool = False
@@ -2,6 +2,7 @@
 
 import os
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
@@ -13,6 +14,20 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Auto-discover tasks in Django apps
 app.autodiscover_tasks()
 
+
+@worker_process_init.connect
+def init_http_client(**kwargs):
+    # One pooled HTTP client per worker process, reused by every task it runs
+    from flights.http_client import init_client
+    init_client()
+
+
+@worker_process_shutdown.connect
+def close_http_client(**kwargs):
+    from flights.http_client import close_client
+    close_client()
+
+
 # Optional: define a debug task for testing
 @app.task(bind=True)
 def debug_task(self):
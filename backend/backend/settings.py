@@ -126,4 +126,202 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
+# Enrichment is published to one queue per priority class (see flights.scheduling);
+# this only catches messages sent without an explicit queue
+CELERY_TASK_ROUTES = {
+    'flights.tasks.enrich_flight_task': {'queue': 'enrich.normal'},
+    'flights.tasks.enrich_flights_async': {'queue': 'enrich.normal'},
+    'flights.tasks.enrich_flights_batch': {'queue': 'enrich.normal'},
+}
+
+# Flight ingestion
+FLIGHTS_INGEST_MAX_BATCH = int(os.getenv('FLIGHTS_INGEST_MAX_BATCH', 1000))
+FLIGHTS_INGEST_CHUNK_SIZE = int(os.getenv('FLIGHTS_INGEST_CHUNK_SIZE', 500))
+
+# A task still PENDING or STARTED FLIGHTS_INFLIGHT_TIMEOUT seconds after it was created
+# is treated as lost: it stops holding its idempotency key and holding back refreshes,
+# and celery beat fails it within FLIGHTS_INFLIGHT_REAP_INTERVAL seconds.
+FLIGHTS_INFLIGHT_TIMEOUT = int(os.getenv('FLIGHTS_INFLIGHT_TIMEOUT', 60 * 60))
+FLIGHTS_INFLIGHT_REAP_INTERVAL = float(os.getenv('FLIGHTS_INFLIGHT_REAP_INTERVAL', 5 * 60))
+
+# Redis used for coordination between workers (coalescing, caches, metrics).
+# Defaults to the Celery broker; set to an empty string to keep everything process-local.
+FLIGHTS_REDIS_URL = os.getenv('FLIGHTS_REDIS_URL', CELERY_BROKER_URL)
+FLIGHTS_REDIS_TIMEOUT = float(os.getenv('FLIGHTS_REDIS_TIMEOUT', 1.0))
+FLIGHTS_REDIS_RETRY_AFTER = float(os.getenv('FLIGHTS_REDIS_RETRY_AFTER', 30))
+
+# SerpAPI request coalescing: identical searches share one in-flight request,
+# and its result is reused by searches arriving within the window.
+SERPAPI_COALESCE_WINDOW = float(os.getenv('SERPAPI_COALESCE_WINDOW', 60))
+SERPAPI_COALESCE_WAIT = float(os.getenv('SERPAPI_COALESCE_WAIT', 210))
+
+# SerpAPI response cache: an in-process LRU in front of Redis. TTLs are picked by
+# days to departure as (max_days, ttl_seconds), first match wins, None matches all.
+SERPAPI_CACHE_MAX_ENTRIES = int(os.getenv('SERPAPI_CACHE_MAX_ENTRIES', 256))
+SERPAPI_CACHE_TTLS = [
+    (1, 15 * 60),
+    (7, 60 * 60),
+    (30, 6 * 60 * 60),
+    (None, 24 * 60 * 60),
+]
 
+# HTTP client for the pricing provider, created once per worker process
+SERPAPI_CONNECT_TIMEOUT = float(os.getenv('SERPAPI_CONNECT_TIMEOUT', 5))
+SERPAPI_READ_TIMEOUT = float(os.getenv('SERPAPI_READ_TIMEOUT', 200))
+SERPAPI_HTTP2 = os.getenv('SERPAPI_HTTP2', 'true').lower() == 'true'
+SERPAPI_MAX_CONNECTIONS = int(os.getenv('SERPAPI_MAX_CONNECTIONS', 20))
+SERPAPI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('SERPAPI_MAX_KEEPALIVE_CONNECTIONS', 10))
+SERPAPI_KEEPALIVE_EXPIRY = float(os.getenv('SERPAPI_KEEPALIVE_EXPIRY', 30))
+
+# asyncio enrichment engine: batch ingestion sends task ids in batches to a task
+# that runs many lookups concurrently in one worker process.
+FLIGHTS_ASYNC_ENRICHMENT = os.getenv('FLIGHTS_ASYNC_ENRICHMENT', 'false').lower() == 'true'
+FLIGHTS_ASYNC_BATCH_SIZE = int(os.getenv('FLIGHTS_ASYNC_BATCH_SIZE', 200))
+FLIGHTS_ASYNC_CONCURRENCY = int(os.getenv('FLIGHTS_ASYNC_CONCURRENCY', 100))
+FLIGHTS_ASYNC_MAX_RETRIES = int(os.getenv('FLIGHTS_ASYNC_MAX_RETRIES', 3))
+FLIGHTS_ASYNC_RETRY_BACKOFF = float(os.getenv('FLIGHTS_ASYNC_RETRY_BACKOFF', 2))
+
+# Batch enrichment: ingestion sends chunks of flight ids to one task that reads them
+# in bulk, fetches each distinct search once (FLIGHTS_ASYNC_CONCURRENCY at a time)
+# and writes every flight and task back with bulk updates. Takes precedence over
+# FLIGHTS_ASYNC_ENRICHMENT.
+FLIGHTS_BATCH_ENRICHMENT = os.getenv('FLIGHTS_BATCH_ENRICHMENT', 'false').lower() == 'true'
+FLIGHTS_BATCH_CHUNK_SIZE = int(os.getenv('FLIGHTS_BATCH_CHUNK_SIZE', 200))
+
+# Shared SerpAPI token bucket: requests per second and burst size across all workers.
+# Tasks that find it empty are deferred until a token is free. 0 disables limiting.
+SERPAPI_RATE_LIMIT = float(os.getenv('SERPAPI_RATE_LIMIT', 5))
+SERPAPI_RATE_BURST = float(os.getenv('SERPAPI_RATE_BURST', 20))
+
+# Circuit breaker around SerpAPI, shared through Redis. It opens when, within a
+# window, enough calls failed or were slow, and re-opens for twice as long each
+# time a half-open trial call fails.
+SERPAPI_BREAKER_WINDOW = float(os.getenv('SERPAPI_BREAKER_WINDOW', 60))
+SERPAPI_BREAKER_MIN_CALLS = int(os.getenv('SERPAPI_BREAKER_MIN_CALLS', 10))
+SERPAPI_BREAKER_ERROR_RATE = float(os.getenv('SERPAPI_BREAKER_ERROR_RATE', 0.5))
+SERPAPI_BREAKER_SLOW_CALL = float(os.getenv('SERPAPI_BREAKER_SLOW_CALL', 30))
+SERPAPI_BREAKER_SLOW_RATE = float(os.getenv('SERPAPI_BREAKER_SLOW_RATE', 0.5))
+SERPAPI_BREAKER_OPEN_SECONDS = float(os.getenv('SERPAPI_BREAKER_OPEN_SECONDS', 30))
+SERPAPI_BREAKER_MAX_OPEN_SECONDS = float(os.getenv('SERPAPI_BREAKER_MAX_OPEN_SECONDS', 600))
+SERPAPI_BREAKER_HALF_OPEN_CALLS = int(os.getenv('SERPAPI_BREAKER_HALF_OPEN_CALLS', 1))
+
+# Retry delay for failed lookups: SERPAPI_RETRY_BASE * 2**retries, scaled up by
+# (1 + SERPAPI_RETRY_HEALTH_FACTOR * current error rate) and capped at SERPAPI_RETRY_MAX.
+SERPAPI_RETRY_BASE = float(os.getenv('SERPAPI_RETRY_BASE', 10))
+SERPAPI_RETRY_HEALTH_FACTOR = float(os.getenv('SERPAPI_RETRY_HEALTH_FACTOR', 4))
+SERPAPI_RETRY_MAX = float(os.getenv('SERPAPI_RETRY_MAX', 600))
+
+# Worker threads available to the FastAPI app for sync endpoints and offloaded blocking calls
+API_THREADPOOL_SIZE = int(os.getenv('API_THREADPOOL_SIZE', 40))
+
+# Write-through task status cache read by GET /task-status. Terminal states are
+# also kept in-process; in-flight ones live only in Redis with a short TTL.
+FLIGHTS_STATUS_CACHE = os.getenv('FLIGHTS_STATUS_CACHE', 'true').lower() == 'true'
+FLIGHTS_STATUS_TTL_TERMINAL = int(os.getenv('FLIGHTS_STATUS_TTL_TERMINAL', 24 * 60 * 60))
+FLIGHTS_STATUS_TTL_INFLIGHT = int(os.getenv('FLIGHTS_STATUS_TTL_INFLIGHT', 60))
+FLIGHTS_STATUS_CACHE_MAX_ENTRIES = int(os.getenv('FLIGHTS_STATUS_CACHE_MAX_ENTRIES', 10000))
+
+# Completion notifications for long-polls (?wait=) and the SSE stream. Waiters are woken
+# through Redis pub/sub; in case a message was missed, every watched task is re-read in
+# one query every RECHECK seconds, or every POLL seconds when there is no subscription.
+FLIGHTS_STATUS_MAX_WAIT = float(os.getenv('FLIGHTS_STATUS_MAX_WAIT', 60))
+FLIGHTS_NOTIFY_RECHECK_INTERVAL = float(os.getenv('FLIGHTS_NOTIFY_RECHECK_INTERVAL', 15))
+FLIGHTS_NOTIFY_POLL_INTERVAL = float(os.getenv('FLIGHTS_NOTIFY_POLL_INTERVAL', 1))
+# Task ids one GET /task-events stream may follow
+FLIGHTS_TASK_EVENTS_MAX_IDS = int(os.getenv('FLIGHTS_TASK_EVENTS_MAX_IDS', 1000))
+
+# POST /task-status/batch: ids per request, and the size above which the response is
+# streamed as one columnar chunk per line. Each chunk is resolved with one query.
+FLIGHTS_STATUS_BATCH_MAX = int(os.getenv('FLIGHTS_STATUS_BATCH_MAX', 50000))
+FLIGHTS_STATUS_BATCH_CHUNK_SIZE = int(os.getenv('FLIGHTS_STATUS_BATCH_CHUNK_SIZE', 1000))
+
+# Enrichment priority classes, most urgent first: by days to departure and, when the
+# client sends one, by seconds to its deadline (the more urgent wins). Flights not
+# seen for FLIGHTS_PRIORITY_STALE_SEEN_DAYS drop one class.
+FLIGHTS_PRIORITY_BY_DEPARTURE = [
+    (2, 'urgent'),
+    (14, 'high'),
+    (60, 'normal'),
+    (None, 'low'),
+]
+FLIGHTS_PRIORITY_BY_DEADLINE = [
+    (5 * 60, 'urgent'),
+    (60 * 60, 'high'),
+    (None, 'low'),
+]
+FLIGHTS_PRIORITY_STALE_SEEN_DAYS = int(os.getenv('FLIGHTS_PRIORITY_STALE_SEEN_DAYS', 7))
+FLIGHTS_PRIORITY_DEFAULT = os.getenv('FLIGHTS_PRIORITY_DEFAULT', 'normal')
+
+# Re-enrichment of priced flights, run by celery beat every FLIGHTS_REFRESH_INTERVAL
+# seconds. A price is stale after max_age_seconds, picked by days to departure as
+# (max_days, max_age_seconds), first match wins, None matches all. Each run enqueues
+# at most FLIGHTS_REFRESH_QUOTA_SHARE of the SerpAPI requests the rate limit allows
+# until the next run, capped at FLIGHTS_REFRESH_MAX_PER_CYCLE.
+FLIGHTS_REFRESH_INTERVAL = float(os.getenv('FLIGHTS_REFRESH_INTERVAL', 300))
+FLIGHTS_REFRESH_QUOTA_SHARE = float(os.getenv('FLIGHTS_REFRESH_QUOTA_SHARE', 0.5))
+FLIGHTS_REFRESH_MAX_PER_CYCLE = int(os.getenv('FLIGHTS_REFRESH_MAX_PER_CYCLE', 5000))
+FLIGHTS_REFRESH_BATCH_SIZE = int(os.getenv('FLIGHTS_REFRESH_BATCH_SIZE', 500))
+FLIGHTS_REFRESH_AFTER = [
+    (1, 60 * 60),
+    (7, 6 * 60 * 60),
+    (30, 24 * 60 * 60),
+    (None, 3 * 24 * 60 * 60),
+]
+
+# Price history. Raw observations older than FLIGHTS_PRICE_RAW_RETENTION_DAYS are
+# compacted into one daily minimum per route and departure date, at most
+# FLIGHTS_PRICE_DOWNSAMPLE_DAYS days per run; daily rows are dropped after
+# FLIGHTS_PRICE_DAILY_RETENTION_DAYS.
+FLIGHTS_PRICE_INSERT_BATCH = int(os.getenv('FLIGHTS_PRICE_INSERT_BATCH', 1000))
+FLIGHTS_PRICE_RAW_RETENTION_DAYS = int(os.getenv('FLIGHTS_PRICE_RAW_RETENTION_DAYS', 14))
+FLIGHTS_PRICE_DAILY_RETENTION_DAYS = int(os.getenv('FLIGHTS_PRICE_DAILY_RETENTION_DAYS', 730))
+FLIGHTS_PRICE_DOWNSAMPLE_DAYS = int(os.getenv('FLIGHTS_PRICE_DOWNSAMPLE_DAYS', 7))
+FLIGHTS_PRICE_DOWNSAMPLE_INTERVAL = float(os.getenv('FLIGHTS_PRICE_DOWNSAMPLE_INTERVAL', 60 * 60))
+
+# JSON decoder for SerpAPI responses: auto picks the fastest installed of msgspec,
+# orjson and the standard library json module.
+FLIGHTS_JSON_DECODER = os.getenv('FLIGHTS_JSON_DECODER', 'auto')
+
+# How a flight's price is picked from its search response: match prices the
+# itinerary flying its exact flight numbers (and leg departure times), falling back
+# to FLIGHTS_PRICE_FALLBACK (none, first, min or nearest) when none does; first and
+# min price every flight on the search the same.
+FLIGHTS_PRICE_STRATEGY = os.getenv('FLIGHTS_PRICE_STRATEGY', 'match')
+FLIGHTS_PRICE_FALLBACK = os.getenv('FLIGHTS_PRICE_FALLBACK', 'nearest')
+
+# Flight and task dashboards: rows per page by default and at most (?limit=), and
+# rows read and rendered per chunk when a page is streamed (?stream=1).
+FLIGHTS_DASHBOARD_PAGE_SIZE = int(os.getenv('FLIGHTS_DASHBOARD_PAGE_SIZE', 100))
+FLIGHTS_DASHBOARD_MAX_PAGE_SIZE = int(os.getenv('FLIGHTS_DASHBOARD_MAX_PAGE_SIZE', 10000))
+FLIGHTS_DASHBOARD_STREAM_CHUNK = int(os.getenv('FLIGHTS_DASHBOARD_STREAM_CHUNK', 500))
+
+# Flight legs are FlightLeg rows, replaced in bulk inserts of up to
+# FLIGHTS_LEG_INSERT_BATCH rows when a flight's itinerary changes. GET /legs and
+# GET /airports/{code}/flights return FLIGHTS_LEG_QUERY_LIMIT rows by default and
+# at most FLIGHTS_LEG_QUERY_MAX_LIMIT.
+FLIGHTS_LEG_INSERT_BATCH = int(os.getenv('FLIGHTS_LEG_INSERT_BATCH', 1000))
+FLIGHTS_LEG_QUERY_LIMIT = int(os.getenv('FLIGHTS_LEG_QUERY_LIMIT', 100))
+FLIGHTS_LEG_QUERY_MAX_LIMIT = int(os.getenv('FLIGHTS_LEG_QUERY_MAX_LIMIT', 1000))
+
+# Archive of raw SerpAPI responses, for re-running extraction without paying for
+# the calls again (manage.py reextract). Gzip segments of up to
+# FLIGHTS_ARCHIVE_SEGMENT_BYTES per process; an empty FLIGHTS_ARCHIVE_DIR disables it.
+FLIGHTS_ARCHIVE_DIR = os.getenv('FLIGHTS_ARCHIVE_DIR', str(BASE_DIR / 'archive'))
+FLIGHTS_ARCHIVE_SEGMENT_BYTES = int(os.getenv('FLIGHTS_ARCHIVE_SEGMENT_BYTES', 64 * 1024 * 1024))
+FLIGHTS_ARCHIVE_COMPRESSLEVEL = int(os.getenv('FLIGHTS_ARCHIVE_COMPRESSLEVEL', 6))
+FLIGHTS_ARCHIVE_DEDUP_ENTRIES = int(os.getenv('FLIGHTS_ARCHIVE_DEDUP_ENTRIES', 10000))
+
+CELERY_BEAT_SCHEDULE = {
+    'refresh-stale-flights': {
+        'task': 'flights.tasks.refresh_stale_flights',
+        'schedule': FLIGHTS_REFRESH_INTERVAL,
+    },
+    'downsample-price-observations': {
+        'task': 'flights.tasks.downsample_price_observations',
+        'schedule': FLIGHTS_PRICE_DOWNSAMPLE_INTERVAL,
+    },
+    'expire-stale-tasks': {
+        'task': 'flights.tasks.expire_stale_tasks',
+        'schedule': FLIGHTS_INFLIGHT_REAP_INTERVAL,
+    },
+}
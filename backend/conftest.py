@@ -4,6 +4,10 @@ import pytest
 
 # Configure Django settings for testing
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Keep coordination state process-local so tests do not depend on a running Redis
+os.environ.setdefault('FLIGHTS_REDIS_URL', '')
+# Tests that exercise the response archive point it at a temporary directory
+os.environ.setdefault('FLIGHTS_ARCHIVE_DIR', '')
 django.setup()
 
 @pytest.fixture(scope='session')
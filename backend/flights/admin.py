@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from flights.models import Flight,EnrichmentTask
+from flights.models import Flight,EnrichmentTask,FlightLeg
 
 admin.site.register(Flight)
 admin.site.register(EnrichmentTask)
+admin.site.register(FlightLeg)
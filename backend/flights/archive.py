@@ -0,0 +1,153 @@
+# Standard library imports
+import gzip
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Third-party imports
+from django.conf import settings
+
+# Local application imports
+from . import decoding, metrics
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".gz"
+INDEX_SUFFIX = ".idx"
+
+
+def digest(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+class ResponseArchive:
+    """
+    Append-only, compressed archive of raw SerpAPI responses.
+
+    Every process writes its own segment files under ``root``, so writers
+    never contend. A segment is a sequence of gzip members, one per distinct
+    response body; its ``.idx`` sidecar has one JSON line per archived fetch:
+    ``{"key", "params", "fetched_at", "digest", "offset", "length"}``.
+    Bodies are stored as received, never re-encoded, and addressed by
+    their SHA-256, so a response fetched again unchanged only adds an index
+    line. A segment is
+    rotated once it reaches ``FLIGHTS_ARCHIVE_SEGMENT_BYTES``.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self._root = root
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._segment: Optional[Path] = None
+        self._size = 0
+        self._sequence = 0
+        # digest -> (offset, length) of bodies already in the open segment
+        self._written: "OrderedDict[str, tuple]" = OrderedDict()
+
+    @property
+    def root(self) -> Optional[Path]:
+        root = self._root if self._root is not None else settings.FLIGHTS_ARCHIVE_DIR
+        return Path(root) if root else None
+
+    def _open_segment(self, root: Path) -> None:
+        root.mkdir(parents=True, exist_ok=True)
+        self._sequence += 1
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{socket.gethostname()}-{os.getpid()}-{self._sequence}"
+        self._segment = root / f"{name}{SEGMENT_SUFFIX}"
+        self._pid = os.getpid()
+        self._size = 0
+        self._written.clear()
+
+    def append(self, key: str, params: Dict[str, Any], body: bytes, fetched_at: Optional[float] = None) -> None:
+        """Archive one fetched response body; does nothing while the archive is disabled."""
+        root = self.root
+        if root is None:
+            return
+        body_digest = digest(body)
+        entry = {
+            "key": key,
+            "params": {name: value for name, value in params.items() if name != "api_key"},
+            "fetched_at": fetched_at if fetched_at is not None else time.time(),
+            "digest": body_digest,
+        }
+        with self._lock:
+            try:
+                # Forked workers must not share the parent's segment, and a moved
+                # archive directory starts a new one
+                if (
+                    self._segment is None
+                    or self._pid != os.getpid()
+                    or self._segment.parent != root
+                    or self._size >= settings.FLIGHTS_ARCHIVE_SEGMENT_BYTES
+                ):
+                    self._open_segment(root)
+                location = self._written.get(body_digest)
+                if location is None:
+                    blob = gzip.compress(body, compresslevel=settings.FLIGHTS_ARCHIVE_COMPRESSLEVEL)
+                    with open(self._segment, "ab") as segment:
+                        segment.write(blob)
+                    location = self._written[body_digest] = (self._size, len(blob))
+                    self._size += len(blob)
+                    while len(self._written) > settings.FLIGHTS_ARCHIVE_DEDUP_ENTRIES:
+                        self._written.popitem(last=False)
+                    metrics.incr("archive_bytes", len(blob))
+                else:
+                    self._written.move_to_end(body_digest)
+                    metrics.incr("archive_deduplicated")
+                entry["offset"], entry["length"] = location
+                with open(self._segment.with_suffix(INDEX_SUFFIX), "a") as index:
+                    index.write(json.dumps(entry) + "\n")
+            except OSError:
+                # A partly written blob would shift every later offset; start a new segment
+                self._segment = None
+                raise
+
+    def segments(self) -> List[Path]:
+        root = self.root
+        if root is None or not root.exists():
+            return []
+        return sorted(root.glob(f"*{SEGMENT_SUFFIX}"))
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        """Stream every index entry, each with the ``segment`` path it points into."""
+        for segment in self.segments():
+            index = segment.with_suffix(INDEX_SUFFIX)
+            if not index.exists():
+                continue
+            with open(index) as lines:
+                for line in lines:
+                    # A writer killed mid-line leaves a partial last line
+                    if line.endswith("\n"):
+                        entry = json.loads(line)
+                        entry["segment"] = str(segment)
+                        yield entry
+
+
+def read_body(
+    segment: str, offset: int, length: int, decode: Callable[[bytes], Any] = decoding.loads
+) -> Dict[str, Any]:
+    with open(segment, "rb") as source:
+        source.seek(offset)
+        return decode(gzip.decompress(source.read(length)))
+
+
+response_archive = ResponseArchive()
+
+
+def archive_response(key: str, params: Dict[str, Any], body: bytes) -> None:
+    """
+    Archive a paid response body without ever failing its lookup: a full
+    disk or an unwritable directory is logged and counted as ``archive_errors``.
+    """
+    try:
+        response_archive.append(key, params, body)
+    except OSError:
+        logger.exception("Could not archive the response for %s", key)
+        metrics.incr("archive_errors")
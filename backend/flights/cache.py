@@ -0,0 +1,112 @@
+# Standard library imports
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Optional, Tuple
+
+# Third-party imports
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+# Local application imports
+from . import decoding, metrics
+from .redis_client import get_redis, mark_unavailable
+
+
+def cache_ttl(departure: date, today: Optional[date] = None) -> int:
+    """
+    Pick a cache TTL in seconds from how far away the departure is.
+
+    ``SERPAPI_CACHE_TTLS`` is a list of ``(max_days_to_departure, ttl)``
+    pairs checked in order; ``None`` as the day bound matches everything.
+    Fares move faster close to departure, so nearer flights get shorter TTLs.
+    """
+    today = today or timezone.now().date()
+    days = (departure - today).days
+    for max_days, ttl in settings.SERPAPI_CACHE_TTLS:
+        if max_days is None or days <= max_days:
+            return ttl
+    return 0
+
+
+class ResponseCache:
+    """
+    Two-tier TTL cache: an in-process LRU in front of a shared Redis tier.
+
+    Local hits avoid both the network and JSON decoding; Redis hits are
+    shared by every worker and copied into the local tier for the rest of
+    their TTL. Hit, miss and eviction counts are reported through
+    ``flights.metrics`` under ``<name>_*``.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _redis_key(self, key: str) -> str:
+        return f"flights:{self.name}:{key}"
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                else:
+                    del self._entries[key]
+                    entry = None
+        if entry is not None:
+            metrics.incr(f"{self.name}_hits_local")
+            return value
+
+        client = get_redis()
+        if client is not None:
+            try:
+                with client.pipeline(transaction=False) as pipe:
+                    raw, ttl_ms = pipe.get(self._redis_key(key)).pttl(self._redis_key(key)).execute()
+            except redis.RedisError:
+                mark_unavailable()
+            else:
+                if raw is not None:
+                    value = decoding.loads(raw)
+                    if ttl_ms > 0:
+                        self._store_local(key, value, ttl_ms / 1000)
+                    metrics.incr(f"{self.name}_hits_redis")
+                    return value
+
+        metrics.incr(f"{self.name}_misses")
+        return None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        self._store_local(key, value, ttl)
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            client.set(self._redis_key(key), json.dumps(value), px=int(ttl * 1000))
+        except redis.RedisError:
+            mark_unavailable()
+
+    def clear(self) -> None:
+        """Drop the local tier; Redis entries expire on their own."""
+        with self._lock:
+            self._entries.clear()
+
+    def _store_local(self, key: str, value: Any, ttl: float) -> None:
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.SERPAPI_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            metrics.incr(f"{self.name}_evictions", evicted)
@@ -0,0 +1,163 @@
+# Standard library imports
+import threading
+import time
+from typing import Callable, Dict
+
+# Third-party imports
+import redis
+from django.conf import settings
+
+# Local application imports
+from . import metrics
+from .redis_client import get_redis, mark_unavailable
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a provider that is failing; retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuit open, retry in {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker whose state is shared by every worker through Redis.
+
+    Closed: calls go through and outcomes are counted over a fixed window of
+    ``SERPAPI_BREAKER_WINDOW`` seconds. Once at least
+    ``SERPAPI_BREAKER_MIN_CALLS`` calls were seen and the share of errors or
+    of calls slower than ``SERPAPI_BREAKER_SLOW_CALL`` seconds crosses its
+    threshold, the circuit opens.
+
+    Open: calls are rejected with ``CircuitOpen`` until the open period ends.
+    The period doubles each time the circuit re-opens, up to
+    ``SERPAPI_BREAKER_MAX_OPEN_SECONDS``.
+
+    Half-open: after the open period up to ``SERPAPI_BREAKER_HALF_OPEN_CALLS``
+    trial calls are let through. A healthy trial closes the circuit, a failed
+    or slow one opens it again.
+
+    Without Redis each process keeps its own state.
+    """
+
+    def __init__(self, name: str):
+        self.key = f"flights:circuit:{name}"
+        self._local: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """
+        Raises:
+            CircuitOpen: If the provider should not be called right now
+        """
+        wait = self._update(self._allow)
+        if wait > 0:
+            metrics.incr("circuit_rejected")
+            raise CircuitOpen(wait)
+
+    def record(self, ok: bool, elapsed: float) -> None:
+        """Record the outcome of a call that ``before_call`` let through."""
+        slow = elapsed >= settings.SERPAPI_BREAKER_SLOW_CALL
+
+        def apply(state, now):
+            return self._record(state, now, ok and not slow, ok, slow)
+
+        if self._update(apply):
+            metrics.incr("circuit_opened")
+
+    def error_rate(self) -> float:
+        """Share of failed calls in the current window, or 1.0 while open."""
+        state = self._update(lambda state, now: dict(state))
+        if state.get("open_until", 0) > time.time():
+            return 1.0
+        calls = state.get("calls", 0)
+        return state.get("failures", 0) / calls if calls else 0.0
+
+    def _allow(self, state: Dict[str, float], now: float) -> float:
+        open_until = state.get("open_until", 0)
+        if not open_until:
+            return 0.0
+        if now < open_until:
+            return open_until - now
+        # Half-open: admit a few trial calls, and more if a trial never reported back
+        trial_started = state.get("trial_started", 0)
+        if now - trial_started > settings.SERPAPI_CONNECT_TIMEOUT + settings.SERPAPI_READ_TIMEOUT:
+            state["trials"] = 0
+        if state.get("trials", 0) >= settings.SERPAPI_BREAKER_HALF_OPEN_CALLS:
+            return float(settings.SERPAPI_BREAKER_OPEN_SECONDS)
+        state["trials"] = state.get("trials", 0) + 1
+        state["trial_started"] = now
+        return 0.0
+
+    def _record(self, state: Dict[str, float], now: float, healthy: bool, ok: bool, slow: bool) -> bool:
+        """Update counters for one outcome; returns True when this outcome opened the circuit."""
+        open_until = state.get("open_until", 0)
+        if open_until and now >= open_until:
+            if healthy:
+                state.clear()
+                return False
+            return self._open(state, now)
+        if open_until:
+            # A call that started before the circuit opened
+            return False
+
+        if now - state.get("window_start", 0) >= settings.SERPAPI_BREAKER_WINDOW:
+            state.update(window_start=now, calls=0, failures=0, slow=0)
+        state["calls"] = state.get("calls", 0) + 1
+        state["failures"] = state.get("failures", 0) + (0 if ok else 1)
+        state["slow"] = state.get("slow", 0) + (1 if slow else 0)
+
+        calls = state["calls"]
+        if calls < settings.SERPAPI_BREAKER_MIN_CALLS:
+            return False
+        if (state["failures"] / calls >= settings.SERPAPI_BREAKER_ERROR_RATE
+                or state["slow"] / calls >= settings.SERPAPI_BREAKER_SLOW_RATE):
+            return self._open(state, now)
+        return False
+
+    @staticmethod
+    def _open(state: Dict[str, float], now: float) -> bool:
+        opens = state.get("opens", 0) + 1
+        duration = min(
+            settings.SERPAPI_BREAKER_MAX_OPEN_SECONDS,
+            settings.SERPAPI_BREAKER_OPEN_SECONDS * 2 ** (opens - 1),
+        )
+        state.clear()
+        state.update(opens=opens, open_until=now + duration, trials=0)
+        return True
+
+    def _update(self, fn: Callable[[Dict[str, float], float], object]):
+        """Apply ``fn(state, now)`` atomically to the shared state and return its result."""
+        client = get_redis()
+        if client is not None:
+            try:
+                def transaction(pipe):
+                    state = {k.decode(): float(v) for k, v in pipe.hgetall(self.key).items()}
+                    before = dict(state)
+                    result = fn(state, time.time())
+                    if state != before:
+                        pipe.multi()
+                        pipe.delete(self.key)
+                        if state:
+                            pipe.hset(self.key, mapping=state)
+                            pipe.expire(self.key, int(settings.SERPAPI_BREAKER_MAX_OPEN_SECONDS * 2))
+                    return result
+
+                return client.transaction(transaction, self.key, value_from_callable=True)
+            except redis.RedisError:
+                mark_unavailable()
+        with self._lock:
+            return fn(self._local, time.time())
+
+
+def retry_countdown(breaker: CircuitBreaker, retries: int) -> float:
+    """
+    Exponential retry delay scaled by how unhealthy the provider looks.
+
+    A healthy provider gets quick retries for one-off errors; while many
+    calls are failing, retries back off further so they do not pile on.
+    """
+    base = settings.SERPAPI_RETRY_BASE * 2 ** retries
+    countdown = base * (1 + settings.SERPAPI_RETRY_HEALTH_FACTOR * breaker.error_rate())
+    return min(settings.SERPAPI_RETRY_MAX, countdown)
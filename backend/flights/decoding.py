@@ -0,0 +1,132 @@
+# Standard library imports
+import importlib
+import importlib.util
+import json
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+# Third-party imports
+from django.conf import settings
+
+# Fastest first; "json" is always available
+BACKENDS = ("msgspec", "orjson", "json")
+
+# Itinerary lists a google_flights response prices, in the order they are searched
+ITINERARY_LISTS = ("best_flights", "other_flights")
+
+
+def available_backends() -> List[str]:
+    return [name for name in BACKENDS if name == "json" or importlib.util.find_spec(name) is not None]
+
+
+def backend_name() -> str:
+    """
+    The decoder in use: ``FLIGHTS_JSON_DECODER``, or with ``auto`` the fastest
+    one installed. msgspec and orjson are optional.
+    """
+    name = settings.FLIGHTS_JSON_DECODER
+    if name == "auto":
+        return available_backends()[0]
+    if name not in available_backends():
+        raise ValueError(f"JSON decoder {name!r} is not installed")
+    return name
+
+
+@lru_cache(maxsize=None)
+def _loads(name: str) -> Callable[[bytes], Any]:
+    if name == "msgspec":
+        return importlib.import_module("msgspec").json.decode
+    if name == "orjson":
+        return importlib.import_module("orjson").loads
+    return json.loads
+
+
+def loads(body: bytes) -> Any:
+    """Decode a whole JSON document with the configured decoder."""
+    return _loads(backend_name())(body)
+
+
+def slim_response(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy only what price extraction reads out of a google_flights response:
+    each itinerary's price and its flights' numbers and departure times.
+
+    Keys missing from the response stay missing, so the shape is unchanged.
+    """
+    slim: Dict[str, Any] = {}
+    for name in ITINERARY_LISTS:
+        itineraries = data.get(name)
+        if not isinstance(itineraries, list):
+            continue
+        kept = []
+        for itinerary in itineraries:
+            if not isinstance(itinerary, dict):
+                kept.append(itinerary)
+                continue
+            entry = {}
+            if "price" in itinerary:
+                entry["price"] = itinerary["price"]
+            if isinstance(itinerary.get("flights"), list):
+                entry["flights"] = [_slim_flight(flight) for flight in itinerary["flights"]]
+            kept.append(entry)
+        slim[name] = kept
+    return slim
+
+
+def _slim_flight(flight: Any) -> Any:
+    if not isinstance(flight, dict):
+        return flight
+    entry = {}
+    if "flight_number" in flight:
+        entry["flight_number"] = flight["flight_number"]
+    departure = flight.get("departure_airport")
+    if isinstance(departure, dict) and "time" in departure:
+        entry["departure_airport"] = {"time": departure["time"]}
+    return entry
+
+
+@lru_cache(maxsize=None)
+def _search_decoder() -> Optional[Callable[[bytes], Any]]:
+    # msgspec can decode straight into the fields extraction reads and skip
+    # the rest of the document without building it
+    if "msgspec" not in available_backends():
+        return None
+    msgspec = importlib.import_module("msgspec")
+
+    class Departure(msgspec.Struct, omit_defaults=True):
+        time: Optional[str] = None
+
+    class Segment(msgspec.Struct, omit_defaults=True):
+        flight_number: Optional[str] = None
+        departure_airport: Optional[Departure] = None
+
+    class Itinerary(msgspec.Struct, omit_defaults=True):
+        price: Any = None
+        flights: Optional[List[Segment]] = None
+
+    class SearchResult(msgspec.Struct, omit_defaults=True):
+        best_flights: Optional[List[Itinerary]] = None
+        other_flights: Optional[List[Itinerary]] = None
+
+    decoder = msgspec.json.Decoder(SearchResult)
+
+    def decode(body: bytes) -> Dict[str, Any]:
+        try:
+            return msgspec.to_builtins(decoder.decode(body))
+        except msgspec.ValidationError:
+            # An unexpected shape somewhere: decode it whole and let extraction judge
+            return slim_response(loads(body))
+
+    return decode
+
+
+def decode_search(body: bytes) -> Dict[str, Any]:
+    """
+    Decode a google_flights response into ``slim_response`` form.
+
+    With msgspec selected the unused parts of the document are skipped while
+    parsing; otherwise the document is decoded whole and then slimmed.
+    """
+    if backend_name() == "msgspec":
+        return _search_decoder()(body)
+    return slim_response(loads(body))
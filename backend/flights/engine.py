@@ -0,0 +1,209 @@
+# Standard library imports
+import asyncio
+import time
+from typing import Any, Dict, List, Union
+
+# Third-party imports
+import httpx
+from django.conf import settings
+from django.utils import timezone
+
+# Local application imports
+from . import decoding, metrics, status_cache
+from .archive import archive_response
+from .http_client import build_async_client
+from .inflight import IN_FLIGHT_STATUSES
+from .models import Flight, EnrichmentTask
+from .prices import observation_for
+from .legs import leg_departures
+from .pricing import PRICING_FIELDS, SearchPricer
+from .circuit import CircuitOpen
+from .ratelimit import RateLimited
+from .serpapi import (
+    SEARCH_FIELDS,
+    SERPAPI_URL,
+    breaker,
+    build_search_params,
+    cache_response,
+    is_upstream_failure,
+    response_cache,
+    search_key,
+    take_quota,
+)
+
+async def fetch_google_flights_async(client: httpx.AsyncClient, params: Dict[str, Any]) -> bytes:
+    """Call SerpAPI once without blocking the event loop; returns the undecoded body."""
+    await asyncio.to_thread(breaker.before_call)
+    await asyncio.to_thread(take_quota)
+    metrics.incr("serpapi_requests")
+    started = time.monotonic()
+    try:
+        response = await client.get(SERPAPI_URL, params={**params, "api_key": settings.SERPAPI_KEY})
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        await asyncio.to_thread(breaker.record, not is_upstream_failure(e), time.monotonic() - started)
+        raise
+    finally:
+        metrics.incr("serpapi_latency_seconds", time.monotonic() - started)
+    await asyncio.to_thread(breaker.record, True, time.monotonic() - started)
+    return response.content
+
+
+class AsyncSearcher:
+    """
+    Cache-aware SerpAPI lookups for one event loop.
+
+    Coroutines searching for the same key while a request is in flight await
+    that request instead of issuing their own, and each response is indexed
+    for pricing once however many flights in the batch share it.
+    """
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pricers: Dict[str, SearchPricer] = {}
+
+    async def pricer(self, params: Dict[str, Any]) -> SearchPricer:
+        key = search_key(params)
+        pricer = self._pricers.get(key)
+        if pricer is None:
+            data = await self.search(params)
+            # Another coroutine may have indexed it while we waited
+            pricer = self._pricers.setdefault(key, SearchPricer(data))
+        return pricer
+
+    async def search(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        key = search_key(params)
+        data = await asyncio.to_thread(response_cache.get, key)
+        if data is not None:
+            return data
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            metrics.incr("serpapi_coalesced")
+            return await asyncio.shield(inflight)
+
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            body = await self._fetch_with_retries(params)
+            await asyncio.to_thread(archive_response, key, params, body)
+            data = decoding.decode_search(body)
+            await asyncio.to_thread(cache_response, key, params, data)
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it; mark it retrieved so a lone failure is not logged twice
+            future.exception()
+            raise
+        else:
+            future.set_result(data)
+            return data
+        finally:
+            del self._inflight[key]
+
+    async def _fetch_with_retries(self, params: Dict[str, Any]) -> bytes:
+        attempt = 0
+        while True:
+            try:
+                return await fetch_google_flights_async(self.client, params)
+            except RateLimited as e:
+                # Waiting is cheap on the event loop and does not count as a retry
+                metrics.incr("serpapi_ratelimit_wait_seconds", e.retry_after)
+                await asyncio.sleep(e.retry_after)
+            except CircuitOpen as e:
+                await asyncio.sleep(e.retry_after)
+            except httpx.HTTPError:
+                if attempt >= settings.FLIGHTS_ASYNC_MAX_RETRIES:
+                    raise
+                # Back off further while the provider is failing for everyone
+                error_rate = await asyncio.to_thread(breaker.error_rate)
+                backoff = settings.FLIGHTS_ASYNC_RETRY_BACKOFF * 2 ** attempt
+                await asyncio.sleep(backoff * (1 + settings.SERPAPI_RETRY_HEALTH_FACTOR * error_rate))
+                attempt += 1
+
+
+async def _finish(task_pk: int, task_id: str, status: str, result: Dict[str, Any]) -> None:
+    # Like finish_task, leaves a task that expired meanwhile failed
+    updated = await EnrichmentTask.objects.filter(pk=task_pk, status__in=IN_FLIGHT_STATUSES).aupdate(
+        status=status,
+        result=result,
+        completed_at=timezone.now(),
+    )
+    if updated:
+        await asyncio.to_thread(status_cache.set_status, task_id, status, result)
+
+
+async def enrich_one(searcher: AsyncSearcher, semaphore: asyncio.Semaphore, task_id: str) -> Dict[str, Any]:
+    """
+    Enrich the flight behind one EnrichmentTask.
+
+    Goes through the same PENDING -> STARTED -> SUCCESS/FAILURE transitions
+    as ``enrich_flight_task``; STARTED is set once a concurrency slot is free.
+    """
+    async with semaphore:
+        try:
+            tasks = EnrichmentTask.objects.select_related("flight").only(
+                "flight_id", *(f"flight__{name}" for name in SEARCH_FIELDS + PRICING_FIELDS)
+            )
+            if settings.FLIGHTS_PRICE_STRATEGY == "match":
+                tasks = tasks.prefetch_related(leg_departures("flight__"))
+            task = await tasks.aget(task_id=task_id)
+        except EnrichmentTask.DoesNotExist:
+            return {"task_id": task_id, "error": f"Task {task_id} not found"}
+
+        if await EnrichmentTask.objects.filter(pk=task.pk, status__in=IN_FLIGHT_STATUSES).aupdate(status="STARTED"):
+            await asyncio.to_thread(status_cache.set_status, task_id, "STARTED")
+
+        params = build_search_params(task.flight)
+        try:
+            pricer = await searcher.pricer(params)
+            retail_price = pricer.price(task.flight)
+        except httpx.HTTPError as e:
+            error_msg = f"HTTP error occurred: {str(e)}"
+            await _finish(task.pk, task_id, "FAILURE", {"error": error_msg})
+            return {"task_id": task_id, "error": error_msg}
+        except Exception as e:
+            error_msg = f"Error enriching flight data: {str(e)}"
+            await _finish(task.pk, task_id, "FAILURE", {"error": error_msg})
+            return {"task_id": task_id, "error": error_msg}
+
+        now = timezone.now()
+        observation = observation_for(params, retail_price, now)
+        if observation is not None:
+            await observation.asave(force_insert=True)
+        fields = {"enriched": True, "enriched_at": now}
+        if retail_price is not None:
+            fields["retail_price"] = retail_price
+        await Flight.objects.filter(pk=task.flight_id).aupdate(**fields)
+        await _finish(task.pk, task_id, "SUCCESS", {"retail_price": retail_price})
+        return {"task_id": task_id, "retail_price": retail_price}
+
+
+async def enrich_many(task_ids: List[str], concurrency: int) -> List[Dict[str, Any]]:
+    """Run up to ``concurrency`` enrichments at once over one pooled async client."""
+    semaphore = asyncio.Semaphore(concurrency)
+    async with build_async_client(max_connections=concurrency) as client:
+        searcher = AsyncSearcher(client)
+        return await asyncio.gather(*(enrich_one(searcher, semaphore, task_id) for task_id in task_ids))
+
+
+async def price_searches(
+    params_by_key: Dict[str, Dict[str, Any]], concurrency: int
+) -> Dict[str, Union[SearchPricer, Exception]]:
+    """
+    Fetch and index each distinct search once, up to ``concurrency`` at a time.
+
+    Returns:
+        A pricer per search key, or the exception its lookup ended with
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(key: str, params: Dict[str, Any]):
+        async with semaphore:
+            try:
+                return key, await searcher.pricer(params)
+            except Exception as e:
+                return key, e
+
+    async with build_async_client(max_connections=concurrency) as client:
+        searcher = AsyncSearcher(client)
+        return dict(await asyncio.gather(*(one(key, params) for key, params in params_by_key.items())))
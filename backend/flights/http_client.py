@@ -0,0 +1,77 @@
+# Standard library imports
+import importlib.util
+import threading
+from typing import Any, Dict, Optional
+
+# Third-party imports
+import httpx
+from django.conf import settings
+
+_client: Optional[httpx.Client] = None
+_lock = threading.Lock()
+
+
+def _client_options() -> Dict[str, Any]:
+    http2 = settings.SERPAPI_HTTP2 and importlib.util.find_spec("h2") is not None
+    return {
+        "timeout": httpx.Timeout(settings.SERPAPI_READ_TIMEOUT, connect=settings.SERPAPI_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=settings.SERPAPI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SERPAPI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.SERPAPI_KEEPALIVE_EXPIRY,
+        ),
+        "http2": http2,
+    }
+
+
+def build_client() -> httpx.Client:
+    """
+    Build a pooled client for the pricing provider from settings.
+
+    Keep-alive connections are reused across tasks, so only the first request
+    on a connection pays for the TCP and TLS handshakes. HTTP/2 is enabled
+    when requested and the optional ``h2`` package is installed.
+    """
+    return httpx.Client(**_client_options())
+
+
+def build_async_client(max_connections: Optional[int] = None) -> httpx.AsyncClient:
+    """Build an async client with the same settings, sized for ``max_connections``."""
+    options = _client_options()
+    if max_connections is not None:
+        options["limits"] = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=settings.SERPAPI_KEEPALIVE_EXPIRY,
+        )
+    return httpx.AsyncClient(**options)
+
+
+def init_client() -> httpx.Client:
+    """
+    Create this process's client.
+
+    Called from ``worker_process_init`` so every prefork child gets its own
+    pool; a client inherited across fork would share sockets with the parent.
+    """
+    global _client
+    with _lock:
+        _client = build_client()
+        return _client
+
+
+def get_client() -> httpx.Client:
+    """Return this process's client, creating it on first use outside prefork workers."""
+    client = _client
+    if client is None:
+        client = init_client()
+    return client
+
+
+def close_client() -> None:
+    """Close this process's client and its pooled connections."""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -0,0 +1,72 @@
+# Standard library imports
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+# Third-party imports
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils import timezone
+
+# Local application imports
+from flights import metrics, status_cache
+from .models import EnrichmentTask
+
+IN_FLIGHT_STATUSES = ("PENDING", "STARTED")
+
+# Result recorded on a task failed by expire_stale
+TIMED_OUT_RESULT = {"error": "Enrichment did not finish in time"}
+
+
+def in_flight_cutoff(now: Optional[datetime] = None) -> datetime:
+    """Creation time before which a PENDING or STARTED task no longer counts as in flight."""
+    return (now or timezone.now()) - timedelta(seconds=settings.FLIGHTS_INFLIGHT_TIMEOUT)
+
+
+def in_flight_tasks(now: Optional[datetime] = None) -> QuerySet:
+    """
+    Tasks still running: PENDING or STARTED and created within
+    ``FLIGHTS_INFLIGHT_TIMEOUT``. Older ones were lost by their worker and
+    neither hold their idempotency key nor hold back re-enrichment.
+    """
+    return EnrichmentTask.objects.filter(status__in=IN_FLIGHT_STATUSES, created_at__gte=in_flight_cutoff(now))
+
+
+def expire_stale(now: Optional[datetime] = None, idempotency_key: Optional[str] = None) -> int:
+    """
+    Fail the PENDING and STARTED tasks older than ``FLIGHTS_INFLIGHT_TIMEOUT``,
+    or only the one holding ``idempotency_key``, and publish the FAILURE.
+
+    Returns:
+        The number of tasks failed
+    """
+    now = now or timezone.now()
+    stale = EnrichmentTask.objects.filter(status__in=IN_FLIGHT_STATUSES, created_at__lt=in_flight_cutoff(now))
+    if idempotency_key is not None:
+        stale = stale.filter(idempotency_key=idempotency_key)
+    task_ids = list(stale.values_list("task_id", flat=True))
+    if not task_ids:
+        return 0
+    # Re-checks the status, so a task that finished meanwhile keeps its result
+    expired = EnrichmentTask.objects.filter(task_id__in=task_ids, status__in=IN_FLIGHT_STATUSES).update(
+        status="FAILURE", result=TIMED_OUT_RESULT, completed_at=now,
+    )
+    status_cache.set_statuses(task_ids, "FAILURE", TIMED_OUT_RESULT)
+    return expired
+
+
+def fail_unpublished(task_ids: List[str], error: Exception) -> int:
+    """
+    Fail PENDING tasks whose message never reached the broker, releasing
+    their idempotency keys, so a retry enqueues a new task instead of being
+    answered with one that will never run.
+
+    Returns:
+        The number of tasks failed
+    """
+    result = {"error": f"Could not enqueue enrichment: {str(error)}"}
+    failed = EnrichmentTask.objects.filter(task_id__in=task_ids, status__in=IN_FLIGHT_STATUSES).update(
+        status="FAILURE", result=result, completed_at=timezone.now(),
+    )
+    status_cache.set_statuses(task_ids, "FAILURE", result)
+    metrics.incr("enqueue_failed", len(task_ids))
+    return failed
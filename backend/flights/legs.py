@@ -0,0 +1,104 @@
+# Standard library imports
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Third-party imports
+from django.conf import settings
+from django.db.models import Prefetch, Q
+
+# Local application imports
+from .models import Flight, FlightLeg
+
+# Columns a leg query returns, the parent flight's id first
+LEG_COLUMNS = (
+    "flight__flight_id", "position", "origin", "destination", "departure_time", "arrival_time",
+    "flight_number", "aircraft_type", "cabin_type", "duration", "layover_time", "distance",
+)
+# The header row of a flight; never its legs
+FLIGHT_HEADER_COLUMNS = (
+    "flight_id", "travel_class", "origin", "destination", "departure_time", "arrival_time", "retail_price",
+)
+
+
+def leg_departures(path: str = "") -> Prefetch:
+    """Prefetch of the legs' departure times, in order, for the flights at ``path``."""
+    return Prefetch(
+        f"{path}flight_legs",
+        queryset=FlightLeg.objects.only("flight", "position", "departure_time").order_by("position"),
+    )
+
+
+def replace_legs(legs_by_flight: Dict[int, List[FlightLeg]]) -> int:
+    """
+    Make each flight's legs exactly the given rows, in one delete and one
+    bulk insert. Call inside the transaction that wrote the flights.
+    """
+    if not legs_by_flight:
+        return 0
+    FlightLeg.objects.filter(flight_id__in=list(legs_by_flight)).delete()
+    rows = []
+    for flight_pk, legs in legs_by_flight.items():
+        for leg in legs:
+            leg.flight_id = flight_pk
+            rows.append(leg)
+    return len(FlightLeg.objects.bulk_create(rows, batch_size=settings.FLIGHTS_LEG_INSERT_BATCH))
+
+
+def find_legs(
+    origin: Optional[str] = None,
+    destination: Optional[str] = None,
+    flight_number: Optional[str] = None,
+    aircraft_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """
+    Legs departing in ``[start, end)``, soonest first.
+
+    At least one of ``origin``, ``destination``, ``flight_number`` or
+    ``aircraft_type`` is required, so every query starts from one of the
+    FlightLeg indexes rather than a scan of all legs.
+    """
+    filters = Q()
+    if origin:
+        filters &= Q(origin=origin.strip().upper())
+    if destination:
+        filters &= Q(destination=destination.strip().upper())
+    if flight_number:
+        filters &= Q(flight_number=flight_number.strip().upper())
+    if aircraft_type:
+        filters &= Q(aircraft_type=aircraft_type.strip())
+    if not filters:
+        raise ValueError("origin, destination, flight_number or aircraft_type is required")
+    legs = FlightLeg.objects.filter(filters, **_window(start, end))
+    return list(legs.order_by("departure_time", "pk").values(*LEG_COLUMNS)[:limit])
+
+
+def flights_through(
+    airport: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """
+    Header rows of the flights with a leg leaving from or arriving at
+    ``airport`` that departs in ``[start, end)``, soonest flight first.
+
+    The legs come from the route index (origin) and the destination index;
+    the flights from their primary key.
+    """
+    code = airport.strip().upper()
+    legs = FlightLeg.objects.filter(Q(origin=code) | Q(destination=code), **_window(start, end))
+    flights = Flight.objects.filter(pk__in=legs.values("flight_id"))
+    return list(flights.order_by("departure_time", "pk").values(*FLIGHT_HEADER_COLUMNS)[:limit])
+
+
+def _window(start: Optional[datetime], end: Optional[datetime]) -> Dict[str, datetime]:
+    window = {}
+    if start is not None:
+        window["departure_time__gte"] = start
+    if end is not None:
+        window["departure_time__lt"] = end
+    return window
+
@@ -0,0 +1,136 @@
+# Standard library imports
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import ThreadingHTTPServer
+from unittest.mock import patch
+from uuid import uuid4
+
+# Third-party imports
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+
+# Local application imports
+from flights import scheduling, status_cache
+from flights.management.commands.bench_http import StubHandler
+from flights.models import Flight, EnrichmentTask
+from flights.serpapi import response_cache
+from flights.tasks import enrich_flight_task, enrich_flights_batch
+
+
+class CountingStubHandler(StubHandler):
+    requests = 0
+    _lock = threading.Lock()
+
+    def do_GET(self):
+        with self._lock:
+            CountingStubHandler.requests += 1
+        super().do_GET()
+
+
+class Command(BaseCommand):
+    help = (
+        "Enrich the same flights with one enrich_flight_task per flight and with "
+        "enrich_flights_batch chunks against a local SerpAPI stub, and report throughput"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--flights", type=int, default=1000, help="Flights to enrich per run")
+        parser.add_argument("--flights-per-search", type=int, default=5, help="Flights sharing each SerpAPI search")
+        parser.add_argument("--chunk-size", type=int, default=settings.FLIGHTS_BATCH_CHUNK_SIZE, help="Flights per batch task")
+        parser.add_argument("--latency-ms", type=float, default=200.0, help="Artificial SerpAPI latency")
+
+    def handle(self, *args, **options):
+        # Run against a scratch database so the development data is never touched
+        path = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+        connections["default"].close()
+        connections.settings["default"]["NAME"] = path
+        call_command("migrate", verbosity=0)
+
+        CountingStubHandler.latency = options["latency_ms"] / 1000
+        server = ThreadingHTTPServer(("127.0.0.1", 0), CountingStubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/search.json"
+        runs = {}
+        try:
+            with patch("flights.serpapi.SERPAPI_URL", url), patch("flights.engine.SERPAPI_URL", url), \
+                    override_settings(SERPAPI_RATE_LIMIT=0, FLIGHTS_ARCHIVE_DIR=""):
+                runs["per-flight task"] = self._run(options, self._per_flight)
+                runs["batch task"] = self._run(options, self._batch)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(
+            f"{'run':<16} {'flights/s':>10} {'queries/flight':>15} {'serpapi calls':>14} {'messages':>9}"
+        )
+        for name, (elapsed, queries, requests, messages) in runs.items():
+            self.stdout.write(
+                f"{name:<16} {options['flights'] / elapsed:>10.1f} {queries / options['flights']:>15.2f} "
+                f"{requests:>14} {messages:>9}"
+            )
+
+    def _run(self, options, enrich):
+        pairs = self._seed(options["flights"], options["flights_per_search"])
+        response_cache.clear()
+        status_cache.clear()
+        CountingStubHandler.requests = 0
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            started = time.perf_counter()
+            messages = enrich(pairs, options)
+            elapsed = time.perf_counter() - started
+        return elapsed, queries, CountingStubHandler.requests, messages
+
+    @staticmethod
+    def _per_flight(pairs, options):
+        # One worker slot taking messages one at a time, each stamped as it was queued
+        headers = scheduling.publish_options("normal")["headers"]
+        for flight_id, task_id in pairs:
+            enrich_flight_task.apply(args=[flight_id], task_id=task_id, headers=headers)
+        return len(pairs)
+
+    @staticmethod
+    def _batch(pairs, options):
+        size = options["chunk_size"]
+        headers = scheduling.publish_options("normal")["headers"]
+        for i in range(0, len(pairs), size):
+            chunk = pairs[i:i + size]
+            enrich_flights_batch.apply(args=[[f for f, _ in chunk], [t for _, t in chunk]], headers=headers)
+        return (len(pairs) + size - 1) // size
+
+    @staticmethod
+    def _seed(count, per_search):
+        EnrichmentTask.objects.all().delete()
+        Flight.objects.all().delete()
+        now = timezone.now()
+        flights = Flight.objects.bulk_create(
+            Flight(
+                flight_id=f"batch-{i}",
+                travel_class="Economy",
+                origin="JFK",
+                destination="ATH",
+                # Flights of one search share its departure and arrival day
+                departure_time=now + timedelta(days=1 + i // per_search, minutes=i % per_search),
+                arrival_time=now + timedelta(days=1 + i // per_search, minutes=i % per_search, hours=1),
+                flight_numbers=[f"XX{i % 50}"],
+                last_seen=now,
+            )
+            for i in range(count)
+        )
+        tasks = EnrichmentTask.objects.bulk_create(
+            EnrichmentTask(task_id=str(uuid4()), flight=flight, status="PENDING") for flight in flights
+        )
+        return [(flight.flight_id, task.task_id) for flight, task in zip(flights, tasks)]
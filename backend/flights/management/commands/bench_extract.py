@@ -0,0 +1,135 @@
+# Standard library imports
+import gc
+import json
+import random
+import statistics
+import time
+from itertools import islice
+from typing import Any, Callable, Dict, List
+
+# Third-party imports
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+# Local application imports
+from flights import decoding
+from flights.archive import read_body, response_archive
+from flights.utils import PRICE_STRATEGIES, extract_price, extract_retail_price, iter_itineraries, itinerary_flight_numbers
+
+AIRPORTS = ["JFK", "ATH", "CAI", "LHR", "CDG", "FRA", "IST", "DOH", "DXB", "FCO"]
+AIRLINES = ["MS", "A3", "TK", "QR", "LH", "AF", "BA", "DL"]
+
+
+def sample_payload(rng: random.Random, itineraries: int = 80) -> Dict[str, Any]:
+    """A google_flights response of realistic size and shape, including the parts we never read."""
+    def airport(code, hour):
+        return {"name": f"{code} International Airport", "id": code, "time": f"2025-06-13 {hour:02d}:{rng.randint(0, 59):02d}"}
+
+    def itinerary():
+        legs = []
+        for _ in range(rng.randint(1, 3)):
+            origin, destination = rng.sample(AIRPORTS, 2)
+            hour = rng.randint(0, 20)
+            legs.append({
+                "departure_airport": airport(origin, hour),
+                "arrival_airport": airport(destination, hour + 3),
+                "duration": rng.randint(60, 700),
+                "airplane": "Boeing 777",
+                "airline": "EgyptAir",
+                "airline_logo": "https://www.gstatic.com/flights/airline_logos/70px/MS.png",
+                "travel_class": "Economy",
+                "flight_number": f"{rng.choice(AIRLINES)} {rng.randint(100, 999)}",
+                "legroom": "31 in",
+                "extensions": ["Average legroom (31 in)", "Wi-Fi for a fee", "In-seat power & USB outlets",
+                               "On-demand video", "Carbon emissions estimate: 512 kg"],
+                "overnight": rng.random() < 0.2,
+            })
+        return {
+            "flights": legs,
+            "layovers": [{"duration": rng.randint(45, 600), "name": "Cairo International Airport", "id": "CAI"}],
+            "total_duration": sum(leg["duration"] for leg in legs),
+            "carbon_emissions": {"this_flight": 512000, "typical_for_this_route": 498000, "difference_percent": 3},
+            "price": rng.randint(300, 3000),
+            "type": "Round trip",
+            "airline_logo": "https://www.gstatic.com/flights/airline_logos/70px/multi.png",
+            "departure_token": "".join(rng.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=160)),
+        }
+
+    best = min(itineraries, 4)
+    return {
+        "search_metadata": {"id": "6650f1", "status": "Success", "created_at": "2025-06-01 10:00:00 UTC",
+                            "google_flights_url": "https://www.google.com/travel/flights?hl=en&gl=us", "total_time_taken": 2.1},
+        "search_parameters": {"engine": "google_flights", "departure_id": "JFK", "arrival_id": "ATH",
+                              "outbound_date": "2025-06-13", "return_date": "2025-06-14", "currency": "USD", "hl": "en"},
+        "best_flights": [itinerary() for _ in range(best)],
+        "other_flights": [itinerary() for _ in range(itineraries - best)],
+        "price_insights": {"lowest_price": 412, "price_level": "typical", "typical_price_range": [400, 700],
+                           "price_history": [[1717200000 + day * 86400, rng.randint(350, 800)] for day in range(60)]},
+        "airports": [{"departure": [{"airport": {"id": "JFK", "name": "John F. Kennedy International Airport"},
+                                     "city": "New York", "country": "United States", "country_code": "US",
+                                     "image": "https://lh5.googleusercontent.com/p/AF1Qip", "thumbnail": "https://serpapi.com/images"}],
+                      "arrival": [{"airport": {"id": "ATH", "name": "Athens International Airport"},
+                                   "city": "Athens", "country": "Greece", "country_code": "GR",
+                                   "image": "https://lh5.googleusercontent.com/p/AF1Qip", "thumbnail": "https://serpapi.com/images"}]}],
+    }
+
+
+class Command(BaseCommand):
+    help = "Time JSON decoding and price extraction per decoder over sample or archived SerpAPI payloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=200, help="Payloads to time")
+        parser.add_argument("--itineraries", type=int, default=80, help="Itineraries per generated payload")
+        parser.add_argument("--from-archive", action="store_true", help="Use archived responses instead of generated ones")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the median is reported")
+
+    def handle(self, *args, **options):
+        bodies = self._bodies(options)
+        if not bodies:
+            self.stderr.write("No payloads to time")
+            return
+        # What the response cache and coalescer hold once a fetch is slimmed
+        slim_bodies = [json.dumps(decoding.slim_response(json.loads(body))).encode() for body in bodies]
+        size = statistics.mean(len(body) for body in bodies)
+        slim_size = statistics.mean(len(body) for body in slim_bodies)
+        self.stdout.write(f"{len(bodies)} payloads, {size / 1024:.1f} KiB mean raw, {slim_size / 1024:.1f} KiB slimmed\n")
+
+        # Price a real itinerary of each payload when matching
+        wanted = [itinerary_flight_numbers(next(iter_itineraries(json.loads(body)), {})) for body in bodies]
+
+        self.stdout.write(f"{'decoder':<8} {'path':<28} {'us/payload':>11}")
+        for backend in decoding.available_backends():
+            with override_settings(FLIGHTS_JSON_DECODER=backend):
+                paths = {
+                    "fetch: loads + first": (bodies, lambda body, _: extract_retail_price(decoding.loads(body))),
+                    "fetch: decode_search": (bodies, lambda body, _: decoding.decode_search(body)),
+                }
+                for strategy in PRICE_STRATEGIES:
+                    paths[f"cache hit: loads + {strategy}"] = (
+                        slim_bodies,
+                        lambda body, numbers, strategy=strategy: extract_price(decoding.loads(body), strategy, numbers),
+                    )
+                for name, (inputs, path) in paths.items():
+                    seconds = self._time(path, inputs, wanted, options["repeat"])
+                    self.stdout.write(f"{backend:<8} {name:<28} {seconds / len(inputs) * 1e6:>11.1f}")
+
+    def _bodies(self, options) -> List[bytes]:
+        if options["from_archive"]:
+            entries = islice(response_archive.entries(), options["samples"])
+            return [
+                read_body(entry["segment"], entry["offset"], entry["length"], decode=lambda body: body)
+                for entry in entries
+            ]
+        rng = random.Random(0)
+        return [json.dumps(sample_payload(rng, options["itineraries"])).encode() for _ in range(options["samples"])]
+
+    def _time(self, path: Callable[[bytes, Any], Any], bodies: List[bytes], wanted: List[Any], repeat: int) -> float:
+        runs = []
+        for _ in range(repeat):
+            # Do not bill one path for freeing the trees the previous one built
+            gc.collect()
+            started = time.perf_counter()
+            for body, numbers in zip(bodies, wanted):
+                path(body, numbers)
+            runs.append(time.perf_counter() - started)
+        return statistics.median(runs)
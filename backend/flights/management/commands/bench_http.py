@@ -0,0 +1,90 @@
+# Standard library imports
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Third-party imports
+import httpx
+from django.core.management.base import BaseCommand
+
+# Local application imports
+from flights.http_client import build_client
+
+# Roughly the size of a google_flights response
+STUB_BODY = json.dumps({
+    "best_flights": [{"price": 500 + i, "flights": [{"flight_number": f"XX{i}"}] * 3} for i in range(50)],
+}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one segment so Nagle/delayed ACK do not skew timings
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(STUB_BODY)))
+        self.end_headers()
+        self.wfile.write(STUB_BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Compare per-task HTTP clients with the pooled worker client against a local stub server"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500, help="Requests per mode")
+        parser.add_argument("--latency-ms", type=float, default=0.0, help="Artificial server latency")
+
+    def handle(self, *args, **options):
+        StubHandler.latency = options["latency_ms"] / 1000
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/search.json"
+        try:
+            per_task = self._run(url, options["requests"], pooled=False)
+            pooled = self._run(url, options["requests"], pooled=True)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(f"{'mode':<10} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+        for name, samples in (("per-task", per_task), ("pooled", pooled)):
+            self.stdout.write(
+                f"{name:<10} {statistics.mean(samples):>9.3f} "
+                f"{self._percentile(samples, 50):>9.3f} {self._percentile(samples, 95):>9.3f}"
+            )
+        saved = statistics.mean(per_task) - statistics.mean(pooled)
+        self.stdout.write(f"Pooled client saves {saved:.3f} ms per task on average")
+
+    def _run(self, url, count, pooled):
+        samples = []
+        client = build_client() if pooled else None
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                if pooled:
+                    client.get(url, params={"engine": "google_flights"}).json()
+                else:
+                    # What each task did before: a fresh client and connection per call
+                    with httpx.Client(timeout=200) as task_client:
+                        task_client.get(url, params={"engine": "google_flights"}).json()
+                samples.append((time.perf_counter() - started) * 1000)
+        finally:
+            if client is not None:
+                client.close()
+        return samples
+
+    @staticmethod
+    def _percentile(samples, pct):
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -0,0 +1,232 @@
+# Standard library imports
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from uuid import uuid4
+
+# Third-party imports
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+
+# Local application imports
+from flights import legs
+from flights.models import Flight, EnrichmentTask, FlightLeg
+
+AIRPORTS = ["JFK", "LAX", "ATH", "CAI", "LHR", "CDG", "FRA", "DXB", "SIN", "HND",
+            "ORD", "ATL", "SFO", "MIA", "BOS", "IST", "MAD", "FCO", "AMS", "DOH"]
+BENCH_ALIAS = "bench"
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch database with flights, their legs and tasks and report query latency "
+        "for each view and endpoint with and without the query indexes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=2_000_000, help="Flights to seed (one task each)")
+        parser.add_argument("--db", help="SQLite file to seed (default: a temporary file); reused if already seeded")
+        parser.add_argument("--repeat", type=int, default=20, help="Runs per query")
+        parser.add_argument("--explain", action="store_true", help="Print each query plan")
+
+    def handle(self, *args, **options):
+        path = options["db"] or os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+        # Benchmark on a scratch database so the development data is never touched
+        connections.settings[BENCH_ALIAS] = {**connections.settings["default"], "NAME": path}
+        call_command("migrate", database=BENCH_ALIAS, verbosity=0)
+
+        existing = Flight.objects.using(BENCH_ALIAS).count()
+        if existing < options["rows"]:
+            self.stdout.write(f"Seeding {options['rows'] - existing} flights into {path} ...")
+            self._seed(existing, options["rows"])
+
+        queries = self._queries()
+        with_indexes = self._measure(queries, options["repeat"], options["explain"])
+        self._drop_indexes()
+        try:
+            without_indexes = self._measure(queries, options["repeat"], options["explain"])
+        finally:
+            self._create_indexes()
+
+        self.stdout.write(f"{'query':<28} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+        for name in queries:
+            before, after = without_indexes[name], with_indexes[name]
+            self.stdout.write(f"{name:<28} {before:>10.3f} {after:>10.3f} {before / max(after, 1e-6):>7.1f}x")
+
+    def _seed(self, start, rows, batch_size=5000):
+        now = timezone.now()
+        statuses = ["SUCCESS"] * 7 + ["FAILURE", "PENDING", "STARTED"]
+        for offset in range(start, rows, batch_size):
+            flights = []
+            for i in range(offset, min(rows, offset + batch_size)):
+                origin, destination = random.sample(AIRPORTS, 2)
+                departure = now + timedelta(minutes=random.randint(-30 * 1440, 365 * 1440))
+                flights.append(Flight(
+                    flight_id=f"bench-{i}",
+                    travel_class="Economy",
+                    origin=origin,
+                    destination=destination,
+                    departure_time=departure,
+                    arrival_time=departure + timedelta(hours=8),
+                    flight_numbers=[f"XX{i % 9000}"],
+                    last_seen=now,
+                    enriched=random.random() < 0.7,
+                ))
+            flights = Flight.objects.using(BENCH_ALIAS).bulk_create(flights)
+            tasks = []
+            for flight in flights:
+                status = random.choice(statuses)
+                tasks.append(EnrichmentTask(
+                    task_id=str(uuid4()),
+                    flight_id=flight.pk,
+                    status=status,
+                    completed_at=now - timedelta(seconds=random.randint(0, 86400 * 30))
+                    if status in ("SUCCESS", "FAILURE") else None,
+                ))
+            EnrichmentTask.objects.using(BENCH_ALIAS).bulk_create(tasks)
+            FlightLeg.objects.using(BENCH_ALIAS).bulk_create(
+                leg for flight in flights for leg in self._legs(flight)
+            )
+
+    @staticmethod
+    def _legs(flight):
+        # Half the flights connect once through another airport
+        stops = [flight.origin, flight.destination]
+        if random.random() < 0.5:
+            stops.insert(1, random.choice([code for code in AIRPORTS if code not in stops]))
+        hours = 8 / (len(stops) - 1)
+        return [
+            FlightLeg(
+                flight_id=flight.pk,
+                position=position,
+                origin=origin,
+                destination=destination,
+                departure_time=flight.departure_time + timedelta(hours=hours * position),
+                arrival_time=flight.departure_time + timedelta(hours=hours * (position + 1)),
+                flight_number=f"XX{random.randint(0, 8999)}",
+                aircraft_type=random.choice(["Boeing 737", "Boeing 777", "Airbus A320", "Airbus A350"]),
+                cabin_type="Economy",
+                duration=int(hours * 60),
+                layover_time=0.0,
+                distance=1000,
+            )
+            for position, (origin, destination) in enumerate(zip(stops, stops[1:]))
+        ]
+
+    def _queries(self):
+        flights = Flight.objects.using(BENCH_ALIAS)
+        tasks = EnrichmentTask.objects.using(BENCH_ALIAS)
+        leg_rows = FlightLeg.objects.using(BENCH_ALIAS)
+        now = timezone.now()
+        sample_task_id = tasks.values_list("task_id", flat=True).first()
+        # A cursor halfway down the flight list, as a deep "next page" link would carry
+        middle = flights.order_by("departure_time", "pk").values_list("departure_time", "pk")[flights.count() // 2]
+        page_fields = ("flight_id", "origin", "destination", "departure_time", "arrival_time",
+                       "travel_class", "retail_price", "enriched")
+        return {
+            "task list view": lambda: list(
+                tasks.filter(status__in=["SUCCESS", "FAILURE"])
+                .only("task_id", "status", "completed_at", "flight")
+                .prefetch_related(Prefetch("flight", queryset=flights.only("flight_id")))
+                .order_by("-completed_at", "pk")[:4]
+            ),
+            "task status endpoint": lambda: tasks.get(task_id=sample_task_id),
+            "pending tasks by status": lambda: list(tasks.filter(status="PENDING").order_by("-completed_at")[:100]),
+            "in-flight task for flight": lambda: tasks.filter(
+                flight_id=1, status__in=["PENDING", "STARTED"]
+            ).exists(),
+            "flight list page": lambda: list(
+                flights.only(*page_fields).order_by("departure_time", "pk")[:101]
+            ),
+            "flight list deep page": lambda: list(
+                flights.only(*page_fields).filter(
+                    Q(departure_time__gt=middle[0]) | Q(departure_time=middle[0], pk__gt=middle[1])
+                ).order_by("departure_time", "pk")[:101]
+            ),
+            "flight list unenriched": lambda: list(
+                flights.only(*page_fields).filter(enriched=False).order_by("departure_time", "pk")[:101]
+            ),
+            "flight list route window": lambda: list(
+                flights.only(*page_fields).filter(
+                    origin="JFK", destination="ATH", departure_time__gte=now,
+                ).order_by("departure_time", "pk")[:101]
+            ),
+            "unenriched backlog scan": lambda: list(
+                flights.filter(enriched=False).order_by("departure_time").values_list("pk", flat=True)[:500]
+            ),
+            "route + date window": lambda: list(flights.filter(
+                origin="JFK", destination="ATH",
+                departure_time__range=(now, now + timedelta(days=30)),
+            ).values_list("pk", "departure_time")),
+            "departures next 24h": lambda: flights.filter(
+                departure_time__range=(now, now + timedelta(days=1))
+            ).count(),
+            "legs on route window": lambda: list(
+                leg_rows.filter(origin="JFK", destination="CAI", departure_time__gte=now)
+                .order_by("departure_time", "pk").values(*legs.LEG_COLUMNS)[:100]
+            ),
+            "legs by flight number": lambda: list(
+                leg_rows.filter(flight_number="XX42").order_by("departure_time", "pk").values(*legs.LEG_COLUMNS)[:100]
+            ),
+            "legs by aircraft": lambda: list(
+                leg_rows.filter(aircraft_type="Airbus A350", departure_time__gte=now)
+                .order_by("departure_time", "pk").values(*legs.LEG_COLUMNS)[:100]
+            ),
+            "flights through airport": lambda: list(
+                flights.filter(pk__in=leg_rows.filter(
+                    Q(origin="CAI") | Q(destination="CAI"),
+                    departure_time__range=(now, now + timedelta(days=7)),
+                ).values("flight_id")).order_by("departure_time", "pk").values(*legs.FLIGHT_HEADER_COLUMNS)[:100]
+            ),
+        }
+
+    def _measure(self, queries, repeat, explain):
+        results = {}
+        for name, run in queries.items():
+            run()  # warm the page cache
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                samples.append((time.perf_counter() - started) * 1000)
+            results[name] = statistics.median(samples)
+        if explain:
+            self._explain(queries)
+        return results
+
+    def _explain(self, queries):
+        connection = connections[BENCH_ALIAS]
+        for name, run in queries.items():
+            connection.queries_log.clear()
+            connection.force_debug_cursor = True
+            try:
+                run()
+            finally:
+                connection.force_debug_cursor = False
+            # Every statement the query ran, prefetches included
+            plans = []
+            with connection.cursor() as cursor:
+                for query in list(connection.queries_log):
+                    cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                    plans.append("; ".join(row[-1] for row in cursor.fetchall()))
+            self.stdout.write(f"  {name}: {' | '.join(plans)}")
+
+    @staticmethod
+    def _indexes():
+        return [(model, index) for model in (Flight, EnrichmentTask, FlightLeg) for index in model._meta.indexes]
+
+    def _drop_indexes(self):
+        with connections[BENCH_ALIAS].schema_editor() as editor:
+            for model, index in self._indexes():
+                editor.remove_index(model, index)
+
+    def _create_indexes(self):
+        with connections[BENCH_ALIAS].schema_editor() as editor:
+            for model, index in self._indexes():
+                editor.add_index(model, index)
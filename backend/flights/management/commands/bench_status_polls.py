@@ -0,0 +1,116 @@
+# Standard library imports
+import os
+import random
+import tempfile
+import time
+from uuid import uuid4
+
+# Third-party imports
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+
+# Local application imports
+from flights import status_cache
+from flights.models import Flight, EnrichmentTask
+from flights.tasks import finish_task, set_task_status
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate a storm of GET /task-status polls while tasks move through their "
+        "states, and report database queries per poll with and without the status cache"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tasks", type=int, default=2000, help="Tasks being polled")
+        parser.add_argument("--polls-per-transition", type=int, default=20,
+                            help="Polls made between two status transitions")
+        parser.add_argument("--failure-rate", type=float, default=0.1, help="Share of tasks ending in FAILURE")
+
+    def handle(self, *args, **options):
+        # Run against a scratch database so the development data is never touched
+        path = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+        connections["default"].close()
+        connections.settings["default"]["NAME"] = path
+        call_command("migrate", verbosity=0)
+
+        results = {}
+        for name, enabled in (("database only", False), ("status cache", True)):
+            task_ids = self._seed(options["tasks"])
+            status_cache.clear()
+            with override_settings(FLIGHTS_STATUS_CACHE=enabled):
+                if enabled:
+                    status_cache.set_statuses(task_ids, "PENDING")
+                results[name] = self._storm(task_ids, options)
+
+        self.stdout.write(f"{'run':<15} {'polls':>9} {'db queries':>11} {'queries/poll':>13} {'us/poll':>9}")
+        for name, (polls, queries, elapsed) in results.items():
+            self.stdout.write(
+                f"{name:<15} {polls:>9} {queries:>11} {queries / polls:>13.3f} {elapsed / polls * 1e6:>9.1f}"
+            )
+
+    def _seed(self, count):
+        EnrichmentTask.objects.all().delete()
+        Flight.objects.all().delete()
+        now = timezone.now()
+        flights = Flight.objects.bulk_create(
+            Flight(
+                flight_id=f"poll-{i}",
+                travel_class="Economy",
+                origin="JFK",
+                destination="ATH",
+                departure_time=now,
+                arrival_time=now,
+                flight_numbers=[],
+                last_seen=now,
+            )
+            for i in range(count)
+        )
+        tasks = EnrichmentTask.objects.bulk_create(
+            EnrichmentTask(task_id=str(uuid4()), flight=flight, status="PENDING") for flight in flights
+        )
+        return [task.task_id for task in tasks]
+
+    def _storm(self, task_ids, options):
+        """
+        Replay every task moving PENDING -> STARTED -> SUCCESS/FAILURE, with a
+        burst of polls on random tasks between transitions, and count the
+        queries the polls issue.
+        """
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        # Workers pick tasks up in random order and finish them a little later
+        order = random.sample(task_ids, len(task_ids))
+        transitions = []
+        for i, task_id in enumerate(order):
+            transitions.append(("STARTED", task_id))
+            if i >= 10:
+                transitions.append(("DONE", order[i - 10]))
+        transitions.extend(("DONE", task_id) for task_id in order[-10:])
+
+        polls = 0
+        elapsed = 0.0
+        for kind, task_id in transitions:
+            if kind == "STARTED":
+                set_task_status(task_id, "STARTED")
+            elif random.random() < options["failure_rate"]:
+                finish_task(task_id, "FAILURE", {"error": "HTTP error occurred"})
+            else:
+                finish_task(task_id, "SUCCESS", {"retail_price": 100})
+
+            polled = random.choices(task_ids, k=options["polls_per_transition"])
+            started = time.perf_counter()
+            with connection.execute_wrapper(count_query):
+                for poll_id in polled:
+                    status_cache.load_status(poll_id)
+            elapsed += time.perf_counter() - started
+            polls += len(polled)
+        return polls, queries, elapsed
@@ -0,0 +1,49 @@
+# Standard library imports
+import json
+import sys
+
+# Third-party imports
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Ingest newline-delimited FlightData records from a file (use - for stdin)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path to a .jsonl feed, or - to read stdin")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.FLIGHTS_INGEST_CHUNK_SIZE,
+            help="Number of lines validated and flushed to the DB and queue at a time",
+        )
+
+    def handle(self, *args, **options):
+        # The validation models live in the FastAPI package next to the Django project
+        project_root = str(settings.BASE_DIR.parent)
+        if project_root not in sys.path:
+            sys.path.insert(0, project_root)
+        from api.ingest import ingest_lines
+
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        if options["path"] == "-":
+            self._ingest(sys.stdin.buffer, options["chunk_size"], ingest_lines)
+            return
+        try:
+            with open(options["path"], "rb") as feed:
+                self._ingest(feed, options["chunk_size"], ingest_lines)
+        except FileNotFoundError:
+            raise CommandError(f"File not found: {options['path']}")
+
+    def _ingest(self, feed, chunk_size, ingest_lines):
+        accepted = invalid = 0
+        for result in ingest_lines(feed, chunk_size):
+            if result["status"] == "INVALID":
+                invalid += 1
+            else:
+                accepted += 1
+            self.stdout.write(json.dumps(result))
+        self.stderr.write(f"Ingested {accepted} flights, {invalid} invalid lines")
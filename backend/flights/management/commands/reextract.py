@@ -0,0 +1,178 @@
+# Standard library imports
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Third-party imports
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Local application imports
+from flights.archive import read_body, response_archive
+from flights.decoding import decode_search
+from flights.legs import leg_departures
+from flights.models import Flight
+from flights.serpapi import SEARCH_FIELDS, build_search_params, search_key
+from flights.pricing import PRICING_FIELDS, flight_itinerary
+from flights.utils import PRICE_FALLBACKS, PRICE_STRATEGIES, ItineraryIndex, extract_price, normalize_departure
+
+# (flight numbers, leg departure times); empty unless matching
+Itinerary = Tuple[Tuple[str, ...], Tuple[str, ...]]
+Item = Tuple[str, int, int, List[Itinerary]]
+# Where the newest response of a search is: (segment, offset, length, fetched_at)
+Location = Tuple[str, int, int, float]
+
+
+def extract_prices(
+    segment: str, items: List[Item], strategy: str, fallback: str
+) -> List[Tuple[str, Dict[Itinerary, Optional[float]], Optional[str]]]:
+    """
+    Worker: decode each ``(key, offset, length, itineraries)`` body of one
+    segment and price every itinerary asked for, indexing the body once.
+    """
+    results = []
+    for key, offset, length, itineraries in items:
+        try:
+            data = read_body(segment, offset, length, decode=decode_search)
+            if strategy == "match":
+                index = ItineraryIndex(data)
+                prices = {it: index.lookup(*it, fallback=fallback) for it in itineraries}
+            else:
+                price = extract_price(data, strategy)
+                prices = {it: price for it in itineraries}
+        except (OSError, ValueError) as e:
+            results.append((key, {}, str(e)))
+        else:
+            results.append((key, prices, None))
+    return results
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-run price extraction over the archived SerpAPI responses and backfill "
+        "flight prices, without calling SerpAPI"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Extraction processes")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Responses per worker job")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Flights per bulk update")
+        parser.add_argument("--strategy", choices=PRICE_STRATEGIES, help="How to pick each flight's price (default: FLIGHTS_PRICE_STRATEGY)")
+        parser.add_argument("--fallback", choices=PRICE_FALLBACKS, help="Price when matching finds no itinerary (default: FLIGHTS_PRICE_FALLBACK)")
+        parser.add_argument("--dry-run", action="store_true", help="Extract and report without writing")
+
+    def handle(self, *args, **options):
+        if response_archive.root is None:
+            self.stderr.write("The response archive is disabled (FLIGHTS_ARCHIVE_DIR is empty)")
+            return
+
+        # The newest archived response per search is the one a fresh enrichment
+        # would have used; only where it is stored is kept, never the index entry
+        latest: Dict[str, Location] = {}
+        scanned = 0
+        for entry in response_archive.entries():
+            scanned += 1
+            current = latest.get(entry["key"])
+            if current is None or entry["fetched_at"] >= current[3]:
+                latest[entry["key"]] = (entry["segment"], entry["offset"], entry["length"], entry["fetched_at"])
+
+        self.latest = latest
+        self.options = options
+        self.strategy = options["strategy"] or settings.FLIGHTS_PRICE_STRATEGY
+        self.fallback = options["fallback"] or settings.FLIGHTS_PRICE_FALLBACK
+        self.extracted = self.errors = self.updated = 0
+        fields = ("pk", "enriched_at", *SEARCH_FIELDS)
+        queryset = Flight.objects.all()
+        if self.strategy == "match":
+            fields += PRICING_FIELDS
+            queryset = queryset.prefetch_related(leg_departures())
+        # Route and departure order brings the flights of one search together
+        flights = queryset.only(*fields).order_by("origin", "destination", "departure_time", "pk")
+
+        # Flights go through in batches of --batch-size, each extracted while the
+        # next is read and written as soon as its prices are in, so at most
+        # --workers batches are held at once
+        workers = max(1, options["workers"])
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        pending: Deque[Tuple[Dict[str, List[Flight]], List[Any]]] = deque()
+        batch: Dict[str, List[Flight]] = {}
+        size = 0
+        try:
+            for flight in flights.iterator(chunk_size=options["batch_size"]):
+                key = search_key(build_search_params(flight))
+                if key not in latest:
+                    continue
+                # Cut batches between searches, so each response is decoded once
+                if size >= options["batch_size"] and key not in batch:
+                    pending.append((batch, self._extract(batch, pool)))
+                    batch, size = {}, 0
+                    if len(pending) > workers:
+                        self._write(*pending.popleft())
+                batch.setdefault(key, []).append(flight)
+                size += 1
+            if batch:
+                pending.append((batch, self._extract(batch, pool)))
+            while pending:
+                self._write(*pending.popleft())
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        self.stdout.write(
+            f"Scanned {scanned} archived fetches for {len(latest)} searches; "
+            f"extracted {self.extracted} responses ({self.errors} errors); "
+            f"{'would update' if options['dry_run'] else 'updated'} {self.updated} flights"
+        )
+
+    def _extract(self, batch: Dict[str, List[Flight]], pool: Optional[ProcessPoolExecutor]) -> List[Any]:
+        """Start pricing one batch: a future per chunk of responses, or the results themselves without a pool."""
+        jobs: Dict[str, List[Item]] = {}
+        for key, matching in batch.items():
+            segment, offset, length, _ = self.latest[key]
+            itineraries = list({self._itinerary(flight, self.strategy) for flight in matching})
+            jobs.setdefault(segment, []).append((key, offset, length, itineraries))
+        chunk_size = self.options["chunk_size"]
+        chunks = [
+            (segment, items[start:start + chunk_size])
+            for segment, items in jobs.items()
+            for start in range(0, len(items), chunk_size)
+        ]
+        if pool is None:
+            return [extract_prices(segment, items, self.strategy, self.fallback) for segment, items in chunks]
+        return [pool.submit(extract_prices, segment, items, self.strategy, self.fallback) for segment, items in chunks]
+
+    def _write(self, batch: Dict[str, List[Flight]], chunks: List[Any]) -> None:
+        """Apply one batch's extracted prices and bulk update its flights."""
+        updates = []
+        for chunk in chunks:
+            for key, prices, error in (chunk.result() if isinstance(chunk, Future) else chunk):
+                self.extracted += 1
+                if error is not None:
+                    self.errors += 1
+                    self.stderr.write(f"{key}: {error}")
+                    continue
+                fetched_at = datetime.fromtimestamp(self.latest[key][3], tz=dt_timezone.utc)
+                for flight in batch[key]:
+                    price = prices[self._itinerary(flight, self.strategy)]
+                    if price is None:
+                        continue
+                    flight.retail_price = price
+                    flight.enriched = True
+                    # Keep the refresh schedule of flights priced since
+                    flight.enriched_at = flight.enriched_at or fetched_at
+                    updates.append(flight)
+        if not self.options["dry_run"]:
+            Flight.objects.bulk_update(
+                updates, ["retail_price", "enriched", "enriched_at"], batch_size=self.options["batch_size"]
+            )
+        self.updated += len(updates)
+
+    @staticmethod
+    def _itinerary(flight: Flight, strategy: str) -> Itinerary:
+        # Only matching depends on the flight; the other strategies price the search once
+        if strategy != "match":
+            return (), ()
+        flight_numbers, departures = flight_itinerary(flight)
+        return tuple(flight_numbers), tuple(normalize_departure(departure) for departure in departures)
@@ -0,0 +1,46 @@
+# Standard library imports
+import threading
+from collections import Counter
+from typing import Dict, Union
+
+# Third-party imports
+import redis
+
+# Local application imports
+from .redis_client import get_redis, mark_unavailable
+
+METRICS_KEY = "flights:metrics"
+
+_local: Counter = Counter()
+_lock = threading.Lock()
+
+
+def incr(name: str, amount: Union[int, float] = 1) -> None:
+    """Add ``amount`` to a counter shared by every worker and API process."""
+    with _lock:
+        _local[name] += amount
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        if isinstance(amount, float):
+            client.hincrbyfloat(METRICS_KEY, name, amount)
+        else:
+            client.hincrby(METRICS_KEY, name, amount)
+    except redis.RedisError:
+        mark_unavailable()
+
+
+def snapshot() -> Dict[str, float]:
+    """Return all counters, falling back to this process's view without Redis."""
+    client = get_redis()
+    if client is not None:
+        try:
+            return {
+                name.decode(): float(value)
+                for name, value in sorted(client.hgetall(METRICS_KEY).items())
+            }
+        except redis.RedisError:
+            mark_unavailable()
+    with _lock:
+        return {name: float(value) for name, value in sorted(_local.items())}
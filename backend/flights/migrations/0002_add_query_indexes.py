@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='enrichmenttask',
+            index=models.Index(fields=['status', '-completed_at'], name='task_status_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrichmenttask',
+            index=models.Index(condition=models.Q(('status__in', ['SUCCESS', 'FAILURE'])), fields=['-completed_at'], name='task_finished_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrichmenttask',
+            index=models.Index(condition=models.Q(('status__in', ['PENDING', 'STARTED'])), fields=['flight'], name='task_inflight_flight_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['origin', 'destination', 'departure_time'], name='flight_route_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['departure_time'], name='flight_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(condition=models.Q(('enriched', False)), fields=['departure_time'], name='flight_unenriched_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0002_add_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='enriched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(condition=models.Q(('enriched', True)), fields=['departure_time', 'id'], name='flight_refresh_idx'),
+        ),
+    ]
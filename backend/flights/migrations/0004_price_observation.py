@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0003_flight_enriched_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('route', models.CharField(max_length=21)),
+                ('departure_date', models.DateField()),
+                ('observed_at', models.DateTimeField()),
+                ('price_cents', models.PositiveIntegerField()),
+                ('currency', models.PositiveSmallIntegerField(default=840)),
+                ('resolution', models.PositiveSmallIntegerField(choices=[(0, 'raw'), (1, 'daily')], default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['route', 'currency', 'observed_at', 'price_cents'], name='price_route_observed_idx'), models.Index(condition=models.Q(('resolution', 0)), fields=['observed_at'], name='price_raw_observed_idx')],
+            },
+        ),
+    ]
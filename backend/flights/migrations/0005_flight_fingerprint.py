@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0004_price_observation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
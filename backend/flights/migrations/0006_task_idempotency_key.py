@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0005_flight_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrichmenttask',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='enrichmenttask',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['PENDING', 'STARTED'])), fields=('idempotency_key',), name='task_inflight_idempotency_key'),
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:25
+
+from datetime import timezone as dt_timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+
+BATCH_SIZE = 1000
+LEG_TIMES = ("departure_time", "arrival_time")
+
+
+def _moment(value, default):
+    moment = parse_datetime(value) if isinstance(value, str) else None
+    if moment is None:
+        return default
+    return moment if moment.tzinfo else moment.replace(tzinfo=dt_timezone.utc)
+
+
+def copy_legs_to_rows(apps, schema_editor):
+    """One FlightLeg row per entry of every flight's legs JSON."""
+    Flight = apps.get_model('flights', 'Flight')
+    FlightLeg = apps.get_model('flights', 'FlightLeg')
+    db = schema_editor.connection.alias
+    rows = []
+    flights = Flight.objects.using(db).only('pk', 'departure_time', 'arrival_time', 'legs')
+    for flight in flights.iterator(chunk_size=BATCH_SIZE):
+        for position, leg in enumerate(flight.legs or []):
+            if not isinstance(leg, dict):
+                continue
+            rows.append(FlightLeg(
+                flight_id=flight.pk,
+                position=position,
+                origin=leg.get('origin') or '',
+                destination=leg.get('destination') or '',
+                # Legs stored without times take the flight's
+                departure_time=_moment(leg.get('departure_time'), flight.departure_time),
+                arrival_time=_moment(leg.get('arrival_time'), flight.arrival_time),
+                flight_number=leg.get('flight_number') or '',
+                aircraft_type=leg.get('aircraft_type') or '',
+                cabin_type=leg.get('cabin_type') or '',
+                duration=leg.get('duration') or 0,
+                layover_time=leg.get('layover_time') or 0,
+                distance=leg.get('distance') or 0,
+            ))
+        if len(rows) >= BATCH_SIZE:
+            FlightLeg.objects.using(db).bulk_create(rows)
+            rows = []
+    FlightLeg.objects.using(db).bulk_create(rows)
+
+
+def copy_rows_to_legs(apps, schema_editor):
+    """Rebuild the legs JSON from the FlightLeg rows."""
+    Flight = apps.get_model('flights', 'Flight')
+    FlightLeg = apps.get_model('flights', 'FlightLeg')
+    db = schema_editor.connection.alias
+    legs = {}
+    for leg in FlightLeg.objects.using(db).order_by('flight_id', 'position').values().iterator(chunk_size=BATCH_SIZE):
+        flight_id = leg.pop('flight_id')
+        for name in ('id', 'position'):
+            leg.pop(name)
+        for name in LEG_TIMES:
+            leg[name] = leg[name].isoformat()
+        legs.setdefault(flight_id, []).append(leg)
+    flights = [Flight(pk=pk, legs=value) for pk, value in legs.items()]
+    Flight.objects.using(db).bulk_update(flights, ['legs'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0006_task_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightLeg',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('origin', models.CharField(max_length=10)),
+                ('destination', models.CharField(max_length=10)),
+                ('departure_time', models.DateTimeField()),
+                ('arrival_time', models.DateTimeField()),
+                ('flight_number', models.CharField(max_length=20)),
+                ('aircraft_type', models.CharField(max_length=100)),
+                ('cabin_type', models.CharField(max_length=50)),
+                ('duration', models.PositiveIntegerField()),
+                ('layover_time', models.FloatField()),
+                ('distance', models.PositiveIntegerField()),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='flight_legs', to='flights.flight')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['origin', 'destination', 'departure_time'], name='leg_route_departure_idx'), models.Index(fields=['destination', 'departure_time'], name='leg_destination_departure_idx'), models.Index(fields=['flight_number', 'departure_time'], name='leg_flight_number_idx'), models.Index(fields=['aircraft_type', 'departure_time'], name='leg_aircraft_idx')],
+                'constraints': [models.UniqueConstraint(fields=('flight', 'position'), name='leg_flight_position_unique')],
+            },
+        ),
+        migrations.RunPython(copy_legs_to_rows, copy_rows_to_legs),
+        # Lets the column be re-added on rollback
+        migrations.AlterField(
+            model_name='flight',
+            name='legs',
+            field=models.JSONField(default=list),
+        ),
+        migrations.RemoveField(
+            model_name='flight',
+            name='legs',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0007_flight_leg'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrichmenttask',
+            name='request_fingerprint',
+            field=models.CharField(blank=True, max_length=133, null=True),
+        ),
+    ]
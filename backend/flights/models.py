@@ -8,17 +8,79 @@ class Flight(models.Model):
     destination = models.CharField(max_length=10)
     departure_time = models.DateTimeField()
     arrival_time = models.DateTimeField()
-    flight_numbers = models.JSONField()  # List of strings
-    legs = models.JSONField()            # List of dicts with leg info
+    flight_numbers = models.JSONField()  # List of strings; the legs are FlightLeg rows
     last_seen = models.DateTimeField()
+    # Hash of the itinerary-defining fields, so re-posts of the same flight are recognised
+    fingerprint = models.CharField(max_length=32, blank=True, default="")
 
     retail_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     enriched = models.BooleanField(default=False)
+    enriched_at = models.DateTimeField(null=True, blank=True)  # when retail_price was last fetched
+
+    class Meta:
+        indexes = [
+            # Route searches: origin/destination equality plus a departure window
+            models.Index(fields=["origin", "destination", "departure_time"], name="flight_route_departure_idx"),
+            # Date-window scans and listings across all routes
+            models.Index(fields=["departure_time"], name="flight_departure_idx"),
+            # Backlog of flights still waiting for a price, soonest departure first
+            models.Index(
+                fields=["departure_time"],
+                name="flight_unenriched_idx",
+                condition=models.Q(enriched=False),
+            ),
+            # Keyset scan of priced flights for re-enrichment, soonest departure first
+            models.Index(
+                fields=["departure_time", "id"],
+                name="flight_refresh_idx",
+                condition=models.Q(enriched=True),
+            ),
+        ]
 
     def __str__(self):
         return self.flight_id
 
 
+class FlightLeg(models.Model):
+    """
+    One leg of a flight's itinerary, ``position`` 0 first.
+
+    Legs are rows rather than a JSON list on Flight so route, airport,
+    flight number and aircraft questions are index lookups, and reading a
+    flight never loads its legs unless asked to.
+    """
+    flight = models.ForeignKey(Flight, on_delete=models.CASCADE, related_name="flight_legs")
+    position = models.PositiveSmallIntegerField()
+    origin = models.CharField(max_length=10)
+    destination = models.CharField(max_length=10)
+    departure_time = models.DateTimeField()
+    arrival_time = models.DateTimeField()
+    flight_number = models.CharField(max_length=20)
+    aircraft_type = models.CharField(max_length=100)
+    cabin_type = models.CharField(max_length=50)
+    duration = models.PositiveIntegerField()  # minutes
+    layover_time = models.FloatField()
+    distance = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["flight", "position"], name="leg_flight_position_unique"),
+        ]
+        indexes = [
+            # Legs flown on a route in a departure window; origin alone covers departures from an airport
+            models.Index(fields=["origin", "destination", "departure_time"], name="leg_route_departure_idx"),
+            # Arrivals into an airport in a departure window
+            models.Index(fields=["destination", "departure_time"], name="leg_destination_departure_idx"),
+            # Every flight sharing one flight number
+            models.Index(fields=["flight_number", "departure_time"], name="leg_flight_number_idx"),
+            # Every leg flown on one aircraft type
+            models.Index(fields=["aircraft_type", "departure_time"], name="leg_aircraft_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.flight_number} {self.origin}-{self.destination}"
+
+
 class EnrichmentTask(models.Model):
     task_id = models.CharField(max_length=255, unique=True)
     flight = models.ForeignKey(Flight, on_delete=models.CASCADE)
@@ -26,6 +88,75 @@ class EnrichmentTask(models.Model):
     result = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    # Set by POST /enrich-flight; at most one PENDING/STARTED task holds a key
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+    # "<flight_id>:<fingerprint>" of the request that claimed the key, so reusing it for another is rejected
+    request_fingerprint = models.CharField(max_length=133, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Duplicate POSTs lose the insert race and are answered with the winner's task
+            models.UniqueConstraint(
+                fields=["idempotency_key"],
+                name="task_inflight_idempotency_key",
+                condition=models.Q(status__in=["PENDING", "STARTED"]),
+            ),
+        ]
+        indexes = [
+            # Status filters, newest completion first
+            models.Index(fields=["status", "-completed_at"], name="task_status_completed_idx"),
+            # The completed-task dashboard only ever reads terminal rows
+            models.Index(
+                fields=["-completed_at"],
+                name="task_finished_idx",
+                condition=models.Q(status__in=["SUCCESS", "FAILURE"]),
+            ),
+            # In-flight tasks per flight, so re-enrichment can skip flights already queued
+            models.Index(
+                fields=["flight"],
+                name="task_inflight_flight_idx",
+                condition=models.Q(status__in=["PENDING", "STARTED"]),
+            ),
+        ]
 
     def __str__(self):
         return f"Task {self.task_id} - {self.status}"
+
+
+class PriceObservation(models.Model):
+    """
+    One observed fare, kept as history after ``Flight.retail_price`` moves on.
+
+    Rows are kept small: the route is a short ``"JFK-ATH"`` key, prices are
+    integer cents and currencies their ISO 4217 numeric code. Raw rows are
+    later compacted into one DAILY row per route, departure date and day
+    holding that day's minimum.
+    """
+    RAW = 0
+    DAILY = 1
+    RESOLUTIONS = [(RAW, "raw"), (DAILY, "daily")]
+
+    route = models.CharField(max_length=21)
+    departure_date = models.DateField()
+    observed_at = models.DateTimeField()
+    price_cents = models.PositiveIntegerField()
+    currency = models.PositiveSmallIntegerField(default=840)
+    resolution = models.PositiveSmallIntegerField(choices=RESOLUTIONS, default=RAW)
+
+    class Meta:
+        indexes = [
+            # Route history over a time range; covers min/max price aggregates
+            models.Index(
+                fields=["route", "currency", "observed_at", "price_cents"],
+                name="price_route_observed_idx",
+            ),
+            # Oldest raw rows first, for downsampling
+            models.Index(
+                fields=["observed_at"],
+                name="price_raw_observed_idx",
+                condition=models.Q(resolution=0),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.route} {self.departure_date} {self.price_cents / 100:.2f} @ {self.observed_at}"
@@ -0,0 +1,142 @@
+# Standard library imports
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Third-party imports
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+# Local application imports
+from .models import PriceObservation
+
+# ISO 4217 numeric codes
+CURRENCY_CODES = {
+    "USD": 840,
+    "EUR": 978,
+    "GBP": 826,
+    "CAD": 124,
+    "AUD": 36,
+    "CHF": 756,
+    "JPY": 392,
+}
+CURRENCY_NAMES = {code: name for name, code in CURRENCY_CODES.items()}
+
+
+def route_key(origin: str, destination: str) -> str:
+    return f"{origin.strip().upper()}-{destination.strip().upper()}"
+
+
+def to_cents(price: float) -> int:
+    return int((Decimal(str(price)) * 100).quantize(Decimal(1)))
+
+
+def observation_for(
+    params: Dict[str, Any],
+    retail_price: Optional[float],
+    observed_at: datetime,
+) -> Optional[PriceObservation]:
+    """Build the observation a priced SerpAPI search represents, or None if it found no price."""
+    currency = CURRENCY_CODES.get(params.get("currency", "USD").upper())
+    if retail_price is None or currency is None:
+        return None
+    return PriceObservation(
+        route=route_key(params["departure_id"], params["arrival_id"]),
+        departure_date=date.fromisoformat(params["outbound_date"]),
+        observed_at=observed_at,
+        price_cents=to_cents(retail_price),
+        currency=currency,
+    )
+
+
+def record_observations(observations: Iterable[PriceObservation]) -> int:
+    """Bulk insert observations in batches of ``FLIGHTS_PRICE_INSERT_BATCH``."""
+    created = PriceObservation.objects.bulk_create(
+        observations, batch_size=settings.FLIGHTS_PRICE_INSERT_BATCH
+    )
+    return len(created)
+
+
+def min_price_per_day(
+    origin: str,
+    destination: str,
+    start: datetime,
+    end: datetime,
+    currency: str = "USD",
+) -> List[Tuple[date, int]]:
+    """
+    Lowest observed price in cents per observation day for a route.
+
+    Reads raw and downsampled rows alike, from ``price_route_observed_idx``
+    alone.
+    """
+    rows = (
+        PriceObservation.objects.filter(
+            route=route_key(origin, destination),
+            currency=CURRENCY_CODES[currency.upper()],
+            observed_at__gte=start,
+            observed_at__lt=end,
+        )
+        .annotate(day=TruncDate("observed_at"))
+        .values("day")
+        .annotate(price=Min("price_cents"))
+        .order_by("day")
+        .values_list("day", "price")
+    )
+    return list(rows)
+
+
+def downsample(now: Optional[datetime] = None) -> Tuple[int, int]:
+    """
+    Compact old raw observations and drop expired history.
+
+    Raw rows older than ``FLIGHTS_PRICE_RAW_RETENTION_DAYS`` are replaced by
+    one DAILY row per route, currency, departure date and day with that day's
+    minimum, at most ``FLIGHTS_PRICE_DOWNSAMPLE_DAYS`` days per run, oldest
+    first. DAILY rows older than ``FLIGHTS_PRICE_DAILY_RETENTION_DAYS`` are
+    deleted.
+
+    Returns:
+        (raw rows compacted, daily rows deleted)
+    """
+    now = now or timezone.now()
+    # Windows follow the day boundaries TruncDate uses
+    zone = timezone.get_current_timezone()
+    cutoff = datetime.combine(
+        timezone.localdate(now - timedelta(days=settings.FLIGHTS_PRICE_RAW_RETENTION_DAYS)), time.min, tzinfo=zone
+    )
+    raw = PriceObservation.objects.filter(resolution=PriceObservation.RAW)
+    oldest = raw.filter(observed_at__lt=cutoff).order_by("observed_at").values_list("observed_at", flat=True).first()
+    compacted = 0
+    if oldest is not None:
+        window_start = datetime.combine(timezone.localdate(oldest), time.min, tzinfo=zone)
+        window_end = min(cutoff, window_start + timedelta(days=settings.FLIGHTS_PRICE_DOWNSAMPLE_DAYS))
+        window = raw.filter(observed_at__gte=window_start, observed_at__lt=window_end)
+        daily = [
+            PriceObservation(
+                route=row["route"],
+                currency=row["currency"],
+                departure_date=row["departure_date"],
+                observed_at=datetime.combine(row["day"], time.min, tzinfo=zone),
+                price_cents=row["price"],
+                resolution=PriceObservation.DAILY,
+            )
+            for row in (
+                window.annotate(day=TruncDate("observed_at"))
+                .values("route", "currency", "departure_date", "day")
+                .annotate(price=Min("price_cents"))
+                .order_by()
+            )
+        ]
+        with transaction.atomic():
+            compacted, _ = window.delete()
+            record_observations(daily)
+
+    expired, _ = PriceObservation.objects.filter(
+        resolution=PriceObservation.DAILY,
+        observed_at__lt=now - timedelta(days=settings.FLIGHTS_PRICE_DAILY_RETENTION_DAYS),
+    ).delete()
+    return compacted, expired
@@ -0,0 +1,101 @@
+# Standard library imports
+from datetime import datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+# Third-party imports
+from django.conf import settings
+
+# Local application imports
+from . import metrics
+from .legs import leg_departures
+from .models import Flight
+from .utils import ItineraryIndex, extract_price
+
+# Flight columns read to price a flight from a search response, along with
+# the legs' departure times (``leg_departures``)
+PRICING_FIELDS = ("flight_numbers",)
+
+
+def flight_itinerary(flight: Flight) -> Tuple[List[str], List[Any]]:
+    """Our flight numbers and, when there is one leg per number, the legs' departure times."""
+    departures = [leg.departure_time for leg in flight.flight_legs.all()]
+    if len(departures) != len(flight.flight_numbers):
+        departures = []
+    return flight.flight_numbers, departures
+
+
+class SearchPricer:
+    """
+    Prices flights from one search response.
+
+    With the ``match`` strategy the response is indexed once and each flight
+    costs one lookup; the other strategies give every flight the same price.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self.strategy = settings.FLIGHTS_PRICE_STRATEGY
+        if self.strategy == "match":
+            self._index = ItineraryIndex(data)
+        else:
+            self._price = extract_price(data, self.strategy)
+
+    def price(self, flight: Flight) -> Optional[float]:
+        if self.strategy != "match":
+            return self._price
+        return self._index.lookup(*flight_itinerary(flight), fallback=settings.FLIGHTS_PRICE_FALLBACK)
+
+
+def _day(moment: datetime) -> Tuple[datetime, datetime]:
+    start = datetime.combine(moment.date(), time.min, tzinfo=moment.tzinfo)
+    return start, start + timedelta(days=1)
+
+
+def search_siblings(flight: Flight):
+    """
+    Flights that produce the same SerpAPI search as ``flight``, itself included:
+    same route, departure day and arrival day (``build_search_params``).
+    """
+    departure_start, departure_end = _day(flight.departure_time)
+    arrival_start, arrival_end = _day(flight.arrival_time)
+    return Flight.objects.filter(
+        origin=flight.origin,
+        destination=flight.destination,
+        departure_time__gte=departure_start,
+        departure_time__lt=departure_end,
+        arrival_time__gte=arrival_start,
+        arrival_time__lt=arrival_end,
+    )
+
+
+def price_search(flight: Flight, data: Dict[str, Any], now: datetime) -> Optional[float]:
+    """
+    Price ``flight`` and every other flight sharing its search from one
+    response, in one read and one bulk update.
+
+    Flights the response has no price for are still marked enriched but keep
+    their previous price.
+
+    Returns:
+        ``flight``'s own price
+    """
+    pricer = SearchPricer(data)
+    siblings = search_siblings(flight)
+    # Only matching reads the flight numbers and legs
+    if pricer.strategy == "match":
+        siblings = siblings.only("pk", "retail_price", *PRICING_FIELDS).prefetch_related(leg_departures())
+    else:
+        siblings = siblings.only("pk", "retail_price")
+    siblings = list(siblings)
+    own = None
+    for sibling in siblings:
+        price = pricer.price(sibling)
+        if sibling.pk == flight.pk:
+            own = price
+        if price is not None:
+            sibling.retail_price = price
+        sibling.enriched = True
+        sibling.enriched_at = now
+    Flight.objects.bulk_update(siblings, ["retail_price", "enriched", "enriched_at"])
+    if len(siblings) > 1:
+        metrics.incr("flights_priced_by_search", len(siblings) - 1)
+    return own
@@ -0,0 +1,95 @@
+# Standard library imports
+import threading
+import time
+from typing import Tuple
+
+# Third-party imports
+import redis
+from django.conf import settings
+
+# Local application imports
+from .redis_client import get_redis, mark_unavailable
+
+# Refill by elapsed time, then take the tokens or report how long until they exist.
+# Redis TIME keeps every worker on the same clock.
+TAKE_TOKENS = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RateLimited(Exception):
+    """Raised when the provider quota is exhausted; retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited, retry in {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every worker through Redis.
+
+    Refills at ``rate`` tokens per second up to ``burst``. Without Redis each
+    process keeps its own bucket with the same limits.
+    """
+
+    def __init__(self, name: str):
+        self.key = f"flights:ratelimit:{name}"
+        self._local: Tuple[float, float] = (-1.0, 0.0)
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Try to take ``tokens``.
+
+        Returns:
+            0 when granted, otherwise the seconds until they would be
+            available (nothing is taken in that case)
+        """
+        rate, burst = self.limits()
+        if rate <= 0:
+            return 0.0
+        client = get_redis()
+        if client is not None:
+            try:
+                script = client.register_script(TAKE_TOKENS)
+                return float(script(keys=[self.key], args=[rate, burst, tokens]))
+            except redis.RedisError:
+                mark_unavailable()
+        return self._acquire_local(rate, burst, tokens)
+
+    @staticmethod
+    def limits() -> Tuple[float, float]:
+        return settings.SERPAPI_RATE_LIMIT, settings.SERPAPI_RATE_BURST
+
+    def _acquire_local(self, rate: float, burst: float, requested: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._local
+            if tokens < 0:
+                tokens, ts = burst, now
+            tokens = min(burst, tokens + max(0.0, now - ts) * rate)
+            wait = 0.0
+            if tokens >= requested:
+                tokens -= requested
+            else:
+                wait = (requested - tokens) / rate
+            self._local = (tokens, now)
+        return wait
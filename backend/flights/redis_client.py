@@ -0,0 +1,37 @@
+# Standard library imports
+import time
+from typing import Dict, Optional
+
+# Third-party imports
+import redis
+from django.conf import settings
+
+_clients: Dict[str, redis.Redis] = {}
+_unavailable_until = 0.0
+
+
+def get_redis(url: Optional[str] = None) -> Optional[redis.Redis]:
+    """
+    Return the shared Redis client used for cross-worker coordination.
+
+    Returns None when Redis is disabled (empty ``FLIGHTS_REDIS_URL``) or was
+    recently unreachable, in which case callers fall back to process-local
+    behaviour. ``url`` selects another Redis, such as the Celery broker.
+    """
+    url = settings.FLIGHTS_REDIS_URL if url is None else url
+    if not url or time.monotonic() < _unavailable_until:
+        return None
+    client = _clients.get(url)
+    if client is None:
+        client = _clients[url] = redis.Redis.from_url(
+            url,
+            socket_connect_timeout=settings.FLIGHTS_REDIS_TIMEOUT,
+            socket_timeout=settings.FLIGHTS_REDIS_TIMEOUT,
+        )
+    return client
+
+
+def mark_unavailable() -> None:
+    """Stop using Redis for a while after a connection or command error."""
+    global _unavailable_until
+    _unavailable_until = time.monotonic() + settings.FLIGHTS_REDIS_RETRY_AFTER
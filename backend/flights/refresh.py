@@ -0,0 +1,85 @@
+# Standard library imports
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+
+# Third-party imports
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+# Local application imports
+from .inflight import in_flight_tasks
+from .models import Flight
+
+
+def cycle_budget() -> int:
+    """
+    Refreshes one cycle may enqueue.
+
+    At most ``FLIGHTS_REFRESH_QUOTA_SHARE`` of the SerpAPI requests the rate
+    limit allows between two cycles, so refreshes never crowd out new flights,
+    and never more than ``FLIGHTS_REFRESH_MAX_PER_CYCLE``.
+    """
+    cap = settings.FLIGHTS_REFRESH_MAX_PER_CYCLE
+    if settings.SERPAPI_RATE_LIMIT <= 0:
+        return cap
+    quota = settings.SERPAPI_RATE_LIMIT * settings.FLIGHTS_REFRESH_INTERVAL * settings.FLIGHTS_REFRESH_QUOTA_SHARE
+    return min(cap, int(quota))
+
+
+def max_price_age(departure_time: datetime, now: Optional[datetime] = None) -> float:
+    """Seconds a price for a flight departing at ``departure_time`` stays fresh under ``FLIGHTS_REFRESH_AFTER``."""
+    now = now or timezone.now()
+    days = (departure_time - now).total_seconds() / 86400
+    for max_days, max_age in settings.FLIGHTS_REFRESH_AFTER:
+        if max_days is None or days <= max_days:
+            return max_age
+    return settings.FLIGHTS_REFRESH_AFTER[-1][1]
+
+
+def stale_flights(budget: int, now: Optional[datetime] = None) -> Iterator[List[Flight]]:
+    """
+    Yield pages of priced flights whose price is older than the staleness policy.
+
+    ``FLIGHTS_REFRESH_AFTER`` lists ``(max_days_to_departure, max_age_seconds)``
+    bands; bands are scanned soonest departure first, so when the budget runs
+    out it is the far-away flights that wait. Each band is read with a keyset
+    on ``(departure_time, id)`` over ``flight_refresh_idx``, one page of
+    ``FLIGHTS_REFRESH_BATCH_SIZE`` rows at a time. Flights with a task in
+    flight (see ``in_flight_tasks``) are skipped.
+    """
+    now = now or timezone.now()
+    in_flight = in_flight_tasks(now).filter(flight=OuterRef("pk"))
+    lower = now
+    for max_days, max_age in settings.FLIGHTS_REFRESH_AFTER:
+        if budget <= 0:
+            return
+        band = Flight.objects.filter(enriched=True, departure_time__gt=lower)
+        if max_days is not None:
+            upper = now + timedelta(days=max_days)
+            band = band.filter(departure_time__lte=upper)
+        band = (
+            band.filter(Q(enriched_at__lt=now - timedelta(seconds=max_age)) | Q(enriched_at__isnull=True))
+            .exclude(Exists(in_flight))
+            .only("pk", "flight_id", "departure_time", "last_seen")
+            .order_by("departure_time", "pk")
+        )
+
+        last = None
+        while budget > 0:
+            page = band
+            if last is not None:
+                page = page.filter(
+                    Q(departure_time__gt=last.departure_time)
+                    | Q(departure_time=last.departure_time, pk__gt=last.pk)
+                )
+            flights = list(page[:min(budget, settings.FLIGHTS_REFRESH_BATCH_SIZE)])
+            if not flights:
+                break
+            budget -= len(flights)
+            last = flights[-1]
+            yield flights
+
+        if max_days is None:
+            return
+        lower = upper
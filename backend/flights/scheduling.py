@@ -0,0 +1,141 @@
+# Standard library imports
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+# Third-party imports
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+# Local application imports
+from . import metrics
+from .redis_client import get_redis
+
+# Most urgent first
+PRIORITY_CLASSES = ("urgent", "high", "normal", "low")
+
+
+def queue_name(priority: str) -> str:
+    return f"enrich.{priority}"
+
+
+def _pick(table, value: float) -> str:
+    for bound, priority in table:
+        if bound is None or value <= bound:
+            return priority
+    return PRIORITY_CLASSES[-1]
+
+
+def _more_urgent(a: str, b: str) -> str:
+    return min(a, b, key=PRIORITY_CLASSES.index)
+
+
+def priority_class(
+    departure_time: datetime,
+    last_seen: datetime,
+    deadline: Optional[datetime] = None,
+    now: Optional[datetime] = None,
+) -> str:
+    """
+    Pick the priority class for enriching one flight.
+
+    Flights departing sooner go first (``FLIGHTS_PRIORITY_BY_DEPARTURE``, in
+    days), flights not seen for ``FLIGHTS_PRIORITY_STALE_SEEN_DAYS`` drop one
+    class, and a client deadline can only make the task more urgent
+    (``FLIGHTS_PRIORITY_BY_DEADLINE``, in seconds).
+    """
+    now = now or timezone.now()
+    days = (departure_time - now).total_seconds() / 86400
+    priority = _pick(settings.FLIGHTS_PRIORITY_BY_DEPARTURE, days)
+    if now - last_seen > timedelta(days=settings.FLIGHTS_PRIORITY_STALE_SEEN_DAYS):
+        priority = PRIORITY_CLASSES[min(PRIORITY_CLASSES.index(priority) + 1, len(PRIORITY_CLASSES) - 1)]
+    if deadline is not None:
+        seconds = (deadline - now).total_seconds()
+        priority = _more_urgent(priority, _pick(settings.FLIGHTS_PRIORITY_BY_DEADLINE, seconds))
+    return priority
+
+
+def promote(priority: str) -> str:
+    """One class more urgent, so work that keeps getting pushed back cannot wait forever."""
+    return PRIORITY_CLASSES[max(PRIORITY_CLASSES.index(priority) - 1, 0)]
+
+
+def publish_options(priority: str, deadline: Optional[float] = None) -> Dict[str, Any]:
+    """
+    ``apply_async`` options routing a task to its priority queue.
+
+    The class, the time the message becomes runnable and the deadline travel
+    as message headers so workers can report queue wait and missed deadlines.
+    """
+    return {
+        "queue": queue_name(priority),
+        "headers": {
+            "priority_class": priority,
+            "enqueued_at": time.time(),
+            "deadline_at": deadline,
+        },
+    }
+
+
+def _header(request, name: str) -> Any:
+    # Custom headers become request attributes on workers; eager runs keep them in .headers
+    value = getattr(request, name, None)
+    if value is None:
+        value = (getattr(request, "headers", None) or {}).get(name)
+    return value
+
+
+def request_priority(request) -> str:
+    return _header(request, "priority_class") or settings.FLIGHTS_PRIORITY_DEFAULT
+
+
+def request_deadline(request) -> Optional[float]:
+    return _header(request, "deadline_at")
+
+
+def request_enqueued_at(request) -> Optional[float]:
+    return _header(request, "enqueued_at")
+
+
+def record_start(request, tasks: int = 1) -> None:
+    """Count time spent waiting in the queue for the message being run."""
+    priority = request_priority(request)
+    metrics.incr(f"queue_started_{priority}", tasks)
+    enqueued_at = request_enqueued_at(request)
+    if enqueued_at is not None:
+        metrics.incr(f"queue_wait_seconds_{priority}", max(0.0, time.time() - enqueued_at) * tasks)
+
+
+def record_finish(request) -> None:
+    deadline = request_deadline(request)
+    if deadline is not None and time.time() > deadline:
+        metrics.incr(f"deadline_missed_{request_priority(request)}")
+
+
+def queue_stats() -> Dict[str, Dict[str, Any]]:
+    """Queue depth from the broker and mean queue wait per priority class."""
+    depths: Dict[str, Optional[int]] = {priority: None for priority in PRIORITY_CLASSES}
+    broker = get_redis(settings.CELERY_BROKER_URL)
+    if broker is not None:
+        try:
+            with broker.pipeline(transaction=False) as pipe:
+                for priority in PRIORITY_CLASSES:
+                    pipe.llen(queue_name(priority))
+                depths = dict(zip(PRIORITY_CLASSES, pipe.execute()))
+        except redis.RedisError:
+            pass
+
+    counters = metrics.snapshot()
+    stats = {}
+    for priority in PRIORITY_CLASSES:
+        started = counters.get(f"queue_started_{priority}", 0)
+        wait = counters.get(f"queue_wait_seconds_{priority}", 0)
+        stats[priority] = {
+            "queue": queue_name(priority),
+            "depth": depths[priority],
+            "started": int(started),
+            "mean_wait_seconds": wait / started if started else None,
+            "deadline_missed": int(counters.get(f"deadline_missed_{priority}", 0)),
+        }
+    return stats
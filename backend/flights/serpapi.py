@@ -0,0 +1,138 @@
+# Standard library imports
+import time
+from datetime import date
+from typing import Any, Dict
+
+# Third-party imports
+import httpx
+from django.conf import settings
+
+# Local application imports
+from . import decoding, metrics
+from .archive import archive_response
+from .cache import ResponseCache, cache_ttl
+from .circuit import CircuitBreaker
+from .http_client import get_client
+from .ratelimit import RateLimited, TokenBucket
+from .singleflight import SingleFlight
+
+SERPAPI_URL = "https://serpapi.com/search.json"
+
+# Flight columns read by build_search_params, for loading flights with only()
+SEARCH_FIELDS = ("origin", "destination", "departure_time", "arrival_time")
+
+coalescer = SingleFlight("flights:serpapi")
+response_cache = ResponseCache("serpapi_cache")
+quota = TokenBucket("serpapi")
+breaker = CircuitBreaker("serpapi")
+
+
+def build_search_params(flight) -> Dict[str, str]:
+    """Build the google_flights query for a flight, without the API key."""
+    return {
+        "engine": "google_flights",
+        "departure_id": flight.origin,
+        "arrival_id": flight.destination,
+        "outbound_date": flight.departure_time.strftime("%Y-%m-%d"),
+        "return_date": flight.arrival_time.strftime("%Y-%m-%d"),
+        "currency": "USD",
+        "hl": "en",
+    }
+
+
+def search_key(params: Dict[str, Any]) -> str:
+    """
+    Normalize search params into a stable key.
+
+    Flights on the same route and dates produce the same key no matter how
+    the airport codes were cased or the params were ordered.
+    """
+    normalized = []
+    for name, value in sorted(params.items()):
+        if name == "api_key":
+            continue
+        value = str(value).strip()
+        if name in ("departure_id", "arrival_id"):
+            value = value.upper()
+        normalized.append(f"{name}={value}")
+    return "|".join(normalized)
+
+
+def cache_response(key: str, params: Dict[str, Any], data: Dict[str, Any]) -> None:
+    """Cache a fresh response for a TTL based on days to departure."""
+    response_cache.set(key, data, cache_ttl(date.fromisoformat(params["outbound_date"])))
+
+
+def take_quota() -> None:
+    """
+    Take one request from the shared SerpAPI token bucket.
+
+    Raises:
+        RateLimited: If the bucket is empty, with the seconds until a token is free
+    """
+    wait = quota.acquire()
+    if wait > 0:
+        metrics.incr("serpapi_ratelimited")
+        raise RateLimited(wait)
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """Whether an error says the provider is unhealthy, as opposed to a bad request."""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def fetch_google_flights(params: Dict[str, Any]) -> bytes:
+    """
+    Call SerpAPI once and return the response body, undecoded.
+
+    Raises:
+        CircuitOpen: If the provider is failing and should not be called yet
+        RateLimited: If the shared quota is exhausted
+        httpx.HTTPError: If the request itself fails
+    """
+    breaker.before_call()
+    take_quota()
+    metrics.incr("serpapi_requests")
+    started = time.monotonic()
+    try:
+        response = get_client().get(SERPAPI_URL, params={**params, "api_key": settings.SERPAPI_KEY})
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        breaker.record(ok=not is_upstream_failure(e), elapsed=time.monotonic() - started)
+        raise
+    finally:
+        metrics.incr("serpapi_latency_seconds", time.monotonic() - started)
+    breaker.record(ok=True, elapsed=time.monotonic() - started)
+    return response.content
+
+
+def search_google_flights(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return SerpAPI results for ``params``.
+
+    Cached responses are returned without any HTTP call. On a miss, one
+    request is shared between all concurrent and recently queued searches
+    with the same key, and its response is cached for a TTL based on how
+    far away the departure is. Every paid response body is archived as
+    received; callers and the cache get its ``decoding.decode_search`` form.
+    """
+    key = search_key(params)
+    data = response_cache.get(key)
+    if data is not None:
+        return data
+
+    def fetch():
+        body = fetch_google_flights(params)
+        archive_response(key, params, body)
+        # Everything downstream only reads prices and flight numbers
+        data = decoding.decode_search(body)
+        cache_response(key, params, data)
+        return data
+
+    data, shared = coalescer.do(key, fetch)
+    if shared:
+        metrics.incr("serpapi_coalesced")
+    return data
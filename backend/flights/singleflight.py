@@ -0,0 +1,120 @@
+# Standard library imports
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from uuid import uuid4
+
+# Third-party imports
+import redis
+from django.conf import settings
+
+# Local application imports
+from . import decoding
+from .redis_client import get_redis, mark_unavailable
+
+# Delete the lock only if we still own it, so a slow leader cannot release a successor's lock
+RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.shared = False
+
+
+class SingleFlight:
+    """
+    Collapse calls that share a key into a single execution.
+
+    Threads in one process wait on an in-memory event. Across processes the
+    first caller takes a Redis lock and publishes its result for
+    ``SERPAPI_COALESCE_WINDOW`` seconds; other callers poll for that result
+    instead of running the function themselves. If the leader fails or takes
+    longer than ``SERPAPI_COALESCE_WAIT`` a waiting caller runs the function
+    itself. Without Redis only same-process calls are coalesced.
+    """
+
+    def __init__(self, namespace: str, poll_interval: float = 0.25):
+        self.namespace = namespace
+        self.poll_interval = poll_interval
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run ``fn`` once per key and share its result.
+
+        Returns:
+            Tuple of the result and whether it came from another caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, call.shared = self._do_shared(key, fn)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, call.shared
+
+    def _do_shared(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        client = get_redis()
+        if client is None:
+            return fn(), False
+
+        lock_key = f"{self.namespace}:lock:{key}"
+        result_key = f"{self.namespace}:result:{key}"
+        wait = settings.SERPAPI_COALESCE_WAIT
+        token = uuid4().hex
+        deadline = time.monotonic() + wait
+        try:
+            while True:
+                cached = client.get(result_key)
+                if cached is not None:
+                    return decoding.loads(cached), True
+                if client.set(lock_key, token, nx=True, px=int(wait * 1000)):
+                    break
+                if time.monotonic() >= deadline:
+                    return fn(), False
+                time.sleep(self.poll_interval)
+        except redis.RedisError:
+            mark_unavailable()
+            return fn(), False
+
+        release = client.register_script(RELEASE_LOCK)
+        try:
+            result = fn()
+        except BaseException:
+            try:
+                release(keys=[lock_key], args=[token])
+            except redis.RedisError:
+                mark_unavailable()
+            raise
+
+        try:
+            client.set(result_key, json.dumps(result), px=int(settings.SERPAPI_COALESCE_WINDOW * 1000))
+            release(keys=[lock_key], args=[token])
+        except redis.RedisError:
+            mark_unavailable()
+        return result, False
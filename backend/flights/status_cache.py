@@ -0,0 +1,180 @@
+# Standard library imports
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Third-party imports
+import redis
+from django.conf import settings
+
+# Local application imports
+from . import metrics
+from .models import EnrichmentTask
+from .redis_client import get_redis, mark_unavailable
+
+TERMINAL_STATUSES = ("SUCCESS", "FAILURE")
+# Every transition is published here so API processes can wake waiting clients
+STATUS_CHANNEL = "flights:task_status_changes"
+
+_local: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _key(task_id: str) -> str:
+    return f"flights:task_status:{task_id}"
+
+
+def status_ttl(status: str) -> int:
+    """Terminal states never change again; in-flight ones are rewritten on every transition."""
+    if status in TERMINAL_STATUSES:
+        return settings.FLIGHTS_STATUS_TTL_TERMINAL
+    return settings.FLIGHTS_STATUS_TTL_INFLIGHT
+
+
+def _entry(task_id: str, status: str, result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"task_id": task_id, "status": status, "result": result}
+
+
+def _store_local(entry: Dict[str, Any]) -> None:
+    # Only terminal states are kept in-process: they can never go stale, while
+    # in-flight ones are written by worker processes this process never hears from
+    if entry["status"] not in TERMINAL_STATUSES:
+        return
+    with _lock:
+        _local[entry["task_id"]] = entry
+        _local.move_to_end(entry["task_id"])
+        while len(_local) > settings.FLIGHTS_STATUS_CACHE_MAX_ENTRIES:
+            _local.popitem(last=False)
+
+
+def set_status(task_id: str, status: str, result: Optional[Dict[str, Any]] = None) -> None:
+    """Write a transition through to the cache and announce it; call after the database write."""
+    set_statuses([task_id], status, result)
+
+
+def set_statuses(task_ids: Iterable[str], status: str, result: Optional[Dict[str, Any]] = None) -> None:
+    """Write and announce the same transition for many tasks in one Redis round trip."""
+    set_entries((task_id, status, result) for task_id in task_ids)
+
+
+def set_entries(transitions: Iterable[Tuple[str, str, Optional[Dict[str, Any]]]]) -> None:
+    """Write and announce ``(task_id, status, result)`` transitions in one Redis round trip."""
+    entries = [_entry(task_id, status, result) for task_id, status, result in transitions]
+    cache = settings.FLIGHTS_STATUS_CACHE
+    if cache:
+        for entry in entries:
+            _store_local(entry)
+    client = get_redis()
+    if client is None or not entries:
+        return
+    try:
+        with client.pipeline(transaction=False) as pipe:
+            for entry in entries:
+                payload = json.dumps(entry)
+                if cache:
+                    pipe.set(_key(entry["task_id"]), payload, ex=status_ttl(entry["status"]))
+                pipe.publish(STATUS_CHANNEL, payload)
+            pipe.execute()
+    except redis.RedisError:
+        mark_unavailable()
+
+
+def get_status(task_id: str) -> Optional[Dict[str, Any]]:
+    """Return the cached status entry, or None on a miss."""
+    return get_statuses([task_id]).get(task_id)
+
+
+def get_statuses(task_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Return cached entries by task id for the ids that hit, in one Redis round trip."""
+    if not settings.FLIGHTS_STATUS_CACHE:
+        return {}
+    found: Dict[str, Dict[str, Any]] = {}
+    remote: List[str] = []
+    with _lock:
+        for task_id in task_ids:
+            entry = _local.get(task_id)
+            if entry is not None:
+                _local.move_to_end(task_id)
+                found[task_id] = entry
+            else:
+                remote.append(task_id)
+    hits_local = len(found)
+
+    client = get_redis()
+    if client is not None and remote:
+        try:
+            values = client.mget([_key(task_id) for task_id in remote])
+        except redis.RedisError:
+            mark_unavailable()
+        else:
+            for task_id, raw in zip(remote, values):
+                if raw is not None:
+                    entry = found[task_id] = json.loads(raw)
+                    _store_local(entry)
+
+    hits_redis = len(found) - hits_local
+    misses = len(remote) - hits_redis
+    if hits_local:
+        metrics.incr("task_status_cache_hits_local", hits_local)
+    if hits_redis:
+        metrics.incr("task_status_cache_hits_redis", hits_redis)
+    if misses:
+        metrics.incr("task_status_cache_misses", misses)
+    return found
+
+
+def _fill(entries: List[Dict[str, Any]]) -> None:
+    """
+    Cache statuses read from the database.
+
+    Uses SET NX so a fill that read a row just before a transition can
+    never overwrite the newer value the worker wrote through.
+    """
+    for entry in entries:
+        _store_local(entry)
+    client = get_redis()
+    if client is None or not entries:
+        return
+    try:
+        with client.pipeline(transaction=False) as pipe:
+            for entry in entries:
+                pipe.set(_key(entry["task_id"]), json.dumps(entry), ex=status_ttl(entry["status"]), nx=True)
+            pipe.execute()
+    except redis.RedisError:
+        mark_unavailable()
+
+
+def load_status(task_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Read a task's status from the cache, falling back to the database.
+
+    Returns:
+        ``{"task_id", "status", "result"}``, or None if the task does not exist
+    """
+    return load_statuses([task_id]).get(task_id)
+
+
+def load_statuses(task_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Read many tasks' statuses: the cache first, then one query for the misses.
+
+    Returns:
+        Entries by task id; ids of tasks that do not exist are left out
+    """
+    task_ids = list(dict.fromkeys(task_ids))
+    found = get_statuses(task_ids)
+    misses = [task_id for task_id in task_ids if task_id not in found]
+    if misses:
+        rows = EnrichmentTask.objects.filter(task_id__in=misses).values_list("task_id", "status", "result")
+        loaded = [_entry(*row) for row in rows]
+        if settings.FLIGHTS_STATUS_CACHE:
+            _fill(loaded)
+        found.update((entry["task_id"], entry) for entry in loaded)
+    return found
+
+
+def clear() -> None:
+    """Drop the local tier; Redis entries expire on their own."""
+    with _lock:
+        _local.clear()
@@ -1,10 +1,18 @@
 # Standard library imports
+import json
 import os
-from typing import Dict, Any
+import random
+from uuid import uuid4
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
 
 # Third-party imports
 import httpx
-from celery import shared_task
+import redis
+from asgiref.sync import async_to_sync
+from celery import group, shared_task
+from celery.exceptions import Ignore
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from dotenv import load_dotenv
 from pathlib import Path
@@ -16,14 +24,82 @@ from .models import Flight, EnrichmentTask
 env_path = Path(__file__).resolve().parent.parent.parent / '.env'
 load_dotenv(env_path)
 
-from backend.settings import SERPAPI_KEY
-from flights.utils import extract_retail_price
+from flights import metrics, scheduling, status_cache
+from flights.engine import enrich_many, price_searches
+from flights.inflight import IN_FLIGHT_STATUSES, expire_stale
+from flights.legs import leg_departures
+from flights.prices import downsample, observation_for, record_observations
+from flights.pricing import PRICING_FIELDS, price_search
+from flights.circuit import CircuitOpen, retry_countdown
+from flights.ratelimit import RateLimited
+from flights.redis_client import get_redis, mark_unavailable
+from flights.refresh import cycle_budget, stale_flights
+from flights.serpapi import SEARCH_FIELDS, breaker, build_search_params, search_google_flights, search_key
 
 
 
+def set_task_status(task_id: str, status: str) -> bool:
+    """
+    Record an in-flight status and write it through to the status cache.
+
+    A task that already finished, or was failed by ``expire_stale``, is left
+    alone: a late worker must not take back its idempotency key.
+
+    Returns:
+        Whether the task was still in flight and got the status
+    """
+    updated = EnrichmentTask.objects.filter(task_id=task_id, status__in=IN_FLIGHT_STATUSES).update(status=status)
+    if updated:
+        status_cache.set_status(task_id, status)
+    return bool(updated)
+
+
+def finish_task(task_id: str, status: str, result: Dict[str, Any]) -> bool:
+    """
+    Record a terminal status with a single UPDATE, without loading the row.
+
+    Only an in-flight task is finished, so a worker that outlived
+    ``FLIGHTS_INFLIGHT_TIMEOUT`` does not overwrite the timeout failure.
+
+    Returns:
+        Whether the task was still in flight and got the status
+    """
+    updated = EnrichmentTask.objects.filter(task_id=task_id, status__in=IN_FLIGHT_STATUSES).update(
+        status=status,
+        result=result,
+        completed_at=timezone.now(),
+    )
+    if updated:
+        status_cache.set_status(task_id, status, result)
+    return bool(updated)
+
+
+def defer(task, countdown: float) -> None:
+    """
+    Re-publish the running task to run after ``countdown`` seconds.
+
+    Unlike ``task.retry`` this does not use up a retry, so waiting for quota
+    never turns into a FAILURE. Each deferral moves the task up one priority
+    class so it cannot be pushed back indefinitely.
+
+    Raises:
+        Ignore: Always, so the current execution ends without a state change
+    """
+    options = scheduling.publish_options(
+        scheduling.promote(scheduling.request_priority(task.request)),
+        scheduling.request_deadline(task.request),
+    )
+    # Queue wait is counted from when the message becomes runnable again
+    options["headers"]["enqueued_at"] += countdown
+    task.signature_from_request(**options).apply_async(countdown=countdown)
+    raise Ignore()
+
+
 @shared_task(
     bind=True,
     autoretry_for=(Exception,),
+    # A missing flight will still be missing on the next attempt
+    dont_autoretry_for=(Flight.DoesNotExist,),
     retry_kwargs={'max_retries': 3, 'countdown': 60},
     retry_backoff=True
 )
@@ -43,73 +119,336 @@ def enrich_flight_task(self, flight_id: str) -> Dict[str, Any]:
         ValueError: If API response is invalid
     """
     try:
-        # Get flight data
-        flight = Flight.objects.get(flight_id=flight_id)
-        task_obj = EnrichmentTask.objects.get(task_id=self.request.id)
-        
+        # Load only the columns the search needs, not the flight_numbers JSON or the legs
+        flight = Flight.objects.only(*SEARCH_FIELDS, "enriched_at", "retail_price").get(flight_id=flight_id)
+
         # Update task status to started
-        task_obj.status = 'STARTED'
-        task_obj.save()
-
-        # Prepare API request parameters
-        params = {
-            "engine": "google_flights",
-            "departure_id": flight.origin,
-            "arrival_id": flight.destination,
-            "outbound_date": flight.departure_time.strftime("%Y-%m-%d"),
-            "return_date": flight.arrival_time.strftime("%Y-%m-%d"),
-            "currency": "USD",
-            "hl": "en",
-            "api_key": SERPAPI_KEY
-        }
-
-        # Make API request with timeout and retries
-        with httpx.Client(timeout=200) as client:
-            response = client.get("https://serpapi.com/search.json", params=params)
-            response.raise_for_status()
-            data = response.json()
-
-        # Extract and validate retail price
-        retail_price = extract_retail_price(data)
-
-        # Update flight data
-        if retail_price is not None:
-            flight.retail_price = retail_price
-        flight.enriched = True
-        flight.save()
+        set_task_status(self.request.id, 'STARTED')
+        scheduling.record_start(self.request)
+
+        # Another flight's search priced this one after it was queued
+        enqueued_at = scheduling.request_enqueued_at(self.request)
+        if flight.enriched_at is not None and enqueued_at is not None and flight.enriched_at.timestamp() >= enqueued_at:
+            retail_price = None if flight.retail_price is None else float(flight.retail_price)
+            metrics.incr("enrichment_skipped_priced")
+            finish_task(self.request.id, 'SUCCESS', {"retail_price": retail_price})
+            scheduling.record_finish(self.request)
+            return {"retail_price": retail_price}
+
+        # Fetch prices, sharing the request with any other flight on the same search
+        params = build_search_params(flight)
+        data = search_google_flights(params)
+
+        # Price this flight and every other flight on the same search in one pass
+        now = timezone.now()
+        retail_price = price_search(flight, data, now)
+
+        # Append to the route's price history
+        observation = observation_for(params, retail_price, now)
+        if observation is not None:
+            observation.save(force_insert=True)
 
         # Update task status
-        task_obj.status = 'SUCCESS'
-        task_obj.result = {"retail_price": retail_price}
-        task_obj.completed_at = timezone.now()
-        task_obj.save()
+        finish_task(self.request.id, 'SUCCESS', {"retail_price": retail_price})
+        scheduling.record_finish(self.request)
 
         return {"retail_price": retail_price}
 
+    except RateLimited as e:
+        # Spread deferred tasks out a little so they do not all come back at once
+        countdown = e.retry_after * (1 + random.random() * 0.1)
+        metrics.incr("serpapi_ratelimit_wait_seconds", countdown)
+        set_task_status(self.request.id, 'PENDING')
+        defer(self, countdown)
+
+    except CircuitOpen as e:
+        # Fail fast while the provider is down and come back when it may have recovered
+        countdown = e.retry_after * (1 + random.random() * 0.1)
+        set_task_status(self.request.id, 'PENDING')
+        defer(self, countdown)
+
     except Flight.DoesNotExist:
         error_msg = f"Flight with ID {flight_id} not found"
-        task_obj = EnrichmentTask.objects.get(task_id=self.request.id)
-        task_obj.status = 'FAILURE'
-        task_obj.result = {"error": error_msg}
-        task_obj.completed_at = timezone.now()
-        task_obj.save()
+        finish_task(self.request.id, 'FAILURE', {"error": error_msg})
         raise
 
     except httpx.HTTPError as e:
         error_msg = f"HTTP error occurred: {str(e)}"
         if self.request.retries >= self.max_retries:
-            task_obj = EnrichmentTask.objects.get(task_id=self.request.id)
-            task_obj.status = 'FAILURE'
-            task_obj.result = {"error": error_msg}
-            task_obj.completed_at = timezone.now()
-            task_obj.save()
+            finish_task(self.request.id, 'FAILURE', {"error": error_msg})
+            raise
+        # Retry sooner when the provider is healthy and later while it is struggling
+        raise self.retry(exc=e, countdown=retry_countdown(breaker, self.request.retries))
+
+    except Exception as e:
+        # FAILURE is final to every status reader, so only the last attempt writes it;
+        # before that autoretry_for runs the task again
+        if self.request.retries >= self.max_retries:
+            error_msg = f"Error enriching flight data: {str(e)}"
+            finish_task(self.request.id, 'FAILURE', {"error": error_msg})
         raise
 
+
+@shared_task(bind=True)
+def enrich_flights_async(self, task_ids: List[str]) -> List[Dict[str, Any]]:
+    """
+    Enrich many flights concurrently on one event loop.
+
+    Lookups are almost entirely network wait, so a single worker process
+    can keep up to ``FLIGHTS_ASYNC_CONCURRENCY`` of them in flight. HTTP
+    errors are retried in-process, and every task ends in SUCCESS or
+    FAILURE just like ``enrich_flight_task``.
+
+    Args:
+        task_ids: EnrichmentTask ids created by the API, already PENDING
+
+    Returns:
+        One result dict per task id, in the same order
+    """
+    scheduling.record_start(self.request, tasks=len(task_ids))
+    # async_to_sync keeps ORM calls on this worker thread and its DB connection
+    results = async_to_sync(enrich_many)(task_ids, settings.FLIGHTS_ASYNC_CONCURRENCY)
+    scheduling.record_finish(self.request)
+    return results
+
+
+def update_grouped(queryset, field: str, values_by_key: Dict[Any, Dict[str, Any]]) -> int:
+    """
+    Write per-row values with one UPDATE per distinct set of values.
+
+    Enrichment results repeat (one price per itinerary, one status per
+    outcome), so a chunk takes a handful of statements. On SQLite that is
+    about ten times cheaper than ``bulk_update``, whose per-row CASE
+    expressions dominate the write.
+
+    Returns:
+        The number of UPDATE statements issued
+    """
+    groups: Dict[str, Tuple[Dict[str, Any], List[Any]]] = {}
+    for key, values in values_by_key.items():
+        signature = json.dumps(values, sort_keys=True, default=str)
+        groups.setdefault(signature, (values, []))[1].append(key)
+    for values, keys in groups.values():
+        queryset.filter(**{f"{field}__in": keys}).update(**values)
+    return len(groups)
+
+
+@shared_task(bind=True)
+def enrich_flights_batch(self, flight_ids: List[str], task_ids: List[str]) -> List[Dict[str, Any]]:
+    """
+    Enrich a chunk of flights with bulk reads and writes.
+
+    The flights are read with one ``in_bulk`` and grouped by search key, each
+    distinct search is fetched once (up to ``FLIGHTS_ASYNC_CONCURRENCY`` at a
+    time), and every Flight, EnrichmentTask and price observation change is
+    written back in bulk. Each task still goes STARTED and then SUCCESS or
+    FAILURE, in the database and the status cache, like ``enrich_flight_task``.
+
+    Args:
+        flight_ids: Flights to enrich
+        task_ids: The PENDING EnrichmentTask of each flight, in the same order
+
+    Returns:
+        One result dict per task id, in the same order
+    """
+    scheduling.record_start(self.request, tasks=len(task_ids))
+    with transaction.atomic():
+        # Tasks that finished or expired meanwhile keep their status
+        EnrichmentTask.objects.filter(task_id__in=task_ids, status__in=IN_FLIGHT_STATUSES).update(status="STARTED")
+        started = list(EnrichmentTask.objects.filter(task_id__in=task_ids, status="STARTED").values_list("task_id", flat=True))
+    status_cache.set_statuses(started, "STARTED")
+    try:
+        results, finished = _enrich_chunk(flight_ids, task_ids)
     except Exception as e:
-        error_msg = f"Error enriching flight data: {str(e)}"
-        task_obj = EnrichmentTask.objects.get(task_id=self.request.id)
-        task_obj.status = 'FAILURE'
-        task_obj.result = {"error": error_msg}
-        task_obj.completed_at = timezone.now()
-        task_obj.save()
+        # Nothing of the chunk was written; without this its tasks would stay STARTED
+        error = {"error": f"Error enriching flight data: {str(e)}"}
+        EnrichmentTask.objects.filter(task_id__in=started, status="STARTED").update(
+            status="FAILURE", result=error, completed_at=timezone.now(),
+        )
+        status_cache.set_statuses(started, "FAILURE", error)
+        metrics.incr("enrichment_batch_failed", len(task_ids))
         raise
+    status_cache.set_entries([entry for entry in results if entry[0] in finished])
+    scheduling.record_finish(self.request)
+    return [{"task_id": task_id, **result} for task_id, _, result in results]
+
+
+def _enrich_chunk(flight_ids: List[str], task_ids: List[str]) -> Tuple[List[Tuple[str, str, Dict[str, Any]]], Set[str]]:
+    """
+    Price one chunk and write it back in one transaction.
+
+    Returns:
+        ``(task_id, status, result)`` per task, and the ids of the tasks that
+        were still in flight and so got their result written
+    """
+    fields = SEARCH_FIELDS + ("flight_id", "retail_price")
+    flights = Flight.objects.all()
+    if settings.FLIGHTS_PRICE_STRATEGY == "match":
+        fields += PRICING_FIELDS
+        flights = flights.prefetch_related(leg_departures())
+    flights = flights.only(*fields).in_bulk(flight_ids, field_name="flight_id")
+
+    searches: Dict[str, Dict[str, Any]] = {}
+    keys: Dict[str, str] = {}
+    for flight_id, flight in flights.items():
+        params = build_search_params(flight)
+        keys[flight_id] = search_key(params)
+        searches[keys[flight_id]] = params
+    # async_to_sync keeps ORM calls on this worker thread and its DB connection
+    pricers = async_to_sync(price_searches)(searches, settings.FLIGHTS_ASYNC_CONCURRENCY)
+
+    now = timezone.now()
+    priced: Dict[int, Dict[str, Any]] = {}
+    finished: Dict[str, Dict[str, Any]] = {}
+    observations = []
+    results = []
+    for flight_id, task_id in zip(flight_ids, task_ids):
+        flight = flights.get(flight_id)
+        pricer = pricers[keys[flight_id]] if flight is not None else None
+        if flight is None:
+            status, result = "FAILURE", {"error": f"Flight with ID {flight_id} not found"}
+        elif isinstance(pricer, httpx.HTTPError):
+            status, result = "FAILURE", {"error": f"HTTP error occurred: {str(pricer)}"}
+        elif isinstance(pricer, Exception):
+            status, result = "FAILURE", {"error": f"Error enriching flight data: {str(pricer)}"}
+        else:
+            retail_price = pricer.price(flight)
+            priced[flight.pk] = {"enriched": True, "enriched_at": now}
+            if retail_price is not None:
+                priced[flight.pk]["retail_price"] = retail_price
+            observation = observation_for(searches[keys[flight_id]], retail_price, now)
+            if observation is not None:
+                observations.append(observation)
+            status, result = "SUCCESS", {"retail_price": retail_price}
+        finished[task_id] = {"status": status, "result": result, "completed_at": now}
+        results.append((task_id, status, result))
+
+    with transaction.atomic():
+        update_grouped(Flight.objects, "pk", priced)
+        # Locks the rows, so expire_stale cannot fail one between this read and the write
+        in_flight = set(
+            EnrichmentTask.objects.select_for_update()
+            .filter(task_id__in=finished, status__in=IN_FLIGHT_STATUSES)
+            .values_list("task_id", flat=True)
+        )
+        update_grouped(EnrichmentTask.objects, "task_id", {task_id: finished[task_id] for task_id in in_flight})
+        record_observations(observations)
+    return results, in_flight
+
+
+def _priority_chunks(
+    items: List[Tuple[str, str, str, Optional[float]]], size: int
+) -> Iterator[Tuple[str, List[Tuple[str, str, str, Optional[float]]], Optional[float]]]:
+    """Split items into chunks of at most ``size`` per priority class, with each chunk's earliest deadline."""
+    by_priority: Dict[str, List[Tuple[str, str, str, Optional[float]]]] = {}
+    for item in items:
+        by_priority.setdefault(item[2], []).append(item)
+    for priority, queued in by_priority.items():
+        for i in range(0, len(queued), size):
+            chunk = queued[i:i + size]
+            deadlines = [deadline for _, _, _, deadline in chunk if deadline is not None]
+            yield priority, chunk, min(deadlines) if deadlines else None
+
+
+def enqueue_enrichments(items: List[Tuple[str, str, str, Optional[float]]]) -> None:
+    """
+    Publish enrichment messages for (flight_id, task_id, priority, deadline)
+    items in a single group, each routed to its priority queue.
+
+    With ``FLIGHTS_BATCH_ENRICHMENT`` the tasks are sent in chunks of
+    ``FLIGHTS_BATCH_CHUNK_SIZE`` per priority class to ``enrich_flights_batch``;
+    with ``FLIGHTS_ASYNC_ENRICHMENT`` in batches of ``FLIGHTS_ASYNC_BATCH_SIZE``
+    to the asyncio engine; otherwise one message is sent per flight.
+    """
+    if not items:
+        return
+    if settings.FLIGHTS_BATCH_ENRICHMENT:
+        group(
+            enrich_flights_batch.signature(
+                args=[[flight_id for flight_id, *_ in chunk], [task_id for _, task_id, *_ in chunk]],
+                **scheduling.publish_options(priority, deadline),
+            )
+            for priority, chunk, deadline in _priority_chunks(items, settings.FLIGHTS_BATCH_CHUNK_SIZE)
+        ).apply_async()
+        return
+    if settings.FLIGHTS_ASYNC_ENRICHMENT:
+        group(
+            enrich_flights_async.signature(
+                args=[[task_id for _, task_id, *_ in chunk]],
+                **scheduling.publish_options(priority, deadline),
+            )
+            for priority, chunk, deadline in _priority_chunks(items, settings.FLIGHTS_ASYNC_BATCH_SIZE)
+        ).apply_async()
+        return
+    group(
+        enrich_flight_task.signature(
+            args=[flight_id], task_id=task_id, **scheduling.publish_options(priority, deadline)
+        )
+        for flight_id, task_id, priority, deadline in items
+    ).apply_async()
+
+
+REFRESH_LOCK_KEY = "flights:refresh:lock"
+
+
+@shared_task
+def refresh_stale_flights() -> int:
+    """
+    Re-enrich priced flights whose price has gone stale (run by celery beat).
+
+    Enqueues at most ``cycle_budget()`` refreshes per run, page by page, so
+    each page's tasks exist before the next page is read and no flight is
+    queued twice. A Redis lock keeps overlapping runs from racing.
+
+    Returns:
+        The number of refreshes enqueued
+    """
+    client = get_redis()
+    token = str(uuid4())
+    if client is not None:
+        try:
+            if not client.set(REFRESH_LOCK_KEY, token, nx=True, ex=int(settings.FLIGHTS_REFRESH_INTERVAL)):
+                return 0
+        except redis.RedisError:
+            mark_unavailable()
+            client = None
+
+    enqueued = 0
+    try:
+        for flights in stale_flights(cycle_budget()):
+            tasks = [EnrichmentTask(task_id=str(uuid4()), flight_id=flight.pk, status="PENDING") for flight in flights]
+            EnrichmentTask.objects.bulk_create(tasks)
+            status_cache.set_statuses([task.task_id for task in tasks], "PENDING")
+            enqueue_enrichments([
+                (flight.flight_id, task.task_id, scheduling.priority_class(flight.departure_time, flight.last_seen), None)
+                for flight, task in zip(flights, tasks)
+            ])
+            enqueued += len(tasks)
+    finally:
+        if client is not None:
+            try:
+                if client.get(REFRESH_LOCK_KEY) == token.encode():
+                    client.delete(REFRESH_LOCK_KEY)
+            except redis.RedisError:
+                mark_unavailable()
+    if enqueued:
+        metrics.incr("refresh_enqueued", enqueued)
+    return enqueued
+
+
+@shared_task
+def downsample_price_observations() -> Dict[str, int]:
+    """Compact old raw price observations into daily minimums (run by celery beat)."""
+    compacted, expired = downsample()
+    if compacted:
+        metrics.incr("price_observations_compacted", compacted)
+    return {"compacted": compacted, "expired": expired}
+
+
+@shared_task
+def expire_stale_tasks() -> int:
+    """Fail tasks left PENDING or STARTED past ``FLIGHTS_INFLIGHT_TIMEOUT`` (run by celery beat)."""
+    expired = expire_stale()
+    if expired:
+        metrics.incr("tasks_expired", expired)
+    return expired
@@ -1,19 +1,48 @@
 # Standard library imports
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
 from datetime import datetime, timedelta
 from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
 from unittest.mock import patch
 
 # Third-party imports
 import httpx
 import pytest
-from django.core.exceptions import ValidationError
-from django.test import TestCase
+from celery.canvas import Signature
+from django.core.exceptions import BadRequest, ValidationError
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import QuerySet
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, TestCase, override_settings
 from django.utils import timezone
 
 # Local application imports
-from .models import Flight, EnrichmentTask
-from .tasks import enrich_flight_task
-from .utils import extract_retail_price
+from .models import Flight, EnrichmentTask, FlightLeg, PriceObservation
+from . import decoding, http_client, legs, prices, scheduling, status_cache
+from .archive import ResponseArchive, read_body, response_archive
+from .cache import ResponseCache, cache_ttl
+from .circuit import CircuitBreaker, CircuitOpen, retry_countdown
+from .ratelimit import TokenBucket
+from .serpapi import build_search_params, response_cache, search_google_flights, search_key
+from .refresh import cycle_budget
+from .tasks import (
+    downsample_price_observations, enqueue_enrichments, enrich_flight_task, enrich_flights_async, enrich_flights_batch,
+    expire_stale_tasks, refresh_stale_flights,
+)
+from .utils import ItineraryIndex, extract_price, extract_retail_price
+from .views import FlightListView, TaskListView
+
+def serp_body(data):
+    """A SerpAPI response body, as the fetchers return it."""
+    return json.dumps(data).encode()
+
 
 class BaseTestCase(TestCase):
     def setUp(self):
@@ -32,20 +61,6 @@ class FlightModelTests(BaseTestCase):
             "departure_time": timezone.now(),
             "arrival_time": timezone.now() + timedelta(hours=10),
             "flight_numbers": ["MS986", "MS747"],
-            "legs": [
-                {
-                    "origin": "JFK",
-                    "destination": "CAI",
-                    "departure_time": "2025-06-13T12:55:00",
-                    "arrival_time": "2025-06-14T06:15:00",
-                    "flight_number": "MS986",
-                    "aircraft_type": "Boeing 777",
-                    "cabin_type": "Business",
-                    "duration": 620,
-                    "layover_time": 235.0,
-                    "distance": 5614,
-                }
-            ],
             "last_seen": timezone.now()
         }
 
@@ -71,7 +86,6 @@ class EnrichmentTaskModelTests(BaseTestCase):
             departure_time=timezone.now(),
             arrival_time=timezone.now() + timedelta(hours=6),
             flight_numbers=["AA123"],
-            legs=[],
             last_seen=timezone.now()
         )
 
@@ -105,20 +119,6 @@ class FlightModelValidationTests(BaseTestCase):
             "departure_time": timezone.now(),
             "arrival_time": timezone.now() + timedelta(hours=10),
             "flight_numbers": ["MS986", "MS747"],
-            "legs": [
-                {
-                    "origin": "JFK",
-                    "destination": "CAI",
-                    "departure_time": "2025-06-13T12:55:00",
-                    "arrival_time": "2025-06-14T06:15:00",
-                    "flight_number": "MS986",
-                    "aircraft_type": "Boeing 777",
-                    "cabin_type": "Business",
-                    "duration": 620,
-                    "layover_time": 235.0,
-                    "distance": 5614,
-                }
-            ],
             "last_seen": timezone.now()
         }
 
@@ -138,18 +138,6 @@ class EnrichmentTaskLogicTests(BaseTestCase):
             departure_time=timezone.now(),
             arrival_time=timezone.now() + timedelta(hours=6),
             flight_numbers=["AA123"],
-            legs=[{
-                "origin": "JFK",
-                "destination": "LAX",
-                "departure_time": timezone.now().isoformat(),
-                "arrival_time": (timezone.now() + timedelta(hours=6)).isoformat(),
-                "flight_number": "AA123",
-                "aircraft_type": "Boeing 737",
-                "cabin_type": "Economy",
-                "duration": 360,
-                "layover_time": 0.0,
-                "distance": 2475
-            }],
             last_seen=timezone.now()
         )
         self.task = EnrichmentTask.objects.create(
@@ -196,6 +184,49 @@ class ExtractRetailPriceTests(BaseTestCase):
         data = {"best_flights": [{"price": 500.00}]}
         self.assertEqual(extract_retail_price(data), 500.00)
 
+class PriceExtractionTests(BaseTestCase):
+    response = {
+        "search_metadata": {"status": "Success"},
+        "best_flights": [
+            {"price": 900, "flights": [{"flight_number": "MS 986", "departure_airport": {"id": "JFK", "time": "2025-06-13 12:55"}},
+                                       {"flight_number": "MS 747", "airline": "EgyptAir"}]},
+        ],
+        "other_flights": [
+            {"price": 610, "flights": [{"flight_number": "TK 12"}], "layovers": [{"id": "IST"}]},
+            {"flights": [{"flight_number": "A3 411"}]},
+        ],
+        "price_insights": {"lowest_price": 610},
+    }
+
+    def test_strategies(self):
+        self.assertEqual(extract_price(self.response, "first"), 900)
+        self.assertEqual(extract_price(self.response, "min"), 610)
+        self.assertEqual(extract_price(self.response, "match", ["MS986", "MS747"]), 900)
+        self.assertIsNone(extract_price(self.response, "match", ["MS986"]))
+        with self.assertRaises(ValueError):
+            extract_price(self.response, "cheapest")
+        with self.assertRaises(ValueError):
+            extract_price({"other_flights": [{"price": "n/a"}]}, "min")
+
+    def test_slim_response_keeps_only_what_extraction_reads(self):
+        slim = decoding.slim_response(self.response)
+        self.assertEqual(set(slim), {"best_flights", "other_flights"})
+        self.assertEqual(slim["best_flights"][0]["flights"][0],
+                         {"flight_number": "MS 986", "departure_airport": {"time": "2025-06-13 12:55"}})
+        self.assertEqual(slim["other_flights"][1], {"flights": [{"flight_number": "A3 411"}]})
+        for strategy in ("first", "min"):
+            self.assertEqual(extract_price(slim, strategy), extract_price(self.response, strategy))
+        self.assertEqual(decoding.slim_response({"best_flights": [{"price": 420}]}), {"best_flights": [{"price": 420}]})
+
+    def test_decoders_agree(self):
+        body = json.dumps(self.response).encode()
+        for backend in decoding.available_backends():
+            with override_settings(FLIGHTS_JSON_DECODER=backend):
+                self.assertEqual(decoding.loads(body), self.response)
+                self.assertEqual(decoding.decode_search(body), decoding.slim_response(self.response))
+        with override_settings(FLIGHTS_JSON_DECODER="no-such-decoder"), self.assertRaises(ValueError):
+            decoding.loads(body)
+
 class EdgeCaseTests(BaseTestCase):
     def test_concurrent_task_creation(self):
         flight = Flight.objects.create(
@@ -206,7 +237,6 @@ class EdgeCaseTests(BaseTestCase):
             departure_time=timezone.now(),
             arrival_time=timezone.now() + timedelta(hours=6),
             flight_numbers=["AA123"],
-            legs=[],
             last_seen=timezone.now()
         )
 
@@ -236,20 +266,6 @@ class EdgeCaseTests(BaseTestCase):
             "departure_time": timezone.now() + timedelta(days=3650),  # 10 years in future
             "arrival_time": timezone.now() + timedelta(days=3650, hours=6),
             "flight_numbers": ["AA123"],
-            "legs": [
-                {
-                    "origin": "JFK",
-                    "destination": "LAX",
-                    "departure_time": (timezone.now() + timedelta(days=3650)).isoformat(),
-                    "arrival_time": (timezone.now() + timedelta(days=3650, hours=6)).isoformat(),
-                    "flight_number": "AA123",
-                    "aircraft_type": "Boeing 737",
-                    "cabin_type": "Economy",
-                    "duration": 360,
-                    "layover_time": 0.0,
-                    "distance": 2475
-                }
-            ],
             "last_seen": timezone.now()
         }
         flight = Flight.objects.create(**flight_data)
@@ -264,18 +280,6 @@ class EdgeCaseTests(BaseTestCase):
             departure_time=timezone.now(),
             arrival_time=timezone.now() + timedelta(hours=6),
             flight_numbers=["AA123"],
-            legs=[{
-                "origin": "JFK",
-                "destination": "LAX",
-                "departure_time": timezone.now().isoformat(),
-                "arrival_time": (timezone.now() + timedelta(hours=6)).isoformat(),
-                "flight_number": "AA123",
-                "aircraft_type": "Boeing 737",
-                "cabin_type": "Economy",
-                "duration": 360,
-                "layover_time": 0.0,
-                "distance": 2475
-            }],
             last_seen=timezone.now()
         )
 
@@ -283,7 +287,7 @@ class EdgeCaseTests(BaseTestCase):
         flight.retail_price = Decimal('99999999.99')
         flight.full_clean()
 
-    def test_unicode_airport_codes(self):
+    def test_unicode_airport_codes_are_accepted(self):
         flight_data = {
             "flight_id": "test-flight",
             "travel_class": "Economy",
@@ -292,12 +296,12 @@ class EdgeCaseTests(BaseTestCase):
             "departure_time": timezone.now(),
             "arrival_time": timezone.now() + timedelta(hours=6),
             "flight_numbers": ["AA123"],
-            "legs": [],
             "last_seen": timezone.now()
         }
-        with self.assertRaises(ValidationError):
-            flight = Flight.objects.create(**flight_data)
-            flight.full_clean()
+        # Codes are stored as given; only their length is checked
+        flight = Flight.objects.create(**flight_data)
+        flight.full_clean()
+        self.assertEqual(Flight.objects.get(pk=flight.pk).origin, "羽田")
 
     def test_very_long_flight_id(self):
         flight_data = {
@@ -308,20 +312,6 @@ class EdgeCaseTests(BaseTestCase):
             "departure_time": timezone.now(),
             "arrival_time": timezone.now() + timedelta(hours=6),
             "flight_numbers": ["AA123"],
-            "legs": [
-                {
-                    "origin": "JFK",
-                    "destination": "LAX",
-                    "departure_time": timezone.now().isoformat(),
-                    "arrival_time": (timezone.now() + timedelta(hours=6)).isoformat(),
-                    "flight_number": "AA123",
-                    "aircraft_type": "Boeing 737",
-                    "cabin_type": "Economy",
-                    "duration": 360,
-                    "layover_time": 0.0,
-                    "distance": 2475
-                }
-            ],
             "last_seen": timezone.now()
         }
         flight = Flight.objects.create(**flight_data)
@@ -331,3 +321,1083 @@ class EdgeCaseTests(BaseTestCase):
         with self.assertRaises(ValidationError):
             flight.flight_id = "x" * 101
             flight.full_clean()
+
+class IngestJsonlCommandTests(BaseTestCase):
+    def test_ingests_file_in_chunks(self):
+        record = {
+            "id": "jsonl-flight",
+            "travel_class": "Economy",
+            "origin": "JFK",
+            "destination": "LAX",
+            "departure_time": "2025-06-13T12:55:00",
+            "arrival_time": "2025-06-13T18:55:00",
+            "flight_numbers": ["AA123"],
+            "legs": [],
+            "last_seen": "2025-05-29T03:38:05Z",
+        }
+        lines = [
+            json.dumps(record),
+            json.dumps({**record, "id": "jsonl-flight-2"}),
+            json.dumps({**record, "origin": None}),
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as feed:
+            feed.write("\n".join(lines))
+        self.addCleanup(os.remove, feed.name)
+
+        out = StringIO()
+        with patch("celery.canvas.group.apply_async") as publish:
+            call_command("ingest_jsonl", feed.name, "--chunk-size", "2", stdout=out, stderr=StringIO())
+
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r["line"] for r in results], [1, 2, 3])
+        self.assertEqual([r["status"] for r in results], ["PENDING", "PENDING", "INVALID"])
+        self.assertEqual(publish.call_count, 1)
+        self.assertEqual(Flight.objects.filter(flight_id__startswith="jsonl-flight").count(), 2)
+        self.assertEqual(EnrichmentTask.objects.filter(task_id=results[1]["task_id"]).count(), 1)
+
+class SearchCoalescingTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        response_cache.clear()
+
+    params = {
+        "engine": "google_flights",
+        "departure_id": "JFK",
+        "arrival_id": "ATH",
+        "outbound_date": "2025-06-13",
+        "return_date": "2025-06-14",
+        "currency": "USD",
+        "hl": "en",
+    }
+
+    def test_search_key_is_normalized(self):
+        variant = {**self.params, "departure_id": " jfk", "api_key": "secret"}
+        self.assertEqual(search_key(variant), search_key(self.params))
+        self.assertNotEqual(search_key({**self.params, "outbound_date": "2025-06-14"}), search_key(self.params))
+
+    def test_concurrent_identical_searches_share_one_request(self):
+        release = threading.Event()
+        calls = []
+
+        def fetch(params):
+            calls.append(params)
+            release.wait(5)
+            return serp_body({"best_flights": [{"price": 420}]})
+
+        results = []
+        with patch("flights.serpapi.fetch_google_flights", side_effect=fetch), \
+                patch("flights.serpapi.metrics.incr") as incr:
+            threads = [
+                threading.Thread(target=lambda: results.append(search_google_flights(dict(self.params))))
+                for _ in range(3)
+            ]
+            for thread in threads:
+                thread.start()
+            while not calls:
+                time.sleep(0.01)
+            time.sleep(0.05)
+            release.set()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"best_flights": [{"price": 420}]}] * 3)
+        coalesced = [c for c in incr.call_args_list if c.args == ("serpapi_coalesced",)]
+        self.assertEqual(len(coalesced), 2)
+
+class ResponseCacheTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        response_cache.clear()
+
+    def test_ttl_shrinks_near_departure(self):
+        today = datetime(2025, 6, 1).date()
+        near = cache_ttl(today + timedelta(days=1), today=today)
+        week = cache_ttl(today + timedelta(days=5), today=today)
+        far = cache_ttl(today + timedelta(days=180), today=today)
+        self.assertLess(near, week)
+        self.assertLess(week, far)
+
+    @override_settings(SERPAPI_CACHE_MAX_ENTRIES=2)
+    def test_lru_evicts_least_recently_used(self):
+        cache = ResponseCache("test_cache")
+        with patch("flights.cache.metrics.incr") as incr:
+            cache.set("a", 1, ttl=60)
+            cache.set("b", 2, ttl=60)
+            self.assertEqual(cache.get("a"), 1)
+            cache.set("c", 3, ttl=60)
+            self.assertIsNone(cache.get("b"))
+            self.assertEqual(cache.get("a"), 1)
+        incr.assert_any_call("test_cache_evictions", 1)
+        incr.assert_any_call("test_cache_misses")
+
+    def test_cache_hit_skips_http_and_updates_price(self):
+        flight = Flight.objects.create(
+            flight_id="cached-flight",
+            travel_class="Economy",
+            origin="JFK",
+            destination="LAX",
+            departure_time=timezone.now() + timedelta(days=20),
+            arrival_time=timezone.now() + timedelta(days=20, hours=6),
+            flight_numbers=["AA123"],
+            last_seen=timezone.now()
+        )
+        EnrichmentTask.objects.create(task_id="cached-task-1", flight=flight)
+        EnrichmentTask.objects.create(task_id="cached-task-2", flight=flight)
+        with patch("flights.serpapi.fetch_google_flights", return_value=serp_body({"best_flights": [{"price": 321}]})) as fetch:
+            enrich_flight_task.apply(args=[flight.flight_id], task_id="cached-task-1")
+            Flight.objects.filter(pk=flight.pk).update(retail_price=None)
+            enrich_flight_task.apply(args=[flight.flight_id], task_id="cached-task-2")
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(Flight.objects.get(pk=flight.pk).retail_price, Decimal("321"))
+        self.assertEqual(EnrichmentTask.objects.get(task_id="cached-task-2").status, "SUCCESS")
+
+class HttpClientTests(BaseTestCase):
+    def tearDown(self):
+        http_client.close_client()
+
+    @override_settings(SERPAPI_CONNECT_TIMEOUT=3, SERPAPI_READ_TIMEOUT=90)
+    def test_client_is_reused_until_reinitialised(self):
+        client = http_client.get_client()
+        self.assertIs(http_client.get_client(), client)
+        self.assertEqual(client.timeout.connect, 3)
+        self.assertEqual(client.timeout.read, 90)
+
+        # worker_process_init gives each forked child a fresh pool
+        self.assertIsNot(http_client.init_client(), client)
+
+class AsyncEnrichmentTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        response_cache.clear()
+        self.flights = [
+            Flight.objects.create(
+                flight_id=f"async-flight-{i}",
+                travel_class="Economy",
+                origin=origin,
+                destination="LAX",
+                departure_time=timezone.now() + timedelta(days=10),
+                arrival_time=timezone.now() + timedelta(days=10, hours=6),
+                flight_numbers=["AA123"],
+                last_seen=timezone.now()
+            )
+            for i, origin in enumerate(["JFK", "JFK", "BOS"])
+        ]
+        for i, flight in enumerate(self.flights):
+            EnrichmentTask.objects.create(task_id=f"async-task-{i}", flight=flight)
+
+    def test_batch_enriches_concurrently_and_finishes_every_task(self):
+        async def fetch(client, params):
+            await asyncio.sleep(0.01)
+            if params["departure_id"] == "BOS":
+                raise httpx.ConnectError("boom")
+            return serp_body({"best_flights": [{"price": 199}]})
+
+        with patch("flights.engine.fetch_google_flights_async", side_effect=fetch) as fetch_mock, \
+                override_settings(FLIGHTS_ASYNC_MAX_RETRIES=1, FLIGHTS_ASYNC_RETRY_BACKOFF=0):
+            results = enrich_flights_async.apply(args=[["async-task-0", "async-task-1", "async-task-2"]]).get()
+
+        # Two JFK flights share one lookup; BOS is tried twice before failing
+        self.assertEqual(fetch_mock.call_count, 3)
+        self.assertEqual([r["task_id"] for r in results], ["async-task-0", "async-task-1", "async-task-2"])
+        statuses = dict(EnrichmentTask.objects.values_list("task_id", "status"))
+        self.assertEqual(statuses, {"async-task-0": "SUCCESS", "async-task-1": "SUCCESS", "async-task-2": "FAILURE"})
+        self.assertEqual(Flight.objects.get(flight_id="async-flight-1").retail_price, Decimal("199"))
+        self.assertFalse(Flight.objects.get(flight_id="async-flight-2").enriched)
+        self.assertIsNotNone(EnrichmentTask.objects.get(task_id="async-task-2").completed_at)
+
+class BatchEnrichmentTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        response_cache.clear()
+        status_cache.clear()
+        for i, origin in enumerate(["JFK", "JFK", "JFK", "BOS"]):
+            flight = Flight.objects.create(
+                flight_id=f"batch-flight-{i}",
+                travel_class="Economy",
+                origin=origin,
+                destination="LAX",
+                departure_time=timezone.now() + timedelta(days=10),
+                arrival_time=timezone.now() + timedelta(days=10, hours=6),
+                flight_numbers=[f"AA{i}"],
+                last_seen=timezone.now(),
+            )
+            EnrichmentTask.objects.create(task_id=f"batch-task-{i}", flight=flight)
+
+    @override_settings(FLIGHTS_PRICE_STRATEGY="match", FLIGHTS_PRICE_FALLBACK="none",
+                       FLIGHTS_ASYNC_MAX_RETRIES=0, FLIGHTS_ASYNC_RETRY_BACKOFF=0)
+    def test_chunk_is_read_and_written_in_bulk(self):
+        async def fetch(client, params):
+            if params["departure_id"] == "BOS":
+                raise httpx.ConnectError("boom")
+            return serp_body({"best_flights": [{"price": 199 + i, "flights": [{"flight_number": f"AA {i}"}]} for i in range(2)]})
+
+        flight_ids = [f"batch-flight-{i}" for i in range(4)] + ["missing"]
+        task_ids = [f"batch-task-{i}" for i in range(4)] + ["batch-task-missing"]
+        with patch("flights.engine.fetch_google_flights_async", side_effect=fetch) as fetch_mock, \
+                CaptureQueriesContext(connection) as queries:
+            results = enrich_flights_batch.apply(args=[flight_ids, task_ids]).get()
+
+        # The three JFK flights share one search
+        self.assertEqual(fetch_mock.call_count, 2)
+        # STARTED and its read-back in a savepoint, one bulk read and one of the legs;
+        # then, in a savepoint, one UPDATE per distinct flight change (3), the read of
+        # the tasks still in flight, one UPDATE per task outcome (4, the missing task
+        # has no row) and one observation insert
+        self.assertEqual(len(queries), 17)
+        self.assertEqual([r.get("retail_price") for r in results], [199, 200, None, None, None])
+        self.assertIn("HTTP error", results[3]["error"])
+        self.assertIn("not found", results[4]["error"])
+
+        statuses = dict(EnrichmentTask.objects.values_list("task_id", "status"))
+        self.assertEqual(statuses, {"batch-task-0": "SUCCESS", "batch-task-1": "SUCCESS",
+                                    "batch-task-2": "SUCCESS", "batch-task-3": "FAILURE"})
+        self.assertEqual(status_cache.get_status("batch-task-1")["result"], {"retail_price": 200})
+        prices = dict(Flight.objects.values_list("flight_id", "retail_price"))
+        self.assertEqual(prices["batch-flight-1"], Decimal("200"))
+        self.assertIsNone(prices["batch-flight-2"])
+        self.assertTrue(Flight.objects.get(flight_id="batch-flight-2").enriched)
+        self.assertFalse(Flight.objects.get(flight_id="batch-flight-3").enriched)
+        self.assertEqual(PriceObservation.objects.count(), 2)
+
+    def test_chunk_whose_write_fails_fails_its_tasks(self):
+        async def fetch(client, params):
+            return serp_body({"best_flights": [{"price": 199}]})
+
+        flight_ids = [f"batch-flight-{i}" for i in range(4)]
+        task_ids = [f"batch-task-{i}" for i in range(4)]
+        with patch("flights.engine.fetch_google_flights_async", side_effect=fetch), \
+                patch("flights.tasks.record_observations", side_effect=OperationalError("database is locked")), \
+                patch("flights.tasks.metrics.incr") as incr:
+            result = enrich_flights_batch.apply(args=[flight_ids, task_ids])
+
+        self.assertIsInstance(result.result, OperationalError)
+        # The prices were rolled back with the rest of the write, and no task is left STARTED
+        self.assertFalse(Flight.objects.filter(enriched=True).exists())
+        self.assertEqual(set(EnrichmentTask.objects.values_list("status", flat=True)), {"FAILURE"})
+        self.assertIn("database is locked", status_cache.get_status("batch-task-0")["result"]["error"])
+        incr.assert_any_call("enrichment_batch_failed", 4)
+
+    @override_settings(FLIGHTS_BATCH_ENRICHMENT=True, FLIGHTS_BATCH_CHUNK_SIZE=2)
+    def test_enqueue_sends_chunks_per_priority(self):
+        items = [(f"batch-flight-{i}", f"batch-task-{i}", "normal", None) for i in range(3)]
+        items.append(("batch-flight-3", "batch-task-3", "urgent", 123.0))
+        with patch("flights.tasks.group") as group_mock:
+            enqueue_enrichments(items)
+        signatures = list(group_mock.call_args.args[0])
+        self.assertEqual([list(sig.args) for sig in signatures], [
+            [["batch-flight-0", "batch-flight-1"], ["batch-task-0", "batch-task-1"]],
+            [["batch-flight-2"], ["batch-task-2"]],
+            [["batch-flight-3"], ["batch-task-3"]],
+        ])
+        self.assertEqual(signatures[2].options["headers"]["deadline_at"], 123.0)
+
+
+class RateLimitTests(BaseTestCase):
+    @override_settings(SERPAPI_RATE_LIMIT=2, SERPAPI_RATE_BURST=2)
+    def test_bucket_reports_wait_once_burst_is_spent(self):
+        bucket = TokenBucket("test")
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0)
+        wait = bucket.acquire()
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 0.5)
+
+    def test_rate_limited_task_is_deferred_not_failed(self):
+        response_cache.clear()
+        flight = Flight.objects.create(
+            flight_id="limited-flight",
+            travel_class="Economy",
+            origin="JFK",
+            destination="SFO",
+            departure_time=timezone.now() + timedelta(days=3),
+            arrival_time=timezone.now() + timedelta(days=3, hours=6),
+            flight_numbers=["AA1"],
+            last_seen=timezone.now()
+        )
+        EnrichmentTask.objects.create(task_id="limited-task", flight=flight)
+        with patch("flights.serpapi.quota.acquire", return_value=2.5), \
+                patch("flights.serpapi.get_client") as get_client, \
+                patch("celery.canvas.Signature.apply_async") as republish:
+            result = enrich_flight_task.apply(args=[flight.flight_id], task_id="limited-task")
+
+        get_client.assert_not_called()
+        self.assertEqual(result.state, "IGNORED")
+        countdown = republish.call_args.kwargs["countdown"]
+        self.assertGreaterEqual(countdown, 2.5)
+        self.assertLess(countdown, 3)
+        self.assertEqual(EnrichmentTask.objects.get(task_id="limited-task").status, "PENDING")
+
+@override_settings(
+    SERPAPI_BREAKER_MIN_CALLS=4,
+    SERPAPI_BREAKER_ERROR_RATE=0.5,
+    SERPAPI_BREAKER_OPEN_SECONDS=30,
+    SERPAPI_BREAKER_HALF_OPEN_CALLS=1,
+)
+class CircuitBreakerTests(BaseTestCase):
+    def test_opens_on_errors_then_closes_after_healthy_trial(self):
+        breaker = CircuitBreaker("test")
+        for ok in (True, False, True, False):
+            breaker.before_call()
+            breaker.record(ok=ok, elapsed=0.1)
+        with self.assertRaises(CircuitOpen) as ctx:
+            breaker.before_call()
+        self.assertAlmostEqual(ctx.exception.retry_after, 30, delta=1)
+
+        with patch("flights.circuit.time.time", return_value=time.time() + 31):
+            breaker.before_call()  # the single half-open trial
+            with self.assertRaises(CircuitOpen):
+                breaker.before_call()
+            breaker.record(ok=True, elapsed=0.1)
+            breaker.before_call()
+        self.assertEqual(breaker.error_rate(), 0)
+
+    def test_failed_trial_reopens_for_longer(self):
+        breaker = CircuitBreaker("test")
+        for _ in range(4):
+            breaker.record(ok=True, elapsed=120)  # slow calls count against health too
+        later = time.time() + 31
+        with patch("flights.circuit.time.time", return_value=later):
+            breaker.before_call()
+            breaker.record(ok=False, elapsed=0.1)
+            with self.assertRaises(CircuitOpen) as ctx:
+                breaker.before_call()
+        self.assertAlmostEqual(ctx.exception.retry_after, 60, delta=1)
+
+    @override_settings(SERPAPI_RETRY_BASE=10, SERPAPI_RETRY_HEALTH_FACTOR=4, SERPAPI_RETRY_MAX=600)
+    def test_retry_countdown_grows_with_error_rate(self):
+        breaker = CircuitBreaker("test")
+        healthy = retry_countdown(breaker, 1)
+        breaker.record(ok=False, elapsed=0.1)
+        self.assertEqual(healthy, 20)
+        self.assertEqual(retry_countdown(breaker, 1), 100)
+
+    def test_open_circuit_defers_task_without_calling_provider(self):
+        response_cache.clear()
+        flight = Flight.objects.create(
+            flight_id="breaker-flight",
+            travel_class="Economy",
+            origin="JFK",
+            destination="MIA",
+            departure_time=timezone.now() + timedelta(days=3),
+            arrival_time=timezone.now() + timedelta(days=3, hours=3),
+            flight_numbers=["AA2"],
+            last_seen=timezone.now()
+        )
+        EnrichmentTask.objects.create(task_id="breaker-task", flight=flight)
+        with patch("flights.serpapi.breaker.before_call", side_effect=CircuitOpen(12)), \
+                patch("flights.serpapi.get_client") as get_client, \
+                patch("celery.canvas.Signature.apply_async") as republish:
+            result = enrich_flight_task.apply(args=[flight.flight_id], task_id="breaker-task")
+        get_client.assert_not_called()
+        self.assertEqual(result.state, "IGNORED")
+        self.assertGreaterEqual(republish.call_args.kwargs["countdown"], 12)
+        self.assertEqual(EnrichmentTask.objects.get(task_id="breaker-task").status, "PENDING")
+
+class EnrichFlightTaskQueryTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        response_cache.clear()
+        self.flight = Flight.objects.create(
+            flight_id="query-flight",
+            travel_class="Economy",
+            origin="JFK",
+            destination="ORD",
+            departure_time=timezone.now() + timedelta(days=5),
+            arrival_time=timezone.now() + timedelta(days=5, hours=3),
+            flight_numbers=["AA7"],
+            last_seen=timezone.now()
+        )
+        FlightLeg.objects.create(
+            flight=self.flight,
+            position=0,
+            origin="JFK",
+            destination="ORD",
+            departure_time=self.flight.departure_time,
+            arrival_time=self.flight.arrival_time,
+            flight_number="AA7",
+            aircraft_type="Boeing 737",
+            cabin_type="Economy",
+            duration=180,
+            layover_time=0.0,
+            distance=740,
+        )
+        EnrichmentTask.objects.create(task_id="query-task", flight=self.flight)
+
+    def test_successful_task_query_count(self):
+        # Select flight, mark STARTED, select flights on the search and their
+        # leg departures, update them, record price observation, mark SUCCESS
+        with patch("flights.serpapi.fetch_google_flights", return_value=serp_body({"best_flights": [{"price": 99}]})), \
+                self.assertNumQueries(7):
+            enrich_flight_task.apply(args=[self.flight.flight_id], task_id="query-task")
+        task = EnrichmentTask.objects.get(task_id="query-task")
+        self.assertEqual(task.status, "SUCCESS")
+        self.assertEqual(task.result, {"retail_price": 99.0})
+        self.assertIsNotNone(task.completed_at)
+
+    def test_task_does_not_load_or_rewrite_flight_numbers_or_legs(self):
+        # Only matching itineraries needs flight numbers and legs, and only reads them
+        for strategy, reads in (("first", 0), ("match", 1)):
+            EnrichmentTask.objects.filter(task_id="query-task").update(status="PENDING")
+            with override_settings(FLIGHTS_PRICE_STRATEGY=strategy), \
+                    patch("flights.serpapi.fetch_google_flights", return_value=serp_body({"best_flights": [{"price": 99}]})), \
+                    CaptureQueriesContext(connection) as queries:
+                enrich_flight_task.apply(args=[self.flight.flight_id], task_id="query-task")
+            for marker in ('"flight_numbers"', '"flights_flightleg"'):
+                matching = [query["sql"] for query in queries.captured_queries if marker in query["sql"]]
+                self.assertEqual(len(matching), reads)
+                for sql in matching:
+                    self.assertTrue(sql.startswith("SELECT"))
+
+
+class StatusCacheTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        response_cache.clear()
+        status_cache.clear()
+        self.flight = Flight.objects.create(
+            flight_id="status-flight",
+            travel_class="Economy",
+            origin="JFK",
+            destination="BOS",
+            departure_time=timezone.now() + timedelta(days=5),
+            arrival_time=timezone.now() + timedelta(days=5, hours=1),
+            flight_numbers=["B61"],
+            last_seen=timezone.now()
+        )
+        EnrichmentTask.objects.create(task_id="status-task", flight=self.flight)
+
+    def test_terminal_status_is_written_through_and_served_without_queries(self):
+        with patch("flights.serpapi.fetch_google_flights", return_value=serp_body({"best_flights": [{"price": 80}]})):
+            enrich_flight_task.apply(args=[self.flight.flight_id], task_id="status-task")
+        with self.assertNumQueries(0):
+            status = status_cache.load_status("status-task")
+        self.assertEqual(status, {"task_id": "status-task", "status": "SUCCESS", "result": {"retail_price": 80.0}})
+
+    @override_settings(FLIGHTS_INFLIGHT_TIMEOUT=3600)
+    def test_worker_outliving_the_timeout_keeps_the_task_failed(self):
+        EnrichmentTask.objects.filter(task_id="status-task").update(created_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(expire_stale_tasks.apply().get(), 1)
+        with patch("flights.serpapi.fetch_google_flights", return_value=serp_body({"best_flights": [{"price": 80}]})):
+            enrich_flight_task.apply(args=[self.flight.flight_id], task_id="status-task")
+        self.assertEqual(EnrichmentTask.objects.get(task_id="status-task").status, "FAILURE")
+        self.assertEqual(status_cache.load_status("status-task")["status"], "FAILURE")
+
+    def test_failed_attempt_that_is_retried_never_publishes_failure(self):
+        # Another API process would keep a FAILURE forever, so only the final attempt may write it
+        published = []
+        set_entries = status_cache.set_entries
+
+        def record(transitions):
+            transitions = list(transitions)
+            published.extend(status for _, status, _ in transitions)
+            set_entries(transitions)
+
+        responses = [ValueError("bad response"), serp_body({"best_flights": [{"price": 80}]})]
+        with patch("flights.serpapi.fetch_google_flights", side_effect=responses), \
+                patch("flights.status_cache.set_entries", side_effect=record):
+            enrich_flight_task.apply(args=[self.flight.flight_id], task_id="status-task")
+        self.assertNotIn("FAILURE", published)
+        self.assertEqual(published[-1], "SUCCESS")
+        self.assertEqual(status_cache.load_status("status-task")["status"], "SUCCESS")
+        self.assertEqual(EnrichmentTask.objects.get(task_id="status-task").status, "SUCCESS")
+
+    def test_missing_flight_fails_without_retrying(self):
+        EnrichmentTask.objects.create(task_id="missing-task", flight=self.flight)
+        with patch.object(enrich_flight_task, "retry") as retry:
+            enrich_flight_task.apply(args=["no-such-flight"], task_id="missing-task")
+        retry.assert_not_called()
+        self.assertEqual(status_cache.load_status("missing-task")["status"], "FAILURE")
+
+    def test_in_flight_status_is_read_from_database_without_redis(self):
+        # Another process may move the task on, so in-flight states are never kept locally
+        status_cache.set_status("status-task", "STARTED")
+        EnrichmentTask.objects.filter(task_id="status-task").update(status="SUCCESS", result={"retail_price": 1})
+        with self.assertNumQueries(1):
+            self.assertEqual(status_cache.load_status("status-task")["status"], "SUCCESS")
+        with self.assertNumQueries(0):
+            status_cache.load_status("status-task")
+
+    def test_unknown_task_returns_none(self):
+        self.assertIsNone(status_cache.load_status("missing-task"))
+
+    @override_settings(FLIGHTS_STATUS_TTL_TERMINAL=86400, FLIGHTS_STATUS_TTL_INFLIGHT=60)
+    def test_terminal_states_get_longer_ttls(self):
+        self.assertEqual(status_cache.status_ttl("SUCCESS"), 86400)
+        self.assertEqual(status_cache.status_ttl("FAILURE"), 86400)
+        self.assertEqual(status_cache.status_ttl("STARTED"), 60)
+
+    def test_batch_lookup_reads_all_misses_with_one_query(self):
+        task_ids = [f"status-batch-{i}" for i in range(5)]
+        for task_id in task_ids:
+            EnrichmentTask.objects.create(task_id=task_id, flight=self.flight, status="FAILURE")
+        with self.assertNumQueries(1):
+            found = status_cache.load_statuses(task_ids + ["missing-task"])
+        self.assertEqual(sorted(found), task_ids)
+        with self.assertNumQueries(0):
+            status_cache.load_statuses(task_ids)
+
+
+class SchedulingTests(BaseTestCase):
+    def test_priority_follows_departure_staleness_and_deadline(self):
+        now = timezone.now()
+        self.assertEqual(scheduling.priority_class(now + timedelta(days=1), now, now=now), "urgent")
+        self.assertEqual(scheduling.priority_class(now + timedelta(days=30), now, now=now), "normal")
+        self.assertEqual(scheduling.priority_class(now + timedelta(days=200), now, now=now), "low")
+        # Not seen for weeks: one class lower
+        stale = now - timedelta(days=30)
+        self.assertEqual(scheduling.priority_class(now + timedelta(days=1), stale, now=now), "high")
+        # A deadline can only make a task more urgent
+        deadline = now + timedelta(minutes=1)
+        self.assertEqual(scheduling.priority_class(now + timedelta(days=200), now, deadline, now=now), "urgent")
+        late_deadline = now + timedelta(days=1)
+        self.assertEqual(scheduling.priority_class(now + timedelta(days=1), now, late_deadline, now=now), "urgent")
+
+    def test_deferred_task_is_promoted_one_class(self):
+        response_cache.clear()
+        flight = Flight.objects.create(
+            flight_id="deferred-flight",
+            travel_class="Economy",
+            origin="JFK",
+            destination="DEN",
+            departure_time=timezone.now() + timedelta(days=90),
+            arrival_time=timezone.now() + timedelta(days=90, hours=4),
+            flight_numbers=["UA1"],
+            last_seen=timezone.now()
+        )
+        EnrichmentTask.objects.create(task_id="deferred-task", flight=flight)
+        with patch("flights.serpapi.quota.acquire", return_value=5), \
+                patch.object(Signature, "apply_async", autospec=True) as republish:
+            enrich_flight_task.apply(
+                args=[flight.flight_id], task_id="deferred-task",
+                headers={"priority_class": "low", "enqueued_at": time.time(), "deadline_at": None},
+            )
+        signature = republish.call_args.args[0]
+        self.assertEqual(signature.options["queue"], "enrich.normal")
+        self.assertEqual(signature.options["headers"]["priority_class"], "normal")
+
+    def test_queue_wait_and_missed_deadlines_are_counted(self):
+        request = SimpleNamespace(
+            priority_class="high", enqueued_at=time.time() - 5, deadline_at=time.time() - 1, headers=None
+        )
+        with patch("flights.scheduling.metrics.incr") as incr:
+            scheduling.record_start(request)
+            scheduling.record_finish(request)
+        calls = {call.args[0]: call.args[1] if len(call.args) > 1 else 1 for call in incr.call_args_list}
+        self.assertEqual(calls["queue_started_high"], 1)
+        self.assertAlmostEqual(calls["queue_wait_seconds_high"], 5, delta=0.5)
+        self.assertEqual(calls["deadline_missed_high"], 1)
+
+
+class RefreshStaleFlightsTests(BaseTestCase):
+    def make_flight(self, flight_id, departs_in, priced_ago, enriched=True):
+        now = timezone.now()
+        return Flight.objects.create(
+            flight_id=flight_id,
+            travel_class="Economy",
+            origin="JFK",
+            destination="LAX",
+            departure_time=now + departs_in,
+            arrival_time=now + departs_in + timedelta(hours=6),
+            flight_numbers=["DL1"],
+            last_seen=now,
+            enriched=enriched,
+            enriched_at=now - priced_ago if enriched else None,
+        )
+
+    def refreshed_flights(self):
+        with patch("celery.canvas.group.apply_async"):
+            refresh_stale_flights.apply()
+        return list(
+            EnrichmentTask.objects.filter(status="PENDING")
+            .order_by("flight__departure_time")
+            .values_list("flight__flight_id", flat=True)
+        )
+
+    def test_only_stale_idle_priced_flights_are_refreshed_once(self):
+        self.make_flight("tomorrow-stale", timedelta(hours=20), timedelta(hours=2))
+        self.make_flight("tomorrow-fresh", timedelta(hours=20), timedelta(minutes=10))
+        self.make_flight("next-month", timedelta(days=20), timedelta(hours=2))
+        self.make_flight("far-stale", timedelta(days=200), timedelta(days=4))
+        self.make_flight("departed", -timedelta(hours=1), timedelta(days=4))
+        self.make_flight("unpriced", timedelta(hours=20), timedelta(0), enriched=False)
+        queued = self.make_flight("already-queued", timedelta(hours=20), timedelta(hours=2))
+        EnrichmentTask.objects.create(task_id="queued-task", flight=queued, status="STARTED")
+
+        self.assertEqual(self.refreshed_flights(), ["tomorrow-stale", "far-stale"])
+        # Their refreshes are now pending, so a second cycle adds nothing
+        self.assertEqual(self.refreshed_flights(), ["tomorrow-stale", "far-stale"])
+
+    @override_settings(FLIGHTS_INFLIGHT_TIMEOUT=3600)
+    def test_lost_in_flight_tasks_expire(self):
+        lost = self.make_flight("lost-task", timedelta(hours=20), timedelta(hours=2))
+        EnrichmentTask.objects.create(task_id="lost-task", flight=lost, status="STARTED")
+        EnrichmentTask.objects.filter(task_id="lost-task").update(created_at=timezone.now() - timedelta(hours=2))
+        running = self.make_flight("running-task", timedelta(hours=20), timedelta(hours=2))
+        EnrichmentTask.objects.create(task_id="running-task", flight=running, status="STARTED")
+
+        # A task past the timeout no longer holds back a refresh
+        self.assertEqual(self.refreshed_flights(), ["lost-task"])
+        self.assertEqual(expire_stale_tasks.apply().get(), 1)
+        lost_task = EnrichmentTask.objects.get(task_id="lost-task")
+        self.assertEqual(lost_task.status, "FAILURE")
+        self.assertIsNotNone(lost_task.completed_at)
+        self.assertEqual(EnrichmentTask.objects.get(task_id="running-task").status, "STARTED")
+        self.assertEqual(expire_stale_tasks.apply().get(), 0)
+
+    @override_settings(FLIGHTS_REFRESH_BATCH_SIZE=2, FLIGHTS_REFRESH_MAX_PER_CYCLE=3)
+    def test_cycle_budget_takes_soonest_departures_first(self):
+        for day in range(1, 6):
+            self.make_flight(f"stale-{day}", timedelta(days=day, hours=1), timedelta(days=5))
+        self.assertEqual(cycle_budget(), 3)
+        self.assertEqual(self.refreshed_flights(), ["stale-1", "stale-2", "stale-3"])
+
+
+class PriceHistoryTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+
+    def observe(self, ago, price, route="JFK-ATH", currency=840):
+        return PriceObservation(
+            route=route,
+            departure_date=(self.now + timedelta(days=30)).date(),
+            observed_at=self.now - ago,
+            price_cents=price,
+            currency=currency,
+        )
+
+    def test_enrichment_appends_observation(self):
+        flight = Flight.objects.create(
+            flight_id="history-flight",
+            travel_class="Economy",
+            origin="jfk",
+            destination="ATH",
+            departure_time=self.now + timedelta(days=30),
+            arrival_time=self.now + timedelta(days=30, hours=10),
+            flight_numbers=["MS986"],
+            last_seen=self.now,
+        )
+        EnrichmentTask.objects.create(task_id="history-task", flight=flight)
+        response_cache.clear()
+        with patch("flights.serpapi.fetch_google_flights", return_value=serp_body({"best_flights": [{"price": 412.5}]})):
+            enrich_flight_task.apply(args=[flight.flight_id], task_id="history-task")
+        observation = PriceObservation.objects.get()
+        self.assertEqual(observation.route, "JFK-ATH")
+        self.assertEqual(observation.departure_date, flight.departure_time.date())
+        self.assertEqual(observation.price_cents, 41250)
+        self.assertEqual(observation.currency, prices.CURRENCY_CODES["USD"])
+        self.assertEqual(observation.resolution, PriceObservation.RAW)
+
+    def test_min_price_per_day(self):
+        prices.record_observations([
+            self.observe(timedelta(days=2, hours=1), 50000),
+            self.observe(timedelta(days=2, hours=3), 45000),
+            self.observe(timedelta(days=1), 47000),
+            self.observe(timedelta(days=1), 100, route="JFK-LAX"),
+            self.observe(timedelta(days=1), 100, currency=978),
+            self.observe(timedelta(days=200), 100),
+        ])
+        rows = prices.min_price_per_day("jfk", "ath", self.now - timedelta(days=90), self.now)
+        self.assertEqual([cents for _, cents in rows], [45000, 47000])
+        self.assertLess(rows[0][0], rows[1][0])
+
+    @override_settings(FLIGHTS_PRICE_RAW_RETENTION_DAYS=7, FLIGHTS_PRICE_DAILY_RETENTION_DAYS=60)
+    def test_downsampling_keeps_daily_minimum(self):
+        prices.record_observations([
+            self.observe(timedelta(days=10, hours=1), 50000),
+            self.observe(timedelta(days=10, hours=2), 45000),
+            self.observe(timedelta(days=1), 47000),
+            self.observe(timedelta(days=90), 100),
+        ])
+        before = prices.min_price_per_day("JFK", "ATH", self.now - timedelta(days=30), self.now)
+
+        # One window per run, oldest first; the 90 day old row is past daily retention too
+        downsample_price_observations.apply()
+        self.assertFalse(PriceObservation.objects.filter(price_cents=100).exists())
+        downsample_price_observations.apply()
+        self.assertEqual(
+            sorted(PriceObservation.objects.values_list("resolution", "price_cents")),
+            [(PriceObservation.RAW, 47000), (PriceObservation.DAILY, 45000)],
+        )
+        # Compacting keeps the daily series intact
+        self.assertEqual(prices.min_price_per_day("JFK", "ATH", self.now - timedelta(days=30), self.now), before)
+
+
+class ResponseArchiveTests(BaseTestCase):
+    params = {
+        "engine": "google_flights",
+        "departure_id": "JFK",
+        "arrival_id": "ATH",
+        "outbound_date": "2025-06-13",
+        "return_date": "2025-06-14",
+        "currency": "USD",
+        "hl": "en",
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        response_cache.clear()
+
+    def test_identical_bodies_are_stored_once(self):
+        archive = ResponseArchive(self.root)
+        body = serp_body({"best_flights": [{"price": 420}]})
+        archive.append("a", {**self.params, "api_key": "secret"}, body)
+        archive.append("b", self.params, serp_body({"best_flights": [{"price": 420}]}))
+        archive.append("a", self.params, serp_body({"best_flights": [{"price": 380}]}))
+
+        entries = list(archive.entries())
+        self.assertEqual([entry["key"] for entry in entries], ["a", "b", "a"])
+        self.assertNotIn("api_key", entries[0]["params"])
+        self.assertEqual(entries[0]["offset"], entries[1]["offset"])
+        self.assertEqual(len(archive.segments()), 1)
+        self.assertEqual(read_body(entries[2]["segment"], entries[2]["offset"], entries[2]["length"]),
+                         {"best_flights": [{"price": 380}]})
+        # Stored as received, not re-encoded
+        self.assertEqual(read_body(entries[0]["segment"], entries[0]["offset"], entries[0]["length"],
+                                   decode=lambda raw: raw), body)
+
+    def test_failed_archive_write_does_not_fail_enrichment(self):
+        flights = [
+            Flight.objects.create(
+                flight_id=f"unarchived-{origin}",
+                travel_class="Economy",
+                origin=origin,
+                destination="ATH",
+                departure_time=timezone.now() + timedelta(days=10),
+                arrival_time=timezone.now() + timedelta(days=10, hours=9),
+                flight_numbers=["MS986"],
+                last_seen=timezone.now(),
+            )
+            for origin in ("JFK", "BOS")
+        ]
+        for flight in flights:
+            EnrichmentTask.objects.create(task_id=f"{flight.flight_id}-task", flight=flight)
+        # A file where the archive directory should be: every write raises OSError
+        blocked = os.path.join(self.root, "blocked")
+        open(blocked, "w").close()
+
+        body = serp_body({"best_flights": [{"price": 640}]})
+        with override_settings(FLIGHTS_ARCHIVE_DIR=blocked), \
+                patch("flights.archive.metrics.incr") as incr, \
+                patch("flights.serpapi.fetch_google_flights", return_value=body), \
+                patch("flights.engine.fetch_google_flights_async", return_value=body), \
+                self.assertLogs("flights.archive", "ERROR") as logs:
+            enrich_flight_task.apply(args=[flights[0].flight_id], task_id="unarchived-JFK-task")
+            enrich_flights_async.apply(args=[["unarchived-BOS-task"]])
+
+        for flight in flights:
+            flight.refresh_from_db()
+            self.assertEqual(flight.retail_price, Decimal("640"))
+            self.assertEqual(EnrichmentTask.objects.get(flight=flight).status, "SUCCESS")
+        self.assertEqual([c.args for c in incr.call_args_list if c.args[0] == "archive_errors"], [("archive_errors",)] * 2)
+        self.assertEqual(len(logs.records), 2)
+
+    def test_reextract_backfills_prices_without_fetching(self):
+        flight = Flight.objects.create(
+            flight_id="archived-flight",
+            travel_class="Economy",
+            origin="JFK",
+            destination="ATH",
+            departure_time=timezone.make_aware(datetime(2025, 6, 13, 12, 55)),
+            arrival_time=timezone.make_aware(datetime(2025, 6, 14, 12, 10)),
+            flight_numbers=["MS986"],
+            last_seen=timezone.now(),
+        )
+        with override_settings(FLIGHTS_ARCHIVE_DIR=self.root):
+            with patch("flights.serpapi.fetch_google_flights", return_value=serp_body({"best_flights": [{"price": 512}]})):
+                search_google_flights(dict(self.params))
+            other = ResponseArchive(self.root)
+            other.append("other-search", self.params, serp_body({"best_flights": [{"price": 1}]}))
+
+            out = StringIO()
+            with patch("flights.serpapi.fetch_google_flights", side_effect=AssertionError("no API calls")):
+                call_command("reextract", workers=2, chunk_size=1, stdout=out)
+
+        flight.refresh_from_db()
+        self.assertEqual(flight.retail_price, Decimal("512.00"))
+        self.assertTrue(flight.enriched)
+        self.assertIsNotNone(flight.enriched_at)
+        self.assertIn("updated 1 flights", out.getvalue())
+
+
+    def test_reextract_writes_one_batch_at_a_time(self):
+        start = timezone.make_aware(datetime(2025, 6, 13, 12, 55))
+        with override_settings(FLIGHTS_ARCHIVE_DIR=self.root):
+            for day in range(3):
+                for n in range(2):
+                    flight = Flight.objects.create(
+                        flight_id=f"batched-{day}-{n}",
+                        travel_class="Economy",
+                        origin="JFK",
+                        destination="ATH",
+                        departure_time=start + timedelta(days=day, minutes=n),
+                        arrival_time=start + timedelta(days=day, hours=5),
+                        flight_numbers=[f"MS{n}"],
+                        last_seen=timezone.now(),
+                    )
+                params = build_search_params(flight)
+                response_archive.append(search_key(params), params, serp_body({"best_flights": [{"price": 100 + day}]}))
+
+            writes = []
+            bulk_update = QuerySet.bulk_update
+
+            def record(queryset, objs, *args, **kwargs):
+                writes.append(sorted(flight.flight_id for flight in objs))
+                return bulk_update(queryset, objs, *args, **kwargs)
+
+            with patch.object(QuerySet, "bulk_update", autospec=True, side_effect=record):
+                call_command("reextract", workers=1, batch_size=2, strategy="first", stdout=StringIO())
+
+        # Written search by search as the scan goes, not all at the end
+        self.assertEqual(writes, [[f"batched-{day}-0", f"batched-{day}-1"] for day in range(3)])
+        self.assertEqual(
+            dict(Flight.objects.filter(flight_id__startswith="batched-").values_list("flight_id", "retail_price")),
+            {f"batched-{day}-{n}": Decimal(100 + day) for day in range(3) for n in range(2)},
+        )
+
+
+class ItineraryMatchingTests(BaseTestCase):
+    response = {
+        "best_flights": [
+            {"price": 900, "flights": [{"flight_number": "MS 986", "departure_airport": {"time": "2025-06-13 12:55"}},
+                                       {"flight_number": "MS 747", "departure_airport": {"time": "2025-06-14 10:05"}}]},
+            {"price": 760, "flights": [{"flight_number": "MS 986", "departure_airport": {"time": "2025-06-13 12:55"}},
+                                       {"flight_number": "MS 747", "departure_airport": {"time": "2025-06-15 10:05"}}]},
+        ],
+        "other_flights": [
+            {"price": 610, "flights": [{"flight_number": "TK 12", "departure_airport": {"time": "2025-06-13 23:30"}},
+                                       {"flight_number": "TK 1843", "departure_airport": {"time": "2025-06-14 17:00"}}]},
+            {"price": 1200, "flights": [{"flight_number": "A3 411", "departure_airport": {"time": "2025-06-13 18:00"}}]},
+        ],
+    }
+
+    def make_flight(self, flight_id, flight_numbers, departures):
+        flight = Flight.objects.create(
+            flight_id=flight_id,
+            travel_class="Economy",
+            origin="JFK",
+            destination="ATH",
+            departure_time=timezone.make_aware(datetime(2025, 6, 13, 12, 55)),
+            arrival_time=timezone.make_aware(datetime(2025, 6, 14, 20, 10)),
+            flight_numbers=flight_numbers,
+            last_seen=timezone.now(),
+        )
+        FlightLeg.objects.bulk_create(
+            FlightLeg(
+                flight=flight,
+                position=position,
+                origin="",
+                destination="",
+                departure_time=timezone.make_aware(datetime.fromisoformat(departure)),
+                arrival_time=timezone.make_aware(datetime.fromisoformat(departure)),
+                flight_number=number,
+                aircraft_type="",
+                cabin_type="Economy",
+                duration=0,
+                layover_time=0.0,
+                distance=0,
+            )
+            for position, (number, departure) in enumerate(zip(flight_numbers, departures))
+        )
+        return flight
+
+    def test_lookup_by_flight_numbers_and_departures(self):
+        index = ItineraryIndex(self.response)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.lookup(["MS986", "MS747"], ["2025-06-13T12:55:00", "2025-06-15T10:05:00"]), 760)
+        # Without usable leg times the first itinerary with those numbers wins
+        self.assertEqual(index.lookup(["MS986", "MS747"]), 900)
+        self.assertEqual(index.lookup(["tk12", "TK1843"], ["2025-06-13T23:30:00", "2025-06-14T17:00:00"]), 610)
+
+    def test_fallbacks(self):
+        index = ItineraryIndex(self.response)
+        wanted = (["TK12", "TK99"], ["2025-06-13T23:30:00", "2025-06-14T09:00:00"])
+        self.assertIsNone(index.lookup(*wanted))
+        self.assertEqual(index.lookup(*wanted, fallback="first"), 900)
+        self.assertEqual(index.lookup(*wanted, fallback="min"), 610)
+        self.assertEqual(index.lookup(*wanted, fallback="nearest"), 610)
+        # No shared flight numbers: the closest first departure
+        self.assertEqual(index.lookup(["BA1"], ["2025-06-13T19:00:00"], fallback="nearest"), 1200)
+        with self.assertRaises(ValueError):
+            index.lookup(["BA1"], fallback="closest")
+
+    @override_settings(FLIGHTS_PRICE_STRATEGY="match", FLIGHTS_PRICE_FALLBACK="none")
+    def test_one_search_prices_every_flight_on_it(self):
+        egyptair = self.make_flight("egyptair", ["MS986", "MS747"], ["2025-06-13T12:55:00", "2025-06-15T10:05:00"])
+        turkish = self.make_flight("turkish", ["TK12", "TK1843"], ["2025-06-13T23:30:00", "2025-06-14T17:00:00"])
+        unknown = self.make_flight("unknown", ["LH401"], ["2025-06-13T16:00:00"])
+        EnrichmentTask.objects.create(task_id="egyptair-task", flight=egyptair)
+        response_cache.clear()
+
+        with patch("flights.serpapi.fetch_google_flights", return_value=serp_body(self.response)) as fetch:
+            result = enrich_flight_task.apply(args=["egyptair"], task_id="egyptair-task").get()
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(result, {"retail_price": 760.0})
+
+        prices = dict(Flight.objects.values_list("flight_id", "retail_price"))
+        self.assertEqual(prices, {"egyptair": Decimal("760.00"), "turkish": Decimal("610.00"), "unknown": None})
+        self.assertTrue(Flight.objects.get(pk=unknown.pk).enriched)
+
+        # Turkish's own task finds it priced since it was queued and skips the search
+        EnrichmentTask.objects.create(task_id="turkish-task", flight=turkish)
+        headers = {"enqueued_at": time.time() - 60}
+        with patch("flights.tasks.search_google_flights") as search:
+            result = enrich_flight_task.apply(args=["turkish"], task_id="turkish-task", headers=headers).get()
+        search.assert_not_called()
+        self.assertEqual(result, {"retail_price": 610.0})
+        self.assertEqual(EnrichmentTask.objects.get(task_id="turkish-task").status, "SUCCESS")
+
+
+class DashboardTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        start = timezone.make_aware(datetime(2025, 6, 13, 8, 0))
+        for i in range(5):
+            flight = Flight.objects.create(
+                flight_id=f"dash-{i}",
+                travel_class="Economy",
+                origin="JFK" if i % 2 else "CAI",
+                destination="ATH",
+                departure_time=start + timedelta(hours=i),
+                arrival_time=start + timedelta(hours=i + 10),
+                flight_numbers=[f"MS{i}"],
+                enriched=i < 2,
+                last_seen=timezone.now(),
+            )
+            EnrichmentTask.objects.create(
+                task_id=f"dash-task-{i}", flight=flight, status="SUCCESS", completed_at=start + timedelta(minutes=i),
+            )
+
+    def get(self, view, **params):
+        response = view.as_view()(RequestFactory().get("/", params))
+        if not response.streaming:
+            response.render()
+        return response
+
+    def flight_ids(self, response):
+        return [flight.flight_id for flight in response.context_data["flights"]]
+
+    @override_settings(FLIGHTS_DASHBOARD_PAGE_SIZE=2)
+    def test_flight_pages_follow_the_cursor(self):
+        seen = []
+        params = {}
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get(FlightListView, **params)
+            self.assertEqual(len(queries), 1)
+            seen += self.flight_ids(response)
+            if response.context_data["next_cursor"] is None:
+                break
+            params = {"after": response.context_data["next_cursor"]}
+        self.assertEqual(seen, [f"dash-{i}" for i in range(5)])
+
+    def test_flight_filters(self):
+        response = self.get(FlightListView, origin="jfk", enriched="false")
+        self.assertEqual(self.flight_ids(response), ["dash-3"])
+        response = self.get(FlightListView, departure_after="2025-06-13T10:00:00", departure_before="2025-06-13T12:00:00")
+        self.assertEqual(self.flight_ids(response), ["dash-2", "dash-3"])
+        with self.assertRaises(BadRequest):
+            self.get(FlightListView, after="yesterday")
+        with self.assertRaises(BadRequest):
+            self.get(FlightListView, departure_after="soon")
+
+    @override_settings(FLIGHTS_DASHBOARD_STREAM_CHUNK=2)
+    def test_streamed_page_matches_rendered_page(self):
+        rendered = self.get(FlightListView, limit=4).content.decode()
+        streamed = self.get(FlightListView, limit=4, stream="1")
+        self.assertTrue(streamed.streaming)
+        body = b"".join(streamed.streaming_content).decode()
+        rows = lambda html: [line.strip() for line in html.splitlines() if line.strip().startswith("<td>")]
+        self.assertEqual(len(rows(body)), 4 * 8)
+        self.assertEqual(rows(body), rows(rendered))
+        self.assertIn("Next page", body)
+
+    def test_exactly_full_last_page_has_no_next_link(self):
+        response = self.get(FlightListView, limit=5)
+        self.assertEqual(len(self.flight_ids(response)), 5)
+        self.assertIsNone(response.context_data["next_cursor"])
+        self.assertNotIn("Next page", response.content.decode())
+        streamed = b"".join(self.get(FlightListView, limit=5, stream="1").streaming_content).decode()
+        self.assertNotIn("Next page", streamed)
+
+    def test_task_list_pages_newest_first_without_per_row_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(TaskListView, limit=4)
+        # The page, then every flight id on it at once
+        self.assertEqual(len(queries), 2)
+        self.assertEqual([task.task_id for task in response.context_data["tasks"]], [f"dash-task-{i}" for i in (4, 3, 2, 1)])
+        self.assertIn("dash-4", response.content.decode())
+
+        response = self.get(TaskListView, limit=4, after=response.context_data["next_cursor"])
+        self.assertEqual([task.task_id for task in response.context_data["tasks"]], ["dash-task-0"])
+        self.assertIsNone(response.context_data["next_cursor"])
+
+
+class FlightLegTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        start = timezone.make_aware(datetime(2025, 6, 13, 12, 55))
+        for i, (first, aircraft) in enumerate((("MS986", "Boeing 777"), ("MS988", "Airbus A330"))):
+            flight = Flight.objects.create(
+                flight_id=f"leg-{i}",
+                travel_class="Business",
+                origin="JFK",
+                destination="ATH",
+                departure_time=start + timedelta(days=i),
+                arrival_time=start + timedelta(days=i, hours=23),
+                flight_numbers=[first, "MS747"],
+                last_seen=timezone.now(),
+            )
+            legs.replace_legs({flight.pk: [
+                FlightLeg(position=0, origin="JFK", destination="CAI", departure_time=flight.departure_time,
+                          arrival_time=flight.departure_time + timedelta(hours=17), flight_number=first,
+                          aircraft_type=aircraft, cabin_type="Business", duration=620, layover_time=235.0, distance=5614),
+                FlightLeg(position=1, origin="CAI", destination="ATH", departure_time=flight.arrival_time - timedelta(hours=2),
+                          arrival_time=flight.arrival_time, flight_number="MS747",
+                          aircraft_type="Boeing 737", cabin_type="Business", duration=120, layover_time=0.0, distance=688),
+            ]})
+
+    def plans(self, queries):
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                yield " ".join(row[-1] for row in cursor.fetchall())
+
+    def test_leg_queries_are_served_by_leg_indexes(self):
+        day = timezone.make_aware(datetime(2025, 6, 13))
+        with CaptureQueriesContext(connection) as queries:
+            route = legs.find_legs("jfk", "cai", start=day, end=day + timedelta(days=1))
+            numbers = legs.find_legs(flight_number="ms747")
+            aircraft = legs.find_legs(aircraft_type="Airbus A330")
+            arrivals = legs.find_legs(destination="ATH", start=day + timedelta(days=1))
+        self.assertEqual([leg["flight__flight_id"] for leg in route], ["leg-0"])
+        self.assertEqual([(leg["flight__flight_id"], leg["position"]) for leg in numbers], [("leg-0", 1), ("leg-1", 1)])
+        self.assertEqual([leg["flight_number"] for leg in aircraft], ["MS988"])
+        self.assertEqual([leg["flight__flight_id"] for leg in arrivals], ["leg-0", "leg-1"])
+        indexes = ["leg_route_departure_idx", "leg_flight_number_idx", "leg_aircraft_idx", "leg_destination_departure_idx"]
+        for plan, index in zip(self.plans(queries), indexes):
+            self.assertIn(f"USING INDEX {index}", plan)
+
+        with self.assertRaises(ValueError):
+            legs.find_legs(start=day)
+
+    def test_flights_through_an_airport_are_listed_once_without_legs(self):
+        with CaptureQueriesContext(connection) as queries:
+            flights = legs.flights_through("cai", limit=10)
+        self.assertEqual([flight["flight_id"] for flight in flights], ["leg-0", "leg-1"])
+        self.assertEqual(set(flights[0]), set(legs.FLIGHT_HEADER_COLUMNS))
+        plan, = self.plans(queries)
+        self.assertIn("leg_route_departure_idx", plan)
+        self.assertIn("leg_destination_departure_idx", plan)
+        self.assertEqual(legs.flights_through("LHR"), [])
+
+    def test_replace_legs_swaps_a_flights_rows(self):
+        flight = Flight.objects.get(flight_id="leg-1")
+        leg = FlightLeg.objects.filter(flight=flight, position=0).get()
+        leg.pk, leg.aircraft_type = None, "Boeing 787"
+        with self.assertNumQueries(2):
+            legs.replace_legs({flight.pk: [leg]})
+        self.assertEqual(list(flight.flight_legs.values_list("aircraft_type", flat=True)), ["Boeing 787"])
+        self.assertEqual(FlightLeg.objects.filter(flight__flight_id="leg-0").count(), 2)
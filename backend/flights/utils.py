@@ -1,4 +1,11 @@
-from typing import Dict, Any, Optional
+from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+# How extract_price picks the price out of a search response
+PRICE_STRATEGIES = ("first", "min", "match")
+# What a match does when no itinerary flies our exact flight numbers
+PRICE_FALLBACKS = ("none", "first", "min", "nearest")
+
 
 def extract_retail_price(data: Dict[str, Any]) -> Optional[float]:
     """Extract retail price from API response with validation."""
@@ -14,3 +21,150 @@ def extract_retail_price(data: Dict[str, Any]) -> Optional[float]:
         return float(price)
     except (TypeError, ValueError) as e:
         raise ValueError(f"Failed to extract retail price: {str(e)}")
+
+
+def iter_itineraries(data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Every itinerary in the response, best_flights first, without copying the lists."""
+    for name in ("best_flights", "other_flights"):
+        yield from data.get(name) or ()
+
+
+def normalize_flight_number(number: str) -> str:
+    # SerpAPI writes "MS 986" where we store "MS986"
+    return "".join(str(number).split()).upper()
+
+
+def normalize_departure(value: Any) -> str:
+    # SerpAPI writes "2025-06-13 12:55", our legs "2025-06-13T12:55:00"; compare to the minute
+    return str(value).replace(" ", "T")[:16]
+
+
+def itinerary_flight_numbers(itinerary: Dict[str, Any]) -> Tuple[str, ...]:
+    return tuple(normalize_flight_number(leg.get("flight_number", "")) for leg in itinerary.get("flights") or ())
+
+
+def itinerary_departures(itinerary: Dict[str, Any]) -> Tuple[str, ...]:
+    return tuple(
+        normalize_departure((leg.get("departure_airport") or {}).get("time", ""))
+        for leg in itinerary.get("flights") or ()
+    )
+
+
+def _itinerary_price(itinerary: Dict[str, Any]) -> Optional[float]:
+    price = itinerary.get("price")
+    return None if price is None else float(price)
+
+
+def _minutes(departure: str) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(departure).timestamp() / 60
+    except ValueError:
+        return None
+
+
+class ItineraryIndex:
+    """
+    Hash index over every priced itinerary of one search response.
+
+    Built once per response, it prices any number of our flights with a
+    dict lookup each: first on flight numbers plus departure times, then on
+    flight numbers alone for flights without usable leg times. Itineraries
+    earlier in the response win ties, so ``best_flights`` come first.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self._exact: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], float] = {}
+        self._by_numbers: Dict[Tuple[str, ...], float] = {}
+        self._priced: List[Tuple[Tuple[str, ...], Optional[float], float]] = []
+        try:
+            for itinerary in iter_itineraries(data):
+                price = _itinerary_price(itinerary)
+                if price is None:
+                    continue
+                numbers, departures = itinerary_flight_numbers(itinerary), itinerary_departures(itinerary)
+                self._exact.setdefault((numbers, departures), price)
+                self._by_numbers.setdefault(numbers, price)
+                self._priced.append((numbers, _minutes(departures[0]) if departures else None, price))
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ValueError(f"Failed to extract retail price: {str(e)}")
+
+    def __len__(self) -> int:
+        return len(self._priced)
+
+    def lookup(
+        self,
+        flight_numbers: Iterable[str],
+        departure_times: Iterable[Any] = (),
+        fallback: str = "none",
+    ) -> Optional[float]:
+        """
+        Price of the itinerary flying exactly ``flight_numbers`` (and leaving at
+        ``departure_times`` when given), else the ``fallback``:
+
+            none: no price
+            first: the first priced itinerary
+            min: the lowest price in the response
+            nearest: the itinerary sharing the most flight numbers, then with
+                the closest first departure
+        """
+        numbers = tuple(normalize_flight_number(number) for number in flight_numbers)
+        departures = tuple(normalize_departure(time) for time in departure_times)
+        if departures:
+            price = self._exact.get((numbers, departures))
+            if price is not None:
+                return price
+        price = self._by_numbers.get(numbers)
+        if price is not None or not self._priced:
+            return price
+
+        if fallback == "none":
+            return None
+        if fallback == "first":
+            return self._priced[0][2]
+        if fallback == "min":
+            return min(price for _, _, price in self._priced)
+        if fallback == "nearest":
+            wanted = set(numbers)
+            departure = _minutes(departures[0]) if departures else None
+
+            def distance(candidate):
+                candidate_numbers, candidate_departure, _ = candidate
+                gap = 0.0
+                if departure is not None and candidate_departure is not None:
+                    gap = abs(candidate_departure - departure)
+                return (-len(wanted.intersection(candidate_numbers)), gap)
+
+            return min(self._priced, key=distance)[2]
+        raise ValueError(f"Unknown price fallback {fallback!r}")
+
+
+def extract_price(
+    data: Dict[str, Any],
+    strategy: str = "first",
+    flight_numbers: Optional[Iterable[str]] = None,
+    departure_times: Iterable[Any] = (),
+    fallback: str = "none",
+) -> Optional[float]:
+    """
+    Extract a price from a search response.
+
+    Strategies:
+        first: the first of ``best_flights``, as ``extract_retail_price``
+        min: the lowest price across ``best_flights`` and ``other_flights``
+        match: the itinerary flying exactly ``flight_numbers``, see
+            ``ItineraryIndex.lookup``; build the index yourself to price many
+            flights from one response
+
+    Returns None when the strategy finds no priced itinerary.
+    """
+    if strategy == "first":
+        return extract_retail_price(data)
+    if strategy == "match":
+        return ItineraryIndex(data).lookup(flight_numbers or (), departure_times, fallback)
+    if strategy == "min":
+        try:
+            prices = (_itinerary_price(itinerary) for itinerary in iter_itineraries(data))
+            return min((price for price in prices if price is not None), default=None)
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ValueError(f"Failed to extract retail price: {str(e)}")
+    raise ValueError(f"Unknown price strategy {strategy!r}")
@@ -1,17 +1,202 @@
 from django.shortcuts import render
 
 # Create your views here.
+from datetime import datetime, time
+from typing import Any, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.db.models import Prefetch, Q
+from django.http import StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.views.generic import ListView
 from .models import EnrichmentTask, Flight
 
-class TaskListView(ListView):
+# Splits a streamed page around its rows
+ROWS_MARKER = "<!-- rows -->"
+
+
+class KeysetListView(ListView):
+    """
+    A list page read with a keyset on ``(keyset_field, id)`` instead of OFFSET.
+
+    ``?after=`` takes the cursor of the previous page's last row, so every
+    page is one index range scan no matter how deep it is. ``?limit=`` sets
+    the page size, up to ``FLIGHTS_DASHBOARD_MAX_PAGE_SIZE``; ``?stream=1``
+    sends the page as it is read instead of building it in memory.
+    """
+    keyset_field = ""
+    descending = False
+    default_page_size = 100
+    row_template_name = ""
+
+    def get_default_page_size(self) -> int:
+        return self.default_page_size
+
+    def get_limit(self) -> int:
+        try:
+            limit = int(self.request.GET.get("limit", self.get_default_page_size()))
+        except ValueError:
+            raise BadRequest("limit must be an integer")
+        return max(1, min(limit, settings.FLIGHTS_DASHBOARD_MAX_PAGE_SIZE))
+
+    def cursor(self, row) -> str:
+        return f"{getattr(row, self.keyset_field).isoformat()},{row.pk}"
+
+    def parse_cursor(self) -> Optional[Tuple[datetime, int]]:
+        value = self.request.GET.get("after")
+        if not value:
+            return None
+        moment, _, pk = value.rpartition(",")
+        moment = parse_datetime(moment)
+        if moment is None or not pk.isdigit():
+            raise BadRequest("after must be a cursor from a previous page")
+        return moment, int(pk)
+
+    def filter_queryset(self, queryset):
+        return queryset
+
+    def get_queryset(self):
+        field = self.keyset_field
+        queryset = self.filter_queryset(super().get_queryset())
+        after = self.parse_cursor()
+        if after is not None:
+            moment, pk = after
+            op = "lt" if self.descending else "gt"
+            queryset = queryset.filter(Q(**{f"{field}__{op}": moment}) | Q(**{field: moment, "pk__gt": pk}))
+        # Ties go by ascending id either way, the order SQLite keeps in every index
+        return queryset.order_by(("-" if self.descending else "") + field, "pk")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["query"] = self.querystring()
+        return context
+
+    def querystring(self) -> str:
+        params = self.request.GET.copy()
+        params.pop("after", None)
+        return params.urlencode()
+
+    def _page(self) -> Iterator[Any]:
+        limit = self.get_limit()
+        self.has_next = False
+        # One extra row tells whether there is a next page
+        rows = self.get_queryset()[:limit + 1].iterator(chunk_size=settings.FLIGHTS_DASHBOARD_STREAM_CHUNK)
+        for count, row in enumerate(rows):
+            if count == limit:
+                self.has_next = True
+                return
+            yield row
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get("stream") in ("1", "true"):
+            return StreamingHttpResponse(self.stream())
+        self.object_list = rows = list(self._page())
+        context = self.get_context_data(object_list=rows)
+        context["next_cursor"] = self._next_cursor(rows[-1] if rows else None)
+        return self.render_to_response(context)
+
+    def _next_cursor(self, last_row: Optional[Any]) -> Optional[str]:
+        # Set by _page once it has read the row past the limit
+        if not self.has_next:
+            return None
+        return self.cursor(last_row)
+
+    def stream(self) -> Iterator[str]:
+        self.object_list = []
+        context = self.get_context_data(object_list=[])
+        context["streaming"] = True
+        head, _, _ = render_to_string(self.get_template_names(), context, self.request).partition(ROWS_MARKER)
+        yield head
+
+        # Only the last row is kept, for the cursor; the rest go out with their chunk
+        last_row = None
+        chunk: List[Any] = []
+        for last_row in self._page():
+            chunk.append(last_row)
+            if len(chunk) == settings.FLIGHTS_DASHBOARD_STREAM_CHUNK:
+                yield render_to_string(self.row_template_name, {self.context_object_name: chunk})
+                chunk = []
+        if chunk:
+            yield render_to_string(self.row_template_name, {self.context_object_name: chunk})
+
+        context["next_cursor"] = self._next_cursor(last_row)
+        _, _, tail = render_to_string(self.get_template_names(), context, self.request).partition(ROWS_MARKER)
+        yield tail
+
+
+class TaskListView(KeysetListView):
     model = EnrichmentTask
     template_name = 'flights/task_list.html'
+    row_template_name = 'flights/task_rows.html'
     context_object_name = 'tasks'
-    queryset = EnrichmentTask.objects.filter(status__in=['SUCCESS', 'FAILURE']).order_by('-completed_at')[:3]
+    # Newest completions first, over task_finished_idx. The page's flight ids
+    # come from one more query: joining them in makes SQLite sort every
+    # finished task before applying the limit.
+    queryset = (
+        EnrichmentTask.objects.filter(status__in=['SUCCESS', 'FAILURE'])
+        .only('task_id', 'status', 'completed_at', 'flight')
+        .prefetch_related(Prefetch('flight', queryset=Flight.objects.only('flight_id')))
+    )
+    keyset_field = 'completed_at'
+    descending = True
+    default_page_size = 3
 
-class FlightListView(ListView):
+
+class FlightListView(KeysetListView):
+    """
+    Flights by departure, filtered by ``origin``, ``destination``, ``enriched``
+    and a ``departure_after``/``departure_before`` window.
+
+    Each filter combination is served by an index: the route index, the
+    partial enriched/unenriched indexes, or the departure index.
+    """
     model = Flight
     template_name = 'flights/flight_list.html'
+    row_template_name = 'flights/flight_rows.html'
     context_object_name = 'flights'
-    # Only show key columns - you can filter in template
+    # Only the columns the page shows, never the legs/flight_numbers JSON
+    queryset = Flight.objects.only(
+        'flight_id', 'origin', 'destination', 'departure_time', 'arrival_time',
+        'travel_class', 'retail_price', 'enriched',
+    )
+    keyset_field = 'departure_time'
+
+    def get_default_page_size(self) -> int:
+        return settings.FLIGHTS_DASHBOARD_PAGE_SIZE
+
+    def filter_queryset(self, queryset):
+        params = self.request.GET
+        if params.get("origin"):
+            queryset = queryset.filter(origin=params["origin"].upper())
+        if params.get("destination"):
+            queryset = queryset.filter(destination=params["destination"].upper())
+        if params.get("enriched") in ("true", "false"):
+            queryset = queryset.filter(enriched=params["enriched"] == "true")
+        if params.get("departure_after"):
+            queryset = queryset.filter(departure_time__gte=self._moment(params["departure_after"]))
+        if params.get("departure_before"):
+            queryset = queryset.filter(departure_time__lt=self._moment(params["departure_before"]))
+        return queryset
+
+    @staticmethod
+    def _moment(value: str) -> datetime:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise BadRequest(f"{value!r} is not a date or datetime")
+            moment = datetime.combine(day, time.min)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["filters"] = {
+            name: self.request.GET.get(name, "")
+            for name in ("origin", "destination", "enriched", "departure_after", "departure_before")
+        }
+        return context